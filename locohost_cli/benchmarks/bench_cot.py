@@ -0,0 +1,193 @@
+"""Benchmark of locohost's CoT operations on journals of increasing size.
+
+Builds a synthetic journal of each ``--sizes`` entry count in each
+``--formats`` format, then times create, update, search and compress on it.
+Compression is only timed for the formats compress_cot reads (md, jsonl).
+Compression talks to a local fake Messages API (see ``fake_anthropic``), so
+the numbers measure locohost itself rather than the network. Every case runs
+in its own interpreter so its peak RSS is its own.
+
+    python -m locohost_cli.benchmarks.bench_cot --sizes 100 1000 10000 --output cot.json
+
+For each operation the report has throughput, p50/p99 latency, files scanned
+and bytes read per call (from the metrics counters), and the process's peak
+RSS once the operation has run.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from locohost_cli.benchmarks.fake_anthropic import serve
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+WORDS = ("cache index journal snapshot latency request retry parser schema commit branch deploy "
+         "handler worker queue token budget buffer migration config service client timeout").split()
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def build_journal(context_dir, format, entries, seed=0):
+    # Writes the files _create_cot/_update_cot would have written, without
+    # paying for entries one call at a time, then builds the indexes
+    from locohost_cli.locohost import _cot_file_name, _rebuild_cot_index, _rebuild_search_index
+
+    rng = random.Random(seed)
+    os.makedirs(context_dir, exist_ok=True)
+    for number in range(1, entries + 1):
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(1700000000 + number * 60))
+        updates = [(created, _text(rng, 30)) for _ in range(rng.randint(0, 2))]
+        if format == 'md':
+            content = f"# Chain of Thought Entry {number}\n\nCreated: {created}\n\nProject: bench\n\n## Entry\n\n"
+            content += _text(rng, 40)
+            content += "".join(f"\n\n## Update: {ts}\n\n{text}" for ts, text in updates)
+        elif format == 'jsonl':
+            lines = [{"type": "create", "entry_number": number, "created": created, "project": "bench",
+                      "content": _text(rng, 40)}]
+            lines += [{"type": "update", "timestamp": ts, "content": text} for ts, text in updates]
+            content = "".join(json.dumps(line) + "\n" for line in lines)
+        else:
+            data = {"entry_number": number, "created": created, "project": "bench", "content": _text(rng, 40)}
+            if updates:
+                data["updates"] = [{"timestamp": ts, "content": text} for ts, text in updates]
+            content = json.dumps(data, indent=2)
+        with open(os.path.join(context_dir, _cot_file_name(number, format)), "w") as f:
+            f.write(content)
+    _rebuild_cot_index(context_dir)
+    _rebuild_search_index(context_dir)
+
+
+def _op_counters(report, name):
+    # Counters of the operation and of its stages (compress_cot.read, ...)
+    totals = {"calls": 0, "files_scanned": 0, "bytes_read": 0}
+    for op, counters in report["operations"].items():
+        if op == name or op.startswith(name + "."):
+            for key in ("files_scanned", "bytes_read"):
+                totals[key] += counters.get(key, 0)
+            if op == name:
+                totals["calls"] = counters["calls"]
+    return totals
+
+
+def _time_op(name, func, calls, metric=None):
+    from locohost_cli import metrics
+
+    metrics.reset()
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        func(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    counters = _op_counters(metrics.report(), metric or name)
+    per_call = max(calls, 1)
+    return {
+        "calls": calls,
+        "ops_per_s": round(calls / (sum(samples) / 1000), 2) if sum(samples) else None,
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(_percentile(samples, 99), 3),
+        "files_scanned_per_op": round(counters["files_scanned"] / per_call, 1),
+        "bytes_read_per_op": round(counters["bytes_read"] / per_call),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_case(format, entries, ops, compress_ops):
+    from locohost_cli import search
+    from locohost_cli.locohost import COMPRESSIBLE_FORMATS, _compress_cot, _create_cot, _update_cot
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as project_dir:
+        subprocess.run(["git", "init", "-q"], cwd=project_dir, check=True)
+        context_dir = os.path.join(project_dir, ".context")
+        start = time.perf_counter()
+        build_journal(context_dir, format, entries)
+        result = {"entries": entries, "format": format, "build_s": round(time.perf_counter() - start, 3),
+                  "baseline_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+        result["create"] = _time_op("create_cot", lambda i: _create_cot(
+            "bench", _text(rng, 40), format=format, context_dir=context_dir), ops)
+        result["update"] = _time_op("update_cot", lambda i: _update_cot(
+            "bench", _text(rng, 30), format=format, context_dir=context_dir), ops)
+        result["search"] = _time_op("search_cot", lambda i: search.search(
+            context_dir, rng.choice(WORDS) + " " + rng.choice(WORDS)), ops)
+        if format not in COMPRESSIBLE_FORMATS:
+            # compress_cot never reads these entries, so it would only time
+            # an empty run
+            return result
+        # The first compression folds in the whole journal; later ones only
+        # the update appended just before them
+        result["compress_initial"] = _time_op("compress_cot", lambda i: _compress_cot(
+            "bench", context_dir=context_dir, use_cache=False), 1)
+        result["compress_incremental"] = _time_op("compress_cot", lambda i: (
+            _update_cot("bench", _text(rng, 30), format=format, context_dir=context_dir),
+            _compress_cot("bench", context_dir=context_dir, use_cache=False)), compress_ops)
+    return result
+
+
+def run(sizes, formats, ops, compress_ops, latency, response_bytes):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env.setdefault("ANTHROPIC_API_KEY", "bench")
+    cases = {}
+    with serve(latency, response_bytes) as server:
+        env["ANTHROPIC_BASE_URL"] = server.url
+        for format in formats:
+            for entries in sizes:
+                requests = len(server.requests)
+                argv = [sys.executable, "-m", "locohost_cli.benchmarks.bench_cot", "--case", f"{format}:{entries}",
+                        "--ops", str(ops), "--compress-ops", str(compress_ops)]
+                output = subprocess.run(argv, env=env, check=True, capture_output=True, text=True).stdout
+                case = json.loads(output)
+                case["api_requests"] = len(server.requests) - requests
+                cases[f"{format}:{entries}"] = case
+    return {
+        "python": sys.version.split()[0],
+        "server": {"latency_s": latency, "response_bytes": response_bytes},
+        "cases": cases,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CoT operations on synthetic journals")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 1000, 10000, 100000],
+                        help="Journal sizes in entries")
+    parser.add_argument("--formats", nargs="+", default=["md", "jsonl"], help="CoT formats to build journals in")
+    parser.add_argument("--ops", type=int, default=100, help="Calls per create, update and search")
+    parser.add_argument("--compress-ops", type=int, default=5, help="Incremental compressions per case")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake API delay per request in seconds")
+    parser.add_argument("--response-bytes", type=int, default=4000, help="Fake API response size")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Write results as JSON to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("locohost_cli").setLevel(logging.ERROR)
+    if args.case:
+        format, entries = args.case.split(":")
+        print(json.dumps(run_case(format, int(entries), args.ops, args.compress_ops)))
+        return
+
+    report = json.dumps(run(args.sizes, args.formats, args.ops, args.compress_ops, args.latency,
+                            args.response_bytes), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
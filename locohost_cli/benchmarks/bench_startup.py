@@ -0,0 +1,110 @@
+"""Cold-start benchmark for the locohost CLI.
+
+Starts a fresh interpreter for every subcommand (plus ``--help`` and a bare
+import) and records the wall time of importing the CLI and parsing that
+subcommand's arguments, so changes that add import-time work show up as a
+regression. The command itself is not run: ``_dispatch`` is stubbed out and
+the daemon is disabled, so no API calls, git commands or writes happen.
+
+    python -m locohost_cli.benchmarks.bench_startup --repeat 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main() up to, but not including, the command
+PARSE_ONLY = ("import sys\n"
+              "from locohost_cli import locohost\n"
+              "locohost._dispatch = lambda args: 0\n"
+              "sys.exit(locohost.main(sys.argv[1:]))\n")
+
+
+def _subcommand_argv():
+    from locohost_cli.locohost import _build_parser
+
+    parser = _build_parser()
+    subparsers = next(a for a in parser._actions if isinstance(a, argparse._SubParsersAction))
+    commands = {}
+    for name, subparser in subparsers.choices.items():
+        argv = [name]
+        for action in subparser._actions:
+            if not action.required or not action.option_strings:
+                continue
+            value = action.choices[0] if action.choices else "bench"
+            argv += [action.option_strings[0], str(value)]
+        commands[name] = argv
+    return commands
+
+
+def _time_run(argv, cwd, env):
+    start = time.perf_counter()
+    subprocess.run(argv, cwd=cwd, env=env, check=False,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def _import_time_us(env, cwd):
+    # -X importtime reports the cumulative import cost of every module; the
+    # entry for locohost_cli.locohost includes everything it pulls in.
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import locohost_cli.locohost"],
+                            cwd=cwd, env=env, capture_output=True, text=True)
+    for line in result.stderr.splitlines():
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == "locohost_cli.locohost":
+            return int(parts[1])
+    return None
+
+
+def run(repeat=5):
+    from locohost_cli.daemon import DISABLE_ENV
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env[DISABLE_ENV] = "1"
+    cases = {"import": [sys.executable, "-c", "import locohost_cli.locohost"],
+             "--help": [sys.executable, "-c", PARSE_ONLY, "--help"]}
+    for name, argv in _subcommand_argv().items():
+        cases[name] = [sys.executable, "-c", PARSE_ONLY] + argv
+
+    results = {}
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, argv in cases.items():
+            samples = [_time_run(argv, cwd, env) for _ in range(repeat)]
+            results[name] = {
+                "median_ms": round(statistics.median(samples), 2),
+                "min_ms": round(min(samples), 2),
+                "max_ms": round(max(samples), 2),
+            }
+        import_us = _import_time_us(env, cwd)
+
+    return {
+        "python": sys.version.split()[0],
+        "repeat": repeat,
+        "import_cumulative_us": import_us,
+        "commands": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure locohost cold-start time per subcommand")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per subcommand")
+    parser.add_argument("--output", help="Write results as JSON to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = json.dumps(run(args.repeat), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Update latency benchmark for the json and jsonl CoT formats.
+
+Appends ``--updates`` updates to a single entry in each format and records
+per-update latency. The json format rewrites the whole entry on every
+update, so its latency grows with the entry; jsonl should stay flat.
+
+    python -m locohost_cli.benchmarks.bench_update --updates 10000 --output update.json
+"""
+import argparse
+import json
+import logging
+import statistics
+import tempfile
+import time
+
+from locohost_cli.locohost import _create_cot, _update_cot
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_format(format, updates, payload):
+    with tempfile.TemporaryDirectory() as context_dir:
+        _create_cot("bench", payload, format=format, context_dir=context_dir)
+        samples = []
+        for _ in range(updates):
+            start = time.perf_counter()
+            _update_cot("bench", payload, format=format, context_dir=context_dir)
+            samples.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "updates": updates,
+        "total_s": round(sum(samples) / 1000, 3),
+        "p50_ms": round(statistics.median(samples), 4),
+        "p99_ms": round(_percentile(samples, 99), 4),
+        "last_100_mean_ms": round(statistics.mean(samples[-100:]), 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare CoT update latency for json and jsonl")
+    parser.add_argument("--updates", type=int, default=10000, help="Updates to append per format")
+    parser.add_argument("--payload-bytes", type=int, default=200, help="Size of each update's content")
+    parser.add_argument("--formats", nargs="+", default=["json", "jsonl"], help="Formats to compare")
+    parser.add_argument("--output", help="Write results as JSON to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("locohost_cli").setLevel(logging.WARNING)
+    payload = "x" * args.payload_bytes
+    report = json.dumps({fmt: bench_format(fmt, args.updates, payload) for fmt in args.formats}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Local stand-in for the Anthropic Messages API.
+
+Serves ``POST /v1/messages`` (plain and streamed) from a background thread
+with a configurable delay before the first byte and a configurable response
+size, so benchmarks and tests can drive the real client without the
+network. Point the SDK at it with ``ANTHROPIC_BASE_URL``. Every request body
+is kept in ``server.requests`` for inspection.
+
+    python -m locohost_cli.benchmarks.fake_anthropic --port 8765 --latency 0.2
+
+Compression prompts (those asking for ``[COMPRESSED_CONTENT]``) get a
+well-formed compression response; everything else gets filler text.
+
+Prompt caching is modelled on the real API: the request up to each content
+block marked with ``cache_control`` is a cache entry, and the reported usage
+splits input tokens into cache reads, cache writes and uncached input.
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _prompt_text(body):
+    parts = []
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get("text", "") for block in content or [] if isinstance(block, dict))
+    return "\n".join(parts)
+
+
+def _blocks(body):
+    # The request's text blocks in the order the API caches them
+    system = body.get("system")
+    blocks = [{"text": system}] if isinstance(system, str) else list(system or [])
+    for message in body.get("messages", []):
+        content = message.get("content")
+        blocks.extend([{"text": content}] if isinstance(content, str) else
+                      [block for block in content or [] if isinstance(block, dict)])
+    return blocks
+
+
+def _response_text(body, response_bytes):
+    filler = ("Synthetic response text. " * (response_bytes // 25 + 1))[:response_bytes]
+    prompt = _prompt_text(body)
+    if "[COMPRESSED_CONTENT]" in prompt:
+        text = f"[COMPRESSED_CONTENT]\n{filler}\n[/COMPRESSED_CONTENT]\n[COMMIT_MESSAGE]\nCompress CoT\n[/COMMIT_MESSAGE]"
+    else:
+        text = filler
+    messages = body.get("messages", [])
+    if messages and messages[-1].get("role") == "assistant":
+        # Continue after a prefilled assistant turn
+        prefix = messages[-1]["content"] if isinstance(messages[-1]["content"], str) else ""
+        text = text[len(prefix):] if text.startswith(prefix) else text
+    return text
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        with server.lock:
+            server.requests.append(body)
+        if not self.path.rstrip("/").endswith("/v1/messages"):
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            return
+
+        time.sleep(server.latency)
+        text = _response_text(body, server.response_bytes)
+        usage = server.usage(body, text)
+        message = {
+            "id": f"msg_fake_{len(server.requests)}", "type": "message", "role": "assistant",
+            "model": body.get("model", "fake"), "stop_reason": "end_turn", "stop_sequence": None,
+            "content": [{"type": "text", "text": text}], "usage": usage,
+        }
+        if body.get("stream"):
+            self._send_stream(message, text)
+        else:
+            self._send_json(200, message)
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, message, text):
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(name, data):
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+            self.wfile.flush()
+
+        start = dict(message, content=[], stop_reason=None, usage=dict(message["usage"], output_tokens=0))
+        event("message_start", {"type": "message_start", "message": start})
+        event("content_block_start", {"type": "content_block_start", "index": 0,
+                                      "content_block": {"type": "text", "text": ""}})
+        for i in range(0, len(text), 64):
+            event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": text[i:i + 64]}})
+        event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                "usage": {"output_tokens": message["usage"]["output_tokens"]}})
+        event("message_stop", {"type": "message_stop"})
+
+
+class FakeAnthropicServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, response_bytes=2000):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.response_bytes = response_bytes
+        self.requests = []
+        self.lock = threading.Lock()
+        self.prompt_cache = set()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def usage(self, body, text):
+        digest = hashlib.sha256(body.get("model", "").encode())
+        total, read, written = 0, 0, 0
+        for block in _blocks(body):
+            total += len(block.get("text", "")) // 4
+            digest.update(json.dumps(block.get("text", "")).encode())
+            if block.get("cache_control"):
+                with self.lock:
+                    if digest.hexdigest() in self.prompt_cache:
+                        read, written = total, 0
+                    else:
+                        self.prompt_cache.add(digest.hexdigest())
+                        written = total - read
+        return {"input_tokens": total - read - written, "output_tokens": len(text) // 4,
+                "cache_creation_input_tokens": written, "cache_read_input_tokens": read}
+
+
+@contextmanager
+def serve(latency=0.0, response_bytes=2000, port=0):
+    server = FakeAnthropicServer(("127.0.0.1", port), latency, response_bytes)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake Anthropic Messages API")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before responding")
+    parser.add_argument("--response-bytes", type=int, default=2000, help="Size of each response's text")
+    args = parser.parse_args(argv)
+
+    with serve(args.latency, args.response_bytes, args.port) as server:
+        print(f"Serving on {server.url}; export ANTHROPIC_BASE_URL={server.url}", flush=True)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
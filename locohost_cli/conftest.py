@@ -0,0 +1,20 @@
+from types import SimpleNamespace
+
+import pytest
+
+from locohost_cli.fakes import FakeMessages
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    from locohost_cli import locohost
+    client = SimpleNamespace(messages=FakeMessages())
+    monkeypatch.setattr(locohost, "_client", client)
+    return client
+
+
+@pytest.fixture(autouse=True)
+def _no_daemon(monkeypatch):
+    # A developer's running daemon must not serve the commands tests run
+    from locohost_cli import daemon
+    monkeypatch.setenv(daemon.DISABLE_ENV, "1")
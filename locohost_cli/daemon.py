@@ -0,0 +1,214 @@
+import io
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+
+logger = logging.getLogger(__name__)
+
+# ========================
+# Daemon
+# ========================
+
+# `locohost daemon start` keeps one interpreter alive behind a Unix socket:
+# the SDK stays imported, the Anthropic client keeps its pooled connections,
+# and per-thread handles such as the search index connection stay open.
+# main() forwards the short journal commands to the daemon when one is
+# listening and runs them in-process when none is, so the daemon is purely
+# opt-in; everything else always runs in-process.
+#
+# The protocol is one JSON line each way: {"argv": [...], "cwd": "...",
+# "env": {...}} in, {"exit": 0, "stdout": "...", "stderr": "..."} out.
+# {"command": "status"} and {"command": "stop"} control the daemon itself.
+# Requests are served one at a time, because commands resolve .context from
+# the working directory; each runs with the client's LOCOHOST_* variables in
+# place of the daemon's. A client waits at most REPLY_TIMEOUT for its reply.
+SOCKET_ENV = 'LOCOHOST_SOCKET'
+DISABLE_ENV = 'LOCOHOST_NO_DAEMON'
+CONNECT_TIMEOUT = 1.0
+REPLY_TIMEOUT = 30.0
+ENV_PREFIX = 'LOCOHOST_'
+START_TIMEOUT = 10.0
+
+
+def socket_path():
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    directory = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(directory, f'locohost-{os.getuid()}.sock')
+
+
+def _connect(path):
+    # Returns a connected socket, or None when no daemon is listening
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    sock.settimeout(REPLY_TIMEOUT)
+    return sock
+
+
+def _exchange(sock, request):
+    with sock:
+        sock.sendall(json.dumps(request).encode('utf-8') + b"\n")
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("the locohost daemon closed the connection without replying")
+    return json.loads(line)
+
+
+def call(argv, cwd=None, path=None):
+    # Runs a command in the daemon and returns its reply, or None when no
+    # daemon is listening. Once the request is sent it is not retried: the
+    # command may already have run.
+    sock = _connect(path or socket_path())
+    if sock is None:
+        return None
+    env = {name: value for name, value in os.environ.items() if name.startswith(ENV_PREFIX)}
+    return _exchange(sock, {"argv": list(argv), "cwd": cwd or os.getcwd(), "env": env})
+
+
+def forward(argv, cwd=None):
+    # Thin-client side of main(): the exit code, or None to run in-process
+    if os.environ.get(DISABLE_ENV) or not hasattr(socket, 'AF_UNIX'):
+        return None
+    try:
+        reply = call(argv, cwd)
+    except (OSError, ValueError) as e:
+        logger.error("Error talking to the locohost daemon: %s", e)
+        return 1
+    if reply is None:
+        return None
+    if reply.get("stdout"):
+        print(reply["stdout"], end="", flush=True)
+    if reply.get("stderr"):
+        print(reply["stderr"], end="", file=sys.stderr, flush=True)
+    return reply.get("exit", 1)
+
+
+def control(command, path=None):
+    sock = _connect(path or socket_path())
+    if sock is None:
+        return None
+    return _exchange(sock, {"command": command})
+
+
+def _replace_env(env):
+    # Swaps the LOCOHOST_* variables for `env`'s
+    for name in [name for name in os.environ if name.startswith(ENV_PREFIX)]:
+        del os.environ[name]
+    os.environ.update(env)
+
+
+class _Server:
+    def __init__(self, path, run):
+        import socketserver
+
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                try:
+                    reply = server.execute(json.loads(line))
+                except ValueError as e:
+                    reply = {"exit": 2, "stdout": "", "stderr": f"Malformed request: {e}\n"}
+                self.wfile.write(json.dumps(reply).encode('utf-8') + b"\n")
+
+        self.path = path
+        self.run = run
+        self.started = time.time()
+        self.served = 0
+        previous = os.umask(0o077)
+        try:
+            self.socket_server = socketserver.UnixStreamServer(path, Handler)
+        finally:
+            os.umask(previous)
+
+    def execute(self, request):
+        command = request.get("command")
+        if command == "status":
+            return {"exit": 0, "pid": os.getpid(), "socket": self.path, "served": self.served,
+                    "uptime_s": round(time.time() - self.started, 1)}
+        if command == "stop":
+            threading.Thread(target=self.socket_server.shutdown, daemon=True).start()
+            return {"exit": 0, "pid": os.getpid()}
+
+        out, err = io.StringIO(), io.StringIO()
+        previous = os.getcwd()
+        daemon_env = {name: value for name, value in os.environ.items() if name.startswith(ENV_PREFIX)}
+        try:
+            os.chdir(request["cwd"])
+            _replace_env(request.get("env", {}))
+            with redirect_stdout(out), redirect_stderr(err):
+                code = self.run(request["argv"], err)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception:
+            traceback.print_exc(file=err)
+            code = 1
+        finally:
+            os.chdir(previous)
+            _replace_env(daemon_env)
+        self.served += 1
+        return {"exit": code or 0, "stdout": out.getvalue(), "stderr": err.getvalue()}
+
+
+def serve(run, path=None):
+    # run(argv, log_stream) executes one command and returns its exit code.
+    # Returns False when another daemon already owns the socket.
+    import signal
+
+    path = path or socket_path()
+    if os.path.exists(path):
+        if control("status", path) is not None:
+            logger.error("A locohost daemon is already listening on %s", path)
+            return False
+        logger.info("Removing stale socket %s", path)
+        os.unlink(path)
+
+    server = _Server(path, run)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.socket_server.shutdown,
+                                                                   daemon=True).start())
+    logger.info("locohost daemon %s listening on %s", os.getpid(), path)
+    try:
+        server.socket_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.socket_server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+        logger.info("locohost daemon %s stopped after %s requests", os.getpid(), server.served)
+    return True
+
+
+def spawn(argv, path=None):
+    # Starts `argv` (a foreground daemon) in its own session with output in
+    # <socket>.log, and waits until it answers
+    import subprocess
+
+    path = path or socket_path()
+    with open(path + '.log', 'ab') as log:
+        process = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True)
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        status = control("status", path)
+        if status is not None:
+            return status
+        if process.poll() is not None:
+            break
+        time.sleep(0.05)
+    return None
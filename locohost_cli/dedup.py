@@ -0,0 +1,176 @@
+import json
+import logging
+import re
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# ========================
+# Duplicate Updates
+# ========================
+
+# Agents that call _update_cot in a loop write the same status line or stack
+# trace over and over. Before a compression prompt is built, update blocks
+# whose text matches another update (exactly, or after timestamps, hex ids
+# and whitespace are normalized away) or nearly matches it (Jaccard
+# similarity of word 3-shingles at or above NEAR_DUPLICATE_THRESHOLD, with
+# numbers ignored) are collapsed into one. The most recent occurrence is the
+# one kept, in its own place, so a status that changed ("3 passed" then "8
+# passed") reaches the snapshot with its latest values; it is annotated with
+# how often it was recorded before.
+#
+# Near duplicates are found with one-permutation MinHash and LSH banding:
+# every block is hashed once per shingle, blocks sharing a band become
+# candidates, and candidates are confirmed with the exact Jaccard similarity.
+# At most MAX_CANDIDATES are compared per block, so the pass stays linear in
+# the size of the journal.
+NEAR_DUPLICATE_THRESHOLD = 0.8
+SIGNATURE_BINS = 16
+BAND_ROWS = 2
+SHINGLE_WORDS = 3
+MAX_CANDIDATES = 8
+
+_MD_UPDATE_SPLIT_RE = re.compile(r'(?=\n\n## Update: )')
+_MD_UPDATE_RE = re.compile(r'^\n\n## Update: ([^\n]*)\n\n(.*)$', re.DOTALL)
+# Values that differ between otherwise identical updates without carrying
+# meaning. Plain numbers (counts, durations) are not among them.
+_VOLATILE_RE = re.compile(r'\b\d{4}-\d{2}-\d{2}(?:[ t]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?z?\b'
+                          r'|\b\d{2}:\d{2}:\d{2}(?:\.\d+)?\b'
+                          r'|\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b'
+                          r'|\b0x[0-9a-f]+\b'
+                          r'|\b(?=[0-9a-f]*[a-f])(?=[0-9a-f]*\d)[0-9a-f]{7,}\b')
+_NUMBER_RE = re.compile(r'\b[0-9a-f]*\d[0-9a-f]*\b')
+_EMPTY = -1
+
+
+class _Block:
+    __slots__ = ("text", "label", "body", "format", "record", "shingles", "duplicate_of", "repeats", "near",
+                 "latest")
+
+    def __init__(self, text, label=None, body=None, format=None, record=None):
+        self.text = text
+        self.label = label
+        self.body = body
+        self.format = format
+        self.record = record
+        self.shingles = None
+        self.duplicate_of = None
+        self.repeats = 0
+        self.near = False
+        self.latest = None
+
+
+def _split_blocks(chunk):
+    # md chunks split at "## Update:" headings; jsonl chunks are one record per line
+    if chunk.lstrip().startswith("{"):
+        blocks = []
+        for line in chunk.splitlines(keepends=True):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict) and record.get("type") == "update" and isinstance(record.get("content"), str):
+                blocks.append(_Block(line, record.get("timestamp"), record["content"], "jsonl", record))
+            else:
+                blocks.append(_Block(line))
+        return blocks
+
+    blocks = []
+    for piece in _MD_UPDATE_SPLIT_RE.split(chunk):
+        match = _MD_UPDATE_RE.match(piece)
+        if match:
+            blocks.append(_Block(piece, match.group(1), match.group(2), "md"))
+        elif piece:
+            blocks.append(_Block(piece))
+    return blocks
+
+
+def _normalize(text):
+    return " ".join(_VOLATILE_RE.sub("0", text.lower()).split())
+
+
+def _shingles(normalized):
+    words = _NUMBER_RE.sub("0", normalized).split()
+    if len(words) < SHINGLE_WORDS:
+        return set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def _signature(shingles):
+    signature = [_EMPTY] * SIGNATURE_BINS
+    for shingle in shingles:
+        h = zlib.crc32(shingle.encode('utf-8'))
+        slot, value = h % SIGNATURE_BINS, h // SIGNATURE_BINS
+        if signature[slot] == _EMPTY or value < signature[slot]:
+            signature[slot] = value
+    return signature
+
+
+def _bands(signature):
+    for start in range(0, SIGNATURE_BINS, BAND_ROWS):
+        band = tuple(signature[start:start + BAND_ROWS])
+        if any(value != _EMPTY for value in band):
+            yield (start, band)
+
+
+def _render(block):
+    # Each group of duplicates is rendered once, as its latest occurrence
+    original = block.duplicate_of or block
+    if original.repeats == 0:
+        return block.text
+    if original.latest is not block:
+        return ""
+    note = (f"Recorded {original.repeats} earlier time{'s' if original.repeats > 1 else ''}"
+            f"{' with minor differences' if original.near else ''}, first at {original.label}")
+    if block.format == "jsonl":
+        return json.dumps({**block.record, "repeated": note}) + "\n"
+    trailing = block.text[len(block.text.rstrip()):]
+    return f"{block.text.rstrip()}\n\n({note}){trailing}"
+
+
+def collapse_duplicates(chunks, threshold=NEAR_DUPLICATE_THRESHOLD):
+    # Returns the chunks with duplicate updates removed and the number of
+    # update blocks dropped
+    split = [_split_blocks(chunk) for chunk in chunks]
+    exact = {}
+    buckets = {}
+    dropped = 0
+
+    for blocks in split:
+        for block in blocks:
+            if block.body is None:
+                continue
+            normalized = _normalize(block.body)
+            original = exact.get(normalized)
+            if original is None:
+                shingles = _shingles(normalized)
+                candidates = []
+                bands = list(_bands(_signature(shingles))) if shingles else []
+                for band in bands:
+                    for candidate in buckets.get(band, ()):
+                        if candidate not in candidates:
+                            candidates.append(candidate)
+                        if len(candidates) >= MAX_CANDIDATES:
+                            break
+                    if len(candidates) >= MAX_CANDIDATES:
+                        break
+                for candidate in candidates:
+                    if len(shingles & candidate.shingles) >= threshold * len(shingles | candidate.shingles):
+                        original = candidate
+                        break
+                if original is None:
+                    exact[normalized] = block
+                    block.shingles = shingles
+                    for band in bands:
+                        buckets.setdefault(band, []).append(block)
+                    continue
+
+            block.duplicate_of = original
+            original.repeats += 1
+            # Only a similarity match differs in more than timestamps and ids
+            original.near = original.near or exact.get(normalized) is not original
+            original.latest = block
+            dropped += 1
+
+    collapsed = ["".join(_render(block) for block in blocks) for blocks in split]
+    return [chunk for chunk in collapsed if chunk.strip()], dropped
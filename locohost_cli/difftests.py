@@ -0,0 +1,247 @@
+import ast
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass, field
+
+from .schemas import section_marker
+
+# ========================
+# Diff Parsing
+# ========================
+
+# generate_tests_for_diff works hunk by hunk: the diff is parsed into files
+# and hunks, hunks are grouped by the module they change, and each group's
+# hunks go out in one request whose response has one marked section per
+# hunk. Generated tests are cached per hunk, keyed by the hunk's lines and
+# section heading but not its line numbers, so a rebased or re-run diff only
+# sends the hunks whose content changed.
+_HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$')
+_TEST_PATH_RE = re.compile(r'(^|/)(tests?/|test_[^/]*$|[^/]*_test\.\w+$|[^/]*\.(test|spec)\.\w+$)')
+_GO_PACKAGE_RE = re.compile(r'^package \w+\s*$')
+_GO_IMPORT_RE = re.compile(r'^import\s*(.*)$')
+_JS_IMPORT_END_RE = re.compile(r'''(?:^import\s*['"][^'"]+['"]|\bfrom\s*['"][^'"]+['"])\s*;?\s*$''')
+_JS_NAMED_IMPORT_RE = re.compile(r'''^import\s*\{([^}]*)\}\s*from\s*(['"][^'"]+['"])\s*;?$''')
+
+FRAMEWORKS = {".py": "pytest", ".go": "Go testing package", ".ts": "Jest", ".tsx": "Jest", ".js": "Jest"}
+
+
+@dataclass
+class Hunk:
+    path: str
+    old_start: int
+    new_start: int
+    heading: str
+    lines: list = field(default_factory=list)
+
+    def key(self, model):
+        payload = json.dumps([model, self.path, self.heading, self.lines], separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def text(self):
+        return f"@@ {self.heading}\n" + "\n".join(self.lines)
+
+
+def _strip_prefix(path):
+    path = path.split("\t", 1)[0].strip()
+    if path == "/dev/null":
+        return None
+    return path[2:] if path[:2] in ("a/", "b/") else path
+
+
+def parse_unified_diff(text):
+    # Returns {path: [Hunk]} for every file the diff adds or modifies
+    files = {}
+    path = None
+    hunk = None
+    old_left = new_left = 0
+    for line in text.splitlines():
+        if hunk is not None and (old_left > 0 or new_left > 0):
+            if line.startswith("\\"):
+                continue
+            tag = line[:1] or " "
+            if tag not in " +-":
+                hunk = None
+            else:
+                hunk.lines.append(line if line else " ")
+                old_left -= tag in " -"
+                new_left -= tag in " +"
+                continue
+        if line.startswith("diff --git "):
+            path = None
+        elif line.startswith("+++ "):
+            path = _strip_prefix(line[4:])
+        elif line.startswith("@@") and path is not None:
+            match = _HUNK_HEADER_RE.match(line)
+            if match:
+                old_start, old_count, new_start, new_count, heading = match.groups()
+                hunk = Hunk(path, int(old_start), int(new_start), heading.strip())
+                old_left = int(old_count) if old_count is not None else 1
+                new_left = int(new_count) if new_count is not None else 1
+                files.setdefault(path, []).append(hunk)
+    return files
+
+
+def is_test_path(path):
+    return bool(_TEST_PATH_RE.search(path))
+
+
+def group_by_module(files):
+    # Source files only; changes to tests do not need generated tests
+    return {path: hunks for path, hunks in sorted(files.items())
+            if not is_test_path(path) and any(line[:1] == "+" for hunk in hunks for line in hunk.lines)}
+
+
+def module_name(path):
+    stem, ext = os.path.splitext(path)
+    return stem.replace("/", ".") if ext == ".py" else path
+
+
+def generated_test_path(path):
+    directory, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    if ext == ".go":
+        name = f"{stem}_test.go"
+    elif ext in (".ts", ".tsx", ".js"):
+        name = f"{stem}.test{ext}"
+    else:
+        name = f"test_{stem}{ext}"
+    return os.path.join(directory, name)
+
+
+def batch_hunks(hunks, budget, estimate):
+    # Greedy token-budgeted batches; a hunk is never split
+    batches, current, used = [], [], 0
+    for hunk in hunks:
+        tokens = estimate(hunk.text())
+        if current and used + tokens > budget:
+            batches.append(current)
+            current, used = [], 0
+        current.append(hunk)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+SECTION_PREFIX = "TESTS"
+
+
+def tests_prompt(path, hunks, keys):
+    framework = FRAMEWORKS.get(os.path.splitext(path)[1], "unit")
+    sections = "\n\n".join(f"[HUNK {section_marker(SECTION_PREFIX, key)}]\n{hunk.text()}\n[/HUNK]"
+                           for hunk, key in zip(hunks, keys))
+    example = section_marker(SECTION_PREFIX, keys[0])
+    return f"""Human: The following hunks change {path} (module {module_name(path)}).
+Write {framework} tests that exercise the behaviour each hunk adds or changes. Cover edge cases and
+error paths introduced by the change; do not test unchanged behaviour.
+
+For each hunk, put its tests between the hunk's markers, for example [{example}]...[/{example}].
+Every section must be self-contained test code for the same test file, with its imports at the top
+of the section on single lines. Do not add explanations outside the sections.
+
+{sections}
+
+Assistant: """
+
+
+def _python_imports(section):
+    # Top-level import statements, whole (including parenthesized ones), and
+    # the rest of the section. A section that does not parse is left alone.
+    try:
+        tree = ast.parse(section)
+    except SyntaxError:
+        return [], section.splitlines()
+    lines = section.splitlines()
+    taken = set()
+    imports = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(ast.unparse(node))
+            taken.update(range(node.lineno - 1, node.end_lineno))
+    return imports, [line for i, line in enumerate(lines) if i not in taken]
+
+
+def _go_imports(section):
+    # The package clause and each import spec, from single imports and from
+    # parenthesized import blocks
+    specs, body = [], []
+    lines = iter(section.splitlines())
+    for line in lines:
+        match = _GO_IMPORT_RE.match(line)
+        if _GO_PACKAGE_RE.match(line):
+            specs.append(line.strip())
+        elif match and match.group(1).startswith("("):
+            rest = match.group(1)[1:]
+            while ")" not in rest:
+                if rest.strip():
+                    specs.append(rest.strip())
+                rest = next(lines, ")")
+            if rest.split(")", 1)[0].strip():
+                specs.append(rest.split(")", 1)[0].strip())
+        elif match:
+            specs.append(match.group(1).strip())
+        else:
+            body.append(line)
+    return specs, body
+
+
+def _js_imports(section):
+    # import statements, which may span lines up to their "from '...'"
+    imports, body, current = [], [], None
+    for line in section.splitlines():
+        if current is not None or line.startswith("import "):
+            current = line if current is None else current + "\n" + line
+            if _JS_IMPORT_END_RE.search(line):
+                imports.append(current)
+                current = None
+        else:
+            body.append(line)
+    if current is not None:
+        body.extend(current.splitlines())
+    return imports, body
+
+
+def _merge_js_imports(statements):
+    # Named imports from one module become one statement, so no name is
+    # imported twice; anything else is kept once per distinct statement
+    merged, named = [], {}
+    for statement in statements:
+        statement = " ".join(statement.split())
+        match = _JS_NAMED_IMPORT_RE.match(statement)
+        if match:
+            names = named.get(match.group(2))
+            if names is None:
+                names = named[match.group(2)] = []
+                merged.append(match.group(2))
+            names.extend(name for name in (n.strip() for n in match.group(1).split(",")) if name and name not in names)
+        elif statement not in merged:
+            merged.append(statement)
+    return [f"import {{ {', '.join(named[item])} }} from {item};" if item in named else item for item in merged]
+
+
+def assemble_test_file(path, sections):
+    # Concatenates per-hunk sections into one file with one import header:
+    # each section's imports are parsed out whole and merged without repeats
+    ext = os.path.splitext(path)[1]
+    split = _python_imports if ext == ".py" else _go_imports if ext == ".go" else _js_imports
+    imports, body = [], []
+    for section in sections:
+        found, rest = split(section.strip("\n"))
+        imports.extend(statement for statement in found if statement not in imports)
+        body.append("\n".join(rest).strip("\n"))
+        body.append("")
+
+    if ext == ".go":
+        packages = [spec for spec in imports if spec.startswith("package ")]
+        specs = [spec for spec in imports if not spec.startswith("package ")]
+        hoisted = packages[:1] + (["", "import ("] + [f"\t{spec}" for spec in specs] + [")"] if specs else [])
+    elif ext == ".py":
+        hoisted = sorted(imports, key=lambda statement: not statement.startswith("from __future__"))
+    else:
+        hoisted = _merge_js_imports(imports)
+    header = f"# Generated by locohost generate_tests_for_diff for {path}\n" if ext == ".py" else \
+        f"// Generated by locohost generate_tests_for_diff for {path}\n"
+    content = "\n".join(hoisted) + "\n\n" + "\n".join(body).strip("\n") + "\n"
+    return header + content
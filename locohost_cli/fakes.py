@@ -0,0 +1,71 @@
+# Test helpers shared by the test modules. Fixtures built on them live in
+# conftest.py; this module is imported like any other.
+import threading
+from types import SimpleNamespace
+
+
+def prompt_text(content):
+    # Compression prompts are sent as content blocks, other prompts as strings
+    return content if isinstance(content, str) else "".join(block["text"] for block in content)
+
+
+COMPRESSION_RESPONSE = ("[COMPRESSED_CONTENT]\nSnapshot so far\n[/COMPRESSED_CONTENT]\n"
+                        "[COMMIT_MESSAGE]\nCompress CoT\n[/COMMIT_MESSAGE]")
+
+
+class FakeMessages:
+    # Stands in for client.messages. Every prompt is recorded; the reply comes
+    # from `respond(prompt)` when a test sets one, otherwise compression
+    # prompts get `text` and anything else (batch summaries) a numbered
+    # summary.
+    def __init__(self, text=COMPRESSION_RESPONSE, respond=None):
+        self.text = text
+        self.respond = respond
+        self.fail_after = None
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def _record(self, messages):
+        prompt = prompt_text(messages[0]["content"])
+        with self.lock:
+            self.prompts.append(prompt)
+            return prompt, len(self.prompts)
+
+    def reply(self, prompt, number):
+        if self.respond is not None:
+            return self.respond(prompt)
+        return self.text if "[COMPRESSED_CONTENT]" in prompt else f"Summary #{number}"
+
+    def create(self, **kwargs):
+        text = self.reply(*self._record(kwargs["messages"]))
+        return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+    def stream(self, **kwargs):
+        return FakeStream(self, kwargs["messages"], self.reply(*self._record(kwargs["messages"])))
+
+
+class FakeStream:
+    def __init__(self, owner, messages, text):
+        self.owner = owner
+        self.messages = messages
+        self.text = text
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        text = self.text
+        if len(self.messages) > 1:
+            # Continue after the prefilled assistant turn
+            text = text[len(self.messages[1]["content"]):]
+        for n, i in enumerate(range(0, len(text), 5)):
+            if self.owner.fail_after is not None and n == self.owner.fail_after:
+                raise ConnectionError("stream dropped")
+            yield text[i:i + 5]
+
+    def get_final_message(self):
+        return SimpleNamespace(usage=None)
@@ -0,0 +1,172 @@
+import atexit
+import logging
+import os
+import subprocess
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ========================
+# Snapshot Commits
+# ========================
+
+# Snapshots are committed with git plumbing onto a dedicated ref instead of
+# the user's branch: blobs via hash-object, trees via mktree, the commit via
+# commit-tree and the ref via a compare-and-swap update-ref. Nothing reads or
+# writes the index, so the repository's index lock is never taken and
+# whatever the user has staged stays out of the commit. Objects are read back
+# through one long-lived `git cat-file --batch` process per repository.
+#
+#     git show refs/locohost/snapshots:.context/snapshot.md
+SNAPSHOT_REF = os.environ.get("LOCOHOST_SNAPSHOT_REF", "refs/locohost/snapshots")
+ZERO_SHA = "0" * 40
+UPDATE_ATTEMPTS = 3
+
+# Used only when git has no identity configured, so snapshot commits work in
+# fresh CI containers
+FALLBACK_IDENTITY = {
+    "GIT_AUTHOR_NAME": "locohost",
+    "GIT_AUTHOR_EMAIL": "locohost@localhost",
+    "GIT_COMMITTER_NAME": "locohost",
+    "GIT_COMMITTER_EMAIL": "locohost@localhost",
+}
+
+
+class GitError(RuntimeError):
+    pass
+
+
+def _git(cwd, *args, input=None, env=None):
+    result = subprocess.run(["git", *args], cwd=cwd, input=input, capture_output=True,
+                            env=None if env is None else {**os.environ, **env})
+    if result.returncode != 0:
+        raise GitError(f"git {args[0]} failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+class CatFile:
+    def __init__(self, repo):
+        self.repo = repo
+        self._lock = threading.Lock()
+        self._process = subprocess.Popen(["git", "cat-file", "--batch"], cwd=repo,
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def read(self, rev):
+        # Returns (sha, type, data), or None when rev does not name an object
+        with self._lock:
+            self._process.stdin.write(rev.encode() + b"\n")
+            self._process.stdin.flush()
+            header = self._process.stdout.readline().split()
+            if len(header) != 3:
+                return None
+            sha, object_type, size = header
+            data = self._process.stdout.read(int(size))
+            self._process.stdout.read(1)
+            return sha.decode(), object_type.decode(), data
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.stdin.close()
+            self._process.wait()
+
+
+_repos = {}
+_cat_files = {}
+_repos_lock = threading.Lock()
+
+
+def repo_root(path):
+    path = os.path.realpath(path)
+    with _repos_lock:
+        if path not in _repos:
+            _repos[path] = _git(path, "rev-parse", "--show-toplevel").decode().strip()
+        return _repos[path]
+
+
+def cat_file(repo):
+    with _repos_lock:
+        if repo not in _cat_files:
+            _cat_files[repo] = CatFile(repo)
+        return _cat_files[repo]
+
+
+@atexit.register
+def _close_cat_files():
+    for process in _cat_files.values():
+        process.close()
+    _cat_files.clear()
+
+
+def _parse_tree(data):
+    entries = {}
+    while data:
+        mode_name, rest = data.split(b"\0", 1)
+        mode, name = mode_name.split(b" ", 1)
+        entries[name.decode()] = (mode.decode(), rest[:20].hex())
+        data = rest[20:]
+    return entries
+
+
+_OBJECT_TYPES = {"40000": "tree", "160000": "commit"}
+
+
+def _write_tree(repo, reader, tree_sha, components, blobs):
+    entries = {}
+    if tree_sha:
+        entries = _parse_tree(reader.read(tree_sha)[2])
+    if components:
+        head = components[0]
+        entry = entries.get(head)
+        subtree = entry[1] if entry and entry[0] == "40000" else None
+        entries[head] = ("40000", _write_tree(repo, reader, subtree, components[1:], blobs))
+    else:
+        for name, sha in blobs.items():
+            entries[name] = ("100644", sha)
+    listing = "".join(f"{mode.zfill(6)} {_OBJECT_TYPES.get(mode, 'blob')} {sha}\t{name}\n"
+                      for name, (mode, sha) in sorted(entries.items()))
+    return _git(repo, "mktree", input=listing.encode()).decode().strip()
+
+
+def _commit_tree(repo, tree, parent, message):
+    args = ["commit-tree", tree, "-m", message] + (["-p", parent] if parent else [])
+    try:
+        return _git(repo, *args).decode().strip()
+    except GitError as e:
+        if "identity" not in str(e) and "ident" not in str(e):
+            raise
+        logger.warning("No git identity configured, committing the snapshot as %s",
+                       FALLBACK_IDENTITY["GIT_AUTHOR_NAME"])
+        return _git(repo, *args, env=FALLBACK_IDENTITY).decode().strip()
+
+
+def commit_files(directory, files, message, ref=SNAPSHOT_REF):
+    # Commits {name: bytes} at directory's path inside the repository onto ref.
+    # Returns the new commit, or None when the files are already committed.
+    repo = repo_root(directory)
+    components = [c for c in os.path.relpath(os.path.realpath(directory), repo).split(os.sep) if c != "."]
+    reader = cat_file(repo)
+
+    blobs = {name: _git(repo, "hash-object", "-w", "--stdin", input=data).decode().strip()
+             for name, data in files.items()}
+
+    for attempt in range(1, UPDATE_ATTEMPTS + 1):
+        parent = reader.read(ref)
+        parent_sha = parent[0] if parent else None
+        parent_tree = parent[2].split(b"\n", 1)[0].split()[1].decode() if parent else None
+
+        tree = _write_tree(repo, reader, parent_tree, components, blobs)
+        if tree == parent_tree:
+            logger.info("Snapshot unchanged, nothing to commit on %s", ref)
+            return None
+
+        commit = _commit_tree(repo, tree, parent_sha, message)
+        try:
+            # Compare-and-swap: fails if another process moved the ref meanwhile
+            _git(repo, "update-ref", "-m", "locohost: snapshot", ref, commit, parent_sha or ZERO_SHA)
+            logger.info("Committed snapshot %s on %s", commit[:12], ref)
+            return commit
+        except GitError as e:
+            if attempt == UPDATE_ATTEMPTS:
+                raise
+            logger.warning("%s moved while committing (%s), retrying", ref, e)
+
@@ -2,38 +2,347 @@ import argparse
 import logging
 import json
 import os
+import hashlib
+import re
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from anthropic import Anthropic
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 logger = logging.getLogger(__name__)
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# The Anthropic SDK is comparatively slow to import and most subcommands never
+# talk to the network, so the client is created on first use and then reused
+# for the rest of the process.
+_client = None
+
+def _get_client():
+    global _client
+    if _client is None:
+        from anthropic import Anthropic
+        _client = Anthropic()
+        logger.debug("Anthropic client initialized: %s", _client)
+    return _client
+
+# ========================
+# CoT Index
+# ========================
+
+# The index keeps the next entry number and the latest entry per format, so
+# allocating or locating an entry never has to scan the directory. Creating
+# an entry appends a line to the manifest recording its file, format and size,
+# and so does moving it into a pack; the last line for an entry wins. Updates
+# leave the manifest alone, so it grows with the number of entries rather
+# than the number of writes; a loose entry's current size is its file's.
+COT_INDEX_FILE = '.cot_index.json'
+COT_MANIFEST_FILE = '.cot_manifest.jsonl'
+_COT_FILE_RE = re.compile(r'^cot_(\d+)\.([A-Za-z0-9]+)$')
+
+def _atomic_write(path, content):
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+# Writers in different processes (agents, CI jobs) share one .context
+# directory, so every read-modify-write of the journal happens under an
+# exclusive advisory lock on .context/.lock. The lock is re-entrant within a
+# thread so helpers can take it without knowing whether a caller already has.
+COT_LOCK_FILE = '.lock'
+_lock_state = threading.local()
+
+@contextmanager
+def _cot_lock(context_dir):
+    held = getattr(_lock_state, 'held', None)
+    if held is None:
+        held = _lock_state.held = {}
+    key = os.path.realpath(context_dir)
+    if key in held:
+        held[key] += 1
+        try:
+            yield
+        finally:
+            held[key] -= 1
+        return
+
+    if fcntl is None:
+        logger.debug("fcntl is unavailable, CoT writes are not locked")
+        yield
+        return
+
+    fd = os.open(os.path.join(context_dir, COT_LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        held[key] = 1
+        try:
+            yield
+        finally:
+            del held[key]
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+def _cot_file_name(number, format):
+    return f'cot_{number:04d}.{format}'
+
+@metrics.timed("rebuild_cot_index")
+def _rebuild_cot_index(context_dir):
+    logger.debug("Rebuilding CoT index in: %s", context_dir)
+    entries = []
+    names = os.listdir(context_dir)
+    metrics.add("files_scanned", len(names))
+    for name in names:
+        match = _COT_FILE_RE.match(name)
+        if match:
+            size = os.path.getsize(os.path.join(context_dir, name))
+            entries.append({"entry": int(match.group(1)), "file": name, "format": match.group(2), "size": size})
+
+    # Packed entries (see pack.py) are listed in their segments' sidecars. A
+    # loose file left behind by an interrupted pack_cot holds the same bytes.
+    from . import pack
+    packed = pack.records(context_dir)
+    metrics.add("files_scanned", len(pack.segments(context_dir)))
+    packed_numbers = {record["entry"] for record in packed}
+    entries = [entry for entry in entries if entry["entry"] not in packed_numbers] + packed
+    entries.sort(key=lambda e: e["entry"])
+
+    index = {"next": 1, "latest": {}}
+    for entry in entries:
+        index["next"] = max(index["next"], entry["entry"] + 1)
+        index["latest"][entry["format"]] = entry["entry"]
+
+    _atomic_write(os.path.join(context_dir, COT_MANIFEST_FILE), "".join(json.dumps(e) + "\n" for e in entries))
+    _atomic_write(os.path.join(context_dir, COT_INDEX_FILE), json.dumps(index))
+    logger.info("Rebuilt CoT index with %s entries, next entry: %s", len(entries), index['next'])
+    return index
+
+def _load_cot_index(context_dir):
+    try:
+        with open(os.path.join(context_dir, COT_INDEX_FILE), 'r') as f:
+            index = json.load(f)
+        if isinstance(index.get("next"), int) and isinstance(index.get("latest"), dict):
+            return index
+        logger.warning("Malformed CoT index in %s, rebuilding", context_dir)
+    except FileNotFoundError:
+        logger.debug("No CoT index in %s, building one", context_dir)
+    except ValueError:
+        logger.warning("Unreadable CoT index in %s, rebuilding", context_dir)
+    return _rebuild_cot_index(context_dir)
+
+def _record_cot_entry(context_dir, index, number, format, size):
+    # Called once per new entry
+    record = {"entry": number, "file": _cot_file_name(number, format), "format": format, "size": size}
+    _append_line(os.path.join(context_dir, COT_MANIFEST_FILE), json.dumps(record))
+    index["next"] = max(index["next"], number + 1)
+    index["latest"][format] = max(index["latest"].get(format, 0), number)
+    _atomic_write(os.path.join(context_dir, COT_INDEX_FILE), json.dumps(index))
+
+def _read_cot_manifest(context_dir):
+    manifest_file = os.path.join(context_dir, COT_MANIFEST_FILE)
+    if not os.path.exists(manifest_file):
+        with _cot_lock(context_dir):
+            _rebuild_cot_index(context_dir)
+    entries = {}
+    with open(manifest_file, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                entries[record["entry"]] = record
+    return dict(sorted(entries.items()))
+
+def _cot_entry_exists(context_dir, record):
+    return "pack" in record or os.path.exists(os.path.join(context_dir, record["file"]))
+
+def _cot_entry_size(context_dir, record):
+    return record["size"] if "pack" in record else os.path.getsize(os.path.join(context_dir, record["file"]))
+
+def _read_cot_bytes(context_dir, record, offset=0):
+    # The entry's bytes from `offset` on, whether it is a loose cot_* file or packed
+    if "pack" in record:
+        from . import pack
+        return pack.read(context_dir, record)[offset:]
+    with open(os.path.join(context_dir, record["file"]), 'rb') as f:
+        f.seek(offset)
+        return f.read()
 
-# Initialize the Anthropic client once at the module level
-client = Anthropic()
-logger.debug(f"Anthropic client initialized: {client}")
+# ========================
+# JSON Lines Journal
+# ========================
+
+# A jsonl entry is one "create" record followed by one "update" record per
+# _update_cot call, so an update is a single append regardless of how long
+# the entry has grown. _read_cot_entry folds the records back into the same
+# shape a json entry has.
+
+def _append_line(path, line):
+    # One write() on an O_APPEND descriptor, so the record lands in one piece
+    data = (line + "\n").encode('utf-8')
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+def _read_cot_entry(cot_file):
+    with open(cot_file, 'r') as f:
+        return _parse_cot_entry(f.read(), 'json' if cot_file.endswith('.json') else 'jsonl')
+
+def _parse_cot_entry(text, format):
+    if format == 'json':
+        return json.loads(text)
+
+    entry = {}
+    updates = []
+    for line in text.split("\n"):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        record_type = record.pop("type", None)
+        if record_type == "create":
+            entry.update(record)
+        elif record_type == "update":
+            updates.append(record)
+    if updates:
+        entry["updates"] = updates
+    return entry
+
+@metrics.timed("migrate_cot_json")
+def _migrate_cot_json(context_dir):
+    with _cot_lock(context_dir):
+        return _migrate_cot_json_locked(context_dir)
+
+def _migrate_cot_json_locked(context_dir):
+    migrated = []
+    for number, record in _read_cot_manifest(context_dir).items():
+        if record["format"] != 'json' or "pack" in record:
+            # Packed entries are archived and never rewritten
+            continue
+        json_file = os.path.join(context_dir, record["file"])
+        if not os.path.exists(json_file):
+            continue
+        data = _read_cot_entry(json_file)
+        lines = [json.dumps({
+            "type": "create",
+            "entry_number": data.get("entry_number", number),
+            "created": data.get("created"),
+            "project": data.get("project"),
+            "content": data.get("content")
+        })]
+        for update in data.get("updates", []):
+            lines.append(json.dumps({"type": "update", **update}))
+        _atomic_write(os.path.join(context_dir, _cot_file_name(number, 'jsonl')), "\n".join(lines) + "\n")
+        os.remove(json_file)
+        migrated.append(number)
+        logger.debug("Migrated %s to jsonl", json_file)
+
+    _rebuild_cot_index(context_dir)
+    logger.info("Migrated %s JSON CoT entries to jsonl in %s", len(migrated), context_dir)
+    return migrated
+
+# ========================
+# Journal Search
+# ========================
+
+# Each block _create_cot or _update_cot writes is also added to the full-text
+# index in .context/.cot_search.db (see search.py). Indexing is best effort:
+# a failure is logged and never fails the journal write, and
+# rebuild_cot_index recreates the index from the files.
+_MD_HEADER_RE = re.compile(r'^# Chain of Thought Entry \d+\n\nCreated: (.*?)\n\nProject: (.*?)\n\n## Entry\n\n', re.DOTALL)
+_MD_UPDATE_RE = re.compile(r'\n\n## Update: (\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\n\n')
+
+def _cot_blocks(context_dir, number, record):
+    # Yields (entry, kind, created, project, content) for the entry and each update
+    text = _read_cot_bytes(context_dir, record).decode('utf-8', errors='replace')
+    if record["format"] == 'md':
+        header = _MD_HEADER_RE.match(text)
+        if not header:
+            yield (number, "create", None, None, text)
+            return
+        created, project = header.groups()
+        parts = _MD_UPDATE_RE.split(text[header.end():])
+        yield (number, "create", created, project, parts[0])
+        for timestamp, content in zip(parts[1::2], parts[2::2]):
+            yield (number, "update", timestamp, project, content)
+    elif record["format"] in ('json', 'jsonl'):
+        data = _parse_cot_entry(text, record["format"])
+        project = data.get("project")
+        yield (number, "create", data.get("created"), project, data.get("content"))
+        for update in data.get("updates", []):
+            yield (number, "update", update.get("timestamp"), project, update.get("content"))
+
+@metrics.timed("rebuild_search_index")
+def _rebuild_search_index(context_dir):
+    from . import search
+    manifest = _read_cot_manifest(context_dir)
+    metrics.add("files_scanned", len(manifest))
+    blocks = (block for number, record in manifest.items()
+              if _cot_entry_exists(context_dir, record)
+              for block in _cot_blocks(context_dir, number, record))
+    count = search.rebuild(context_dir, blocks)
+    logger.info("Rebuilt CoT search index with %s blocks from %s entries", count, len(manifest))
+    return count
+
+def _index_cot_block(context_dir, number, kind, created, project, content):
+    import sqlite3
+    from . import search
+    try:
+        if os.path.exists(search.db_path(context_dir)):
+            search.add_blocks(context_dir, [(number, kind, created, project, content)])
+        else:
+            # A journal that predates the index: index everything, this block included
+            _rebuild_search_index(context_dir)
+    except sqlite3.Error as e:
+        logger.warning("Could not update the CoT search index in %s: %s", context_dir, e)
 
 # ========================
 # Helper Functions
 # ========================
 
+@metrics.timed("create_cot")
 def _create_cot(project_name, context, format='md', context_dir=None):
-    logger.debug(f"Creating CoT for project: {project_name}, format: {format}")
+    logger.debug("Creating CoT for project: %s, format: %s", project_name, format)
     context_dir = _get_context_dir(project_name, context_dir)
-    logger.debug(f"Context directory: {context_dir}")
+    logger.debug("Context directory: %s", context_dir)
 
     os.makedirs(context_dir, exist_ok=True)
-    logger.debug(f"Created context directory: {context_dir}")
+    logger.debug("Created context directory: %s", context_dir)
 
+    with _cot_lock(context_dir):
+        return _create_cot_locked(project_name, context, format, context_dir)
+
+def _create_cot_locked(project_name, context, format, context_dir):
     # Get the next available number for the CoT file
-    existing_files = [f for f in os.listdir(context_dir) if f.startswith('cot_') and f.endswith(f'.{format}')]
-    next_number = len(existing_files) + 1
-    logger.debug(f"Next CoT number: {next_number}")
+    index = _load_cot_index(context_dir)
+    next_number = index["next"]
+    if os.path.exists(os.path.join(context_dir, _cot_file_name(next_number, format))):
+        logger.warning("CoT index is behind the directory contents, rebuilding")
+        index = _rebuild_cot_index(context_dir)
+        next_number = index["next"]
+    logger.debug("Next CoT number: %s", next_number)
 
     # Create the new CoT file
-    new_cot_file = os.path.join(context_dir, f'cot_{next_number:04d}.{format}')
+    new_cot_file = os.path.join(context_dir, _cot_file_name(next_number, format))
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    logger.debug(f"New CoT file: {new_cot_file}")
-    
+    logger.debug("New CoT file: %s", new_cot_file)
+
     try:
         if format == 'md':
             content = f"# Chain of Thought Entry {next_number}\n\n"
@@ -48,37 +357,55 @@ def _create_cot(project_name, context, format='md', context_dir=None):
                 "project": project_name,
                 "content": context
             }, indent=2)
+        elif format == 'jsonl':
+            content = json.dumps({
+                "type": "create",
+                "entry_number": next_number,
+                "created": timestamp,
+                "project": project_name,
+                "content": context
+            }) + "\n"
         else:
-            logger.error(f"Unsupported format: {format}")
+            logger.error("Unsupported format: %s", format)
             return
 
-        with open(new_cot_file, 'w') as f:
-            f.write(content)
-        logger.info(f"Created new CoT file: {new_cot_file}")
-        logger.info(f"CoT content: {content}")  # Log full content
+        _atomic_write(new_cot_file, content)
+        size = os.path.getsize(new_cot_file)
+        _record_cot_entry(context_dir, index, next_number, format, size)
+        _index_cot_block(context_dir, next_number, "create", timestamp, project_name, context)
+        metrics.add("bytes_written", size)
+        logger.info("Created new CoT file: %s (%d bytes)", new_cot_file, size)
     except IOError as e:
-        logger.error(f"Error creating CoT file: {e}")
+        logger.error("Error creating CoT file: %s", e)
         logger.exception("Detailed error information:")
 
+@metrics.timed("update_cot")
 def _update_cot(project_name, context, format='md', context_dir=None):
-    logger.debug(f"Updating CoT for project: {project_name}, format: {format}")
+    logger.debug("Updating CoT for project: %s, format: %s", project_name, format)
     context_dir = _get_context_dir(project_name, context_dir)
-    logger.debug(f"Context directory: {context_dir}")
+    logger.debug("Context directory: %s", context_dir)
 
     if not os.path.exists(context_dir):
-        logger.error(f"Context directory does not exist: {context_dir}")
+        logger.error("Context directory does not exist: %s", context_dir)
         _create_cot(project_name, context, format, context_dir)
         return
 
-    existing_files = [f for f in os.listdir(context_dir) if f.startswith('cot_') and f.endswith(f'.{format}')]
-    logger.debug(f"Existing CoT files: {existing_files}")
-    if not existing_files:
-        logger.error(f"No existing CoT files found for project: {project_name}")
+    with _cot_lock(context_dir):
+        return _update_cot_locked(project_name, context, format, context_dir)
+
+def _update_cot_locked(project_name, context, format, context_dir):
+    index = _load_cot_index(context_dir)
+    latest_number = index["latest"].get(format)
+    if latest_number is not None and not os.path.exists(os.path.join(context_dir, _cot_file_name(latest_number, format))):
+        logger.warning("CoT index points at a missing file, rebuilding")
+        index = _rebuild_cot_index(context_dir)
+        latest_number = index["latest"].get(format)
+    if latest_number is None:
+        logger.error("No existing CoT files found for project: %s", project_name)
         return
 
-    latest_file = max(existing_files)
-    cot_file = os.path.join(context_dir, latest_file)
-    logger.debug(f"Latest CoT file: {cot_file}")
+    cot_file = os.path.join(context_dir, _cot_file_name(latest_number, format))
+    logger.debug("Latest CoT file: %s", cot_file)
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     try:
@@ -86,70 +413,576 @@ def _update_cot(project_name, context, format='md', context_dir=None):
             with open(cot_file, 'a') as f:
                 update_content = f"\n\n## Update: {timestamp}\n\n{context}"
                 f.write(update_content)
-            logger.info(f"Updated MD file with new content: {update_content}")
+            metrics.add("bytes_written", len(update_content.encode('utf-8')))
         elif format == 'json':
-            with open(cot_file, 'r+') as f:
+            metrics.add("bytes_read", os.path.getsize(cot_file))
+            with open(cot_file, 'r') as f:
                 data = json.load(f)
-                update = {
-                    "timestamp": timestamp,
-                    "content": context
-                }
-                data['updates'] = data.get('updates', []) + [update]
-                f.seek(0)
-                json.dump(data, f, indent=2)
-                f.truncate()
-            logger.info(f"Updated JSON file with new content: {update}")
+            update = {
+                "timestamp": timestamp,
+                "content": context
+            }
+            data['updates'] = data.get('updates', []) + [update]
+            content = json.dumps(data, indent=2)
+            _atomic_write(cot_file, content)
+            metrics.add("bytes_written", len(content.encode('utf-8')))
+        elif format == 'jsonl':
+            update = {
+                "type": "update",
+                "timestamp": timestamp,
+                "content": context
+            }
+            line = json.dumps(update)
+            _append_line(cot_file, line)
+            metrics.add("bytes_written", len(line.encode('utf-8')) + 1)
         else:
-            logger.error(f"Unsupported format: {format}")
+            logger.error("Unsupported format: %s", format)
             return
 
-        logger.info(f"Updated CoT file: {cot_file}")
+        size = os.path.getsize(cot_file)
+        _index_cot_block(context_dir, latest_number, "update", timestamp, project_name, context)
+        logger.info("Updated CoT file: %s (%d bytes)", cot_file, size)
     except IOError as e:
-        logger.error(f"Error updating CoT file: {e}")
+        logger.error("Error updating CoT file: %s", e)
         logger.exception("Detailed error information:")
 
-import subprocess
-import anthropic
+# ========================
+# Snapshot State
+# ========================
 
-def _compress_cot(project_name, context_dir=None):
-    logger.debug(f"Compressing CoT for project: {project_name}")
-    context_dir = _get_context_dir(project_name, context_dir)
-    snapshot_file = os.path.join(context_dir, 'snapshot.md')
-    logger.debug(f"Context directory: {context_dir}")
-    logger.debug(f"Snapshot file: {snapshot_file}")
+# .snapshot_state.json records how much of the journal snapshot.md already
+# covers, per format: {"md": {"entry": 3, "offset": 120}, ...} means every md
+# entry before 3 plus the first 120 bytes of entry 3. Updates only ever
+# append to the latest entry of their format, which may be older than the
+# latest entry of another format, so one mark per format is exact where a
+# single mark for the whole journal is not. Only the append-only formats are
+# compressed, so a byte offset is always a valid resume point.
+SNAPSHOT_STATE_FILE = '.snapshot_state.json'
+COMPRESSIBLE_FORMATS = ('md', 'jsonl')
+
+def _load_snapshot_state(context_dir):
+    # {format: {"entry": n, "offset": bytes}}; a format without a mark is not covered at all
+    try:
+        with open(os.path.join(context_dir, SNAPSHOT_STATE_FILE), 'r') as f:
+            state = json.load(f)
+        if "entry" in state:
+            # Written before marks were kept per format: one mark for every format
+            state = {format: state for format in COMPRESSIBLE_FORMATS}
+        return {format: {"entry": int(mark["entry"]), "offset": int(mark["offset"])}
+                for format, mark in state.items()}
+    except FileNotFoundError:
+        return {}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        logger.warning("Unreadable snapshot state in %s, compressing the whole journal", context_dir)
+        return {}
+
+def _snapshot_covers(state, number, format):
+    # Whether entry `number` is wholly behind the snapshot's mark and will
+    # not be appended to again. Formats that are not compressed have no mark
+    # of their own and count as covered behind the furthest mark.
+    if format in COMPRESSIBLE_FORMATS:
+        return number < state.get(format, {"entry": 0})["entry"]
+    return number < max((mark["entry"] for mark in state.values()), default=0)
+
+def _record_cot_note(project_name, context_dir, text):
+    # Adds an outcome to the journal: an update of the latest md entry, or
+    # the first entry. The check and the write share one hold of the lock, so
+    # two writers can't both create the first entry.
+    os.makedirs(context_dir, exist_ok=True)
+    with _cot_lock(context_dir):
+        if _load_cot_index(context_dir)["latest"].get('md') is None:
+            _create_cot(project_name, text, context_dir=context_dir)
+        else:
+            _update_cot(project_name, text, context_dir=context_dir)
+
+_FENCED_RE = re.compile(r'^```[\w+-]*\n(.*?)\n?```$', re.DOTALL)
+
+def _strip_fences(text):
+    # Model responses sometimes wrap code in a Markdown fence. Only a fence
+    # around the whole text is removed, so fences inside a file (a Markdown
+    # file's code blocks) are kept.
+    text = text.strip()
+    match = _FENCED_RE.match(text)
+    if match and not re.search(r'^```', match.group(1), re.MULTILINE):
+        text = match.group(1)
+    return text + "\n"
+
+def _read_cot_deltas(context_dir, since):
+    # Returns the journal text added after the `since` high-water marks and
+    # the marks to record once that text has been folded into the snapshot.
+    chunks = []
+    high_water = dict(since)
+    with _cot_lock(context_dir):
+        for number, record in _read_cot_manifest(context_dir).items():
+            format = record["format"]
+            mark = since.get(format, {"entry": 0, "offset": 0})
+            if number < mark["entry"] or format not in COMPRESSIBLE_FORMATS:
+                continue
+            if not _cot_entry_exists(context_dir, record):
+                continue
+            offset = mark["offset"] if number == mark["entry"] else 0
+            if offset > _cot_entry_size(context_dir, record):
+                logger.warning("%s is shorter than the snapshot high-water mark, re-reading it", record["file"])
+                offset = 0
+            data = _read_cot_bytes(context_dir, record, offset)
+            metrics.add("files_scanned")
+            metrics.add("bytes_read", len(data))
+            if data.strip():
+                chunks.append(data.decode('utf-8', errors='replace'))
+            high_water[format] = {"entry": number, "offset": offset + len(data)}
+    return chunks, high_water
 
-    if not os.path.exists(context_dir):
-        logger.error(f"Context directory does not exist: {context_dir}")
-        return
+# ========================
+# Packing
+# ========================
 
-    # 1. Read the current snapshot file
-    current_snapshot = ""
-    if os.path.exists(snapshot_file):
-        with open(snapshot_file, 'r') as f:
-            current_snapshot = f.read()
-        logger.debug(f"Current snapshot length: {len(current_snapshot)} characters")
-    else:
-        logger.debug("No existing snapshot file found")
+# pack_cot moves entries that snapshot.md already covers into compressed
+# segments (see pack.py). The newest entry of each format is never packed,
+# because it may still be updated. Segments are written and synced first,
+# then the manifest records the new locations, and only then are the loose
+# files removed, so an interruption at any point loses nothing.
+
+@metrics.timed("pack_cot")
+def _pack_cot(context_dir, codec='zlib'):
+    from . import pack
+
+    with _cot_lock(context_dir):
+        state = _load_snapshot_state(context_dir)
+        latest = set(_load_cot_index(context_dir)["latest"].values())
+        manifest = _read_cot_manifest(context_dir)
+        for record in manifest.values():
+            # Loose copies left by an interrupted pack
+            if "pack" in record and os.path.exists(os.path.join(context_dir, record["file"])):
+                os.remove(os.path.join(context_dir, record["file"]))
+        candidates = [(number, record) for number, record in manifest.items()
+                      if _snapshot_covers(state, number, record["format"]) and number not in latest
+                      and "pack" not in record
+                      and os.path.exists(os.path.join(context_dir, record["file"]))]
+        if not candidates:
+            logger.info("No CoT entries to pack in %s", context_dir)
+            return []
+
+        entries = []
+        for number, record in candidates:
+            data = _read_cot_bytes(context_dir, record)
+            metrics.add("files_scanned")
+            metrics.add("bytes_read", len(data))
+            entries.append((number, record["file"], record["format"], data))
+        records = pack.append(context_dir, entries, _atomic_write, codec)
+        # Rewritten rather than appended to, which also drops superseded lines
+        manifest.update((record["entry"], record) for record in records)
+        _atomic_write(os.path.join(context_dir, COT_MANIFEST_FILE),
+                      "".join(json.dumps(record) + "\n" for record in manifest.values()))
+        for number, record in candidates:
+            os.remove(os.path.join(context_dir, record["file"]))
+
+    raw = sum(len(entry[3]) for entry in entries)
+    packed = sum({(r["pack"], r["offset"]): r["length"] for r in records}.values())
+    metrics.add("bytes_written", packed)
+    logger.info("Packed %s CoT entries (%s bytes) into %s bytes in %s", len(records), raw, packed, records[-1]["pack"])
+    return records
 
-    # 2. Read all CoT files
-    cot_files = [f for f in os.listdir(context_dir) if f.startswith('cot_') and f.endswith('.md')]
-    cot_content = ""
-    for cot_file in cot_files:
-        with open(os.path.join(context_dir, cot_file), 'r') as f:
-            cot_content += f.read() + "\n\n"
-    logger.debug(f"CoT content length: {len(cot_content)} characters")
+# ========================
+# Response Cache
+# ========================
 
-    # 3. Send data to Anthropic for compression and commit message generation
-    prompt = f"""Human: Please compress the following Chain of Thought (CoT) information. 
+# Completions are cached on disk under .context/.cache, keyed by a hash of the
+# model, the request parameters and the prompt, so re-running a compression
+# (after a failed git commit, or a CI retry) costs a file read instead of an
+# API round trip. Entries are evicted least-recently-used first once the cache
+# grows past CACHE_MAX_BYTES, and any entry older than CACHE_MAX_AGE is dropped.
+CACHE_DIR = '.cache'
+CACHE_STATS_FILE = 'stats.json'
+CACHE_MAX_BYTES = int(os.environ.get('LOCOHOST_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_MAX_AGE = float(os.environ.get('LOCOHOST_CACHE_MAX_AGE_DAYS', 30)) * 24 * 3600
+
+def _cache_dir(context_dir, use_cache=True):
+    return os.path.join(context_dir, CACHE_DIR) if use_cache else None
+
+def _cache_key(params):
+    payload = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _cache_get(cache_dir, key):
+    path = os.path.join(cache_dir, f'{key}.json')
+    try:
+        with open(path, 'r') as f:
+            entry = json.load(f)
+        if time.time() - entry["created"] > CACHE_MAX_AGE:
+            os.remove(path)
+            return None
+        # Reads refresh the mtime, which is what LRU eviction orders by
+        os.utime(path)
+        return entry
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+def _cache_put(cache_dir, key, entry):
+    os.makedirs(cache_dir, exist_ok=True)
+    _atomic_write(os.path.join(cache_dir, f'{key}.json'), json.dumps(entry))
+    _cache_evict(cache_dir)
+
+def _cache_evict(cache_dir, max_bytes=None, max_age=None):
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age = CACHE_MAX_AGE if max_age is None else max_age
+    now = time.time()
+    entries, total = [], 0
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.json') or name == CACHE_STATS_FILE:
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if now - st.st_mtime > max_age:
+            os.remove(path)
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        evicted += 1
+    if evicted:
+        logger.debug("Evicted %s response cache entries from %s", evicted, cache_dir)
+    return evicted
+
+def _cache_count(cache_dir, counter):
+    stats_file = os.path.join(cache_dir, CACHE_STATS_FILE)
+    os.makedirs(cache_dir, exist_ok=True)
+    with _cot_lock(os.path.dirname(cache_dir)):
+        try:
+            with open(stats_file, 'r') as f:
+                stats = json.load(f)
+        except (FileNotFoundError, ValueError):
+            stats = {"hits": 0, "misses": 0}
+        stats[counter] = stats.get(counter, 0) + 1
+        _atomic_write(stats_file, json.dumps(stats))
+    return stats
+
+# ========================
+# Map-Reduce Compression
+# ========================
+
+# A journal that does not fit in one request is summarized in token-budgeted
+# batches on a bounded thread pool (map), and the partial summaries are merged
+# batch-wise until they fit (reduce). The final compression prompt then sees
+# the merged summaries instead of the raw entries.
+#
+# The final compression prompt is sent as two content blocks: the instructions
+# and the current snapshot, which stay the same until the snapshot is
+# replaced, and then the new CoT content. The first block is marked for the
+# API's prompt cache, so a request that repeats it (a retry, a resumed stream,
+# a re-run with --full or --no-cache) reads it from the cache instead of
+# processing it again.
+COMPRESSION_MODEL = "claude-3-5-sonnet-20240620"
+PROMPT_CACHE_CONTROL = {"type": "ephemeral"}
+DEFAULT_BATCH_TOKENS = 60000
+DEFAULT_PARALLELISM = 4
+
+def _estimate_tokens(text):
+    # Roughly four characters per token for English prose and code
+    return len(text) // 4 + 1
+
+@contextmanager
+def _timed_stage(stage, detail=None):
+    start = time.perf_counter()
+    try:
+        with metrics.timed(f"compress_cot.{stage}"):
+            yield
+    finally:
+        logger.info("Compression stage '%s'%s took %.2fs", stage, f" ({detail})" if detail else "",
+                    time.perf_counter() - start)
+
+def _message_params(prompt, max_tokens):
+    return {
+        "model": COMPRESSION_MODEL,
+        "max_tokens": max_tokens,
+        "messages": [
+            {"role": "user", "content": prompt}
+        ]
+    }
+
+def _log_prompt_cache(usage):
+    read = getattr(usage, "cache_read_input_tokens", None)
+    written = getattr(usage, "cache_creation_input_tokens", None)
+    if read or written:
+        logger.info("Prompt cache: %s input tokens read, %s written", read or 0, written or 0)
+
+def _cache_lookup(cache_dir, key):
+    cached = _cache_get(cache_dir, key)
+    if cached is None:
+        stats = _cache_count(cache_dir, "misses")
+        logger.info("Response cache miss %s (hits: %s, misses: %s)", key[:12], stats['hits'], stats['misses'])
+        return None
+    stats = _cache_count(cache_dir, "hits")
+    logger.info("Response cache hit %s (hits: %s, misses: %s)", key[:12], stats['hits'], stats['misses'])
+    return cached["text"]
+
+def _cache_store(cache_dir, key, text, usage):
+    _cache_put(cache_dir, key, {
+        "created": time.time(),
+        "text": text,
+        "usage": usage.model_dump() if hasattr(usage, "model_dump") else None
+    })
+
+def _complete(prompt, max_tokens=3000, cache_dir=None):
+    params = _message_params(prompt, max_tokens)
+    if cache_dir:
+        key = _cache_key(params)
+        cached = _cache_lookup(cache_dir, key)
+        if cached is not None:
+            metrics.record_api_call("messages.create", 0.0, cached=True)
+            return cached
+
+    start = time.perf_counter()
+    response = _get_client().messages.create(**params)
+    usage = getattr(response, "usage", None)
+    metrics.record_api_call("messages.create", time.perf_counter() - start, usage)
+    _log_prompt_cache(usage)
+    text = response.content[0].text
+    if cache_dir:
+        _cache_store(cache_dir, key, text, usage)
+    return text
+
+REPAIR_RETRY_BUDGET = 2
+
+def _instructor_repair(schema, prompt, retry_budget):
+    # Asks only for the sections a response was missing; instructor validates
+    # the reply against the schema and re-asks up to retry_budget times.
+    import instructor
+
+    start = time.perf_counter()
+    try:
+        return instructor.from_anthropic(_get_client()).messages.create(
+            model=COMPRESSION_MODEL,
+            max_tokens=3000,
+            max_retries=retry_budget,
+            response_model=schema,
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        )
+    finally:
+        metrics.record_api_call("repair", time.perf_counter() - start)
+
+def _split_to_budget(text, budget):
+    if budget <= 0:
+        raise ValueError(f"Token budget must be positive, got {budget}")
+    max_chars = budget * 4
+    if len(text) <= max_chars:
+        return [text]
+    pieces, current = [], ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if len(current) + len(line) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+def _batch_by_tokens(chunks, budget):
+    batches, current, current_tokens = [], [], 0
+    for chunk in chunks:
+        for piece in _split_to_budget(chunk, budget):
+            tokens = _estimate_tokens(piece)
+            if current and current_tokens + tokens > budget:
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def _summarize_batches(batches, build_prompt, parallelism, cache_dir=None, summarize=None):
+    # summarize(prompts) -> texts replaces the thread pool when the caller
+    # sends its requests some other way (compress_all sends them on its loop)
+    from concurrent.futures import ThreadPoolExecutor
+    from functools import partial
+
+    prompts = [build_prompt(i, len(batches), "\n\n".join(batch)) for i, batch in enumerate(batches, 1)]
+    if summarize is not None:
+        return summarize(prompts)
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+        return list(pool.map(partial(_complete, cache_dir=cache_dir), prompts))
+
+def _map_prompt(part, total, content):
+    return f"""Human: The following is part {part} of {total} of a Chain of Thought (CoT) journal.
+    Summarize it in Markdown. Preserve all important information: decisions, rationale, open questions,
+    names, commands and errors. Keep the chronological order.
+
+    {content}
+
+    Assistant:
+    """
+
+def _reduce_prompt(part, total, content):
+    return f"""Human: The following are consecutive partial summaries of a Chain of Thought (CoT) journal
+    (group {part} of {total}). Merge them into a single Markdown summary in chronological order.
+    Preserve all important information and do not remove any significant details.
+
+    {content}
+
+    Assistant:
+    """
+
+def _map_reduce_cot(chunks, batch_tokens, parallelism, cache_dir=None, summarize=None):
+    batches = _batch_by_tokens(chunks, batch_tokens)
+    with _timed_stage("map", f"{len(batches)} batches"):
+        summaries = _summarize_batches(batches, _map_prompt, parallelism, cache_dir, summarize)
+
+    level = 0
+    while len(summaries) > 1 and _estimate_tokens("\n\n".join(summaries)) > batch_tokens:
+        level += 1
+        batches = _batch_by_tokens(summaries, batch_tokens)
+        if len(batches) == len(summaries):
+            # Every summary fills a batch on its own; merge pairwise so each level still shrinks
+            batches = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+        with _timed_stage("reduce", f"level {level}, {len(batches)} batches"):
+            summaries = _summarize_batches(batches, _reduce_prompt, parallelism, cache_dir, summarize)
+    return summaries
+
+# ========================
+# Streaming Compression
+# ========================
+
+# In streaming mode the [COMPRESSED_CONTENT] section is appended to
+# snapshot.md.partial as tokens arrive. .snapshot_partial.json records which
+# request the partial file belongs to; if a run dies part-way, the next run
+# with the same request sends the partial text back as the start of the
+# assistant turn and the model continues from there.
+PARTIAL_SNAPSHOT_SUFFIX = '.partial'
+PARTIAL_STATE_FILE = '.snapshot_partial.json'
+
+class _SectionStreamParser:
+    # Splits a stream of text into [NAME]...[/NAME] sections as it arrives,
+    # holding back just enough text to recognise a marker split across chunks.
+    def __init__(self, sections, on_text, section=None):
+        self.sections = sections
+        self.on_text = on_text
+        self.section = section
+        self._buffer = ""
+        self._holdback = max(len(f"[/{name}]") for name in sections) - 1
+
+    def feed(self, text):
+        self._buffer += text
+        while True:
+            if self.section is None:
+                found = [(self._buffer.find(f"[{name}]"), name) for name in self.sections]
+                found = [(i, name) for i, name in found if i >= 0]
+                if not found:
+                    self._buffer = self._buffer[-self._holdback:]
+                    return
+                i, name = min(found)
+                self.section = name
+                self._buffer = self._buffer[i + len(name) + 2:]
+            else:
+                close = f"[/{self.section}]"
+                i = self._buffer.find(close)
+                if i < 0:
+                    safe = len(self._buffer) - self._holdback
+                    if safe > 0:
+                        self.on_text(self.section, self._buffer[:safe])
+                        self._buffer = self._buffer[safe:]
+                    return
+                if i:
+                    self.on_text(self.section, self._buffer[:i])
+                self._buffer = self._buffer[i + len(close):]
+                self.section = None
+
+    def close(self):
+        if self.section is not None and self._buffer:
+            self.on_text(self.section, self._buffer)
+        self._buffer = ""
+
+def _stream_complete(prompt, partial_file, max_tokens=3000, cache_dir=None):
+    params = _message_params(prompt, max_tokens)
+    key = _cache_key(params)
+    if cache_dir:
+        cached = _cache_lookup(cache_dir, key)
+        if cached is not None:
+            metrics.record_api_call("messages.stream", 0.0, cached=True)
+            return cached
+
+    state_file = os.path.join(os.path.dirname(partial_file), PARTIAL_STATE_FILE)
+    try:
+        with open(state_file, 'r') as f:
+            resumable = json.load(f).get("key") == key and os.path.exists(partial_file)
+    except (FileNotFoundError, ValueError):
+        resumable = False
+
+    prefix = ""
+    if resumable:
+        with open(partial_file, 'r') as f:
+            done = f.read()
+        # The API rejects a prefilled assistant turn that ends in whitespace
+        prefix = ("[COMPRESSED_CONTENT]" + done).rstrip()
+        params["messages"].append({"role": "assistant", "content": prefix})
+        _atomic_write(partial_file, prefix[len("[COMPRESSED_CONTENT]"):])
+        logger.info("Resuming streamed compression from %s characters in %s", len(done), partial_file)
+    else:
+        _atomic_write(partial_file, "")
+        _atomic_write(state_file, json.dumps({"key": key, "started": time.time()}))
+
+    chunks = [prefix]
+    start = time.perf_counter()
+    first_token = None
+    with open(partial_file, 'a') as out:
+        def on_text(section, text):
+            if section == "COMPRESSED_CONTENT":
+                out.write(text)
+                out.flush()
+
+        parser = _SectionStreamParser(("COMPRESSED_CONTENT", "COMMIT_MESSAGE"), on_text,
+                                      section="COMPRESSED_CONTENT" if resumable else None)
+        try:
+            with _get_client().messages.stream(**params) as stream:
+                for text in stream.text_stream:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                        logger.info("Time to first token: %.2fs", first_token)
+                    chunks.append(text)
+                    parser.feed(text)
+                usage = getattr(stream.get_final_message(), "usage", None)
+        except BaseException:
+            parser.close()
+            logger.error("Streamed compression interrupted; partial snapshot kept at %s, "
+                         "re-run with --stream to resume", partial_file)
+            raise
+        parser.close()
+
+    elapsed = time.perf_counter() - start
+    metrics.record_api_call("messages.stream", elapsed, usage)
+    _log_prompt_cache(usage)
+    metrics.add("time_to_first_token_ms", round((first_token or elapsed) * 1000))
+    logger.info("Streamed compression finished in %.2fs", elapsed)
+    response_content = "".join(chunks)
+    if cache_dir:
+        _cache_store(cache_dir, key, response_content, usage)
+    return response_content
+
+def _compression_prompt(current_snapshot, cot_content, full):
+    # The stable part comes first and is cached; only the CoT content varies
+    prefix = f"""Human: Please compress the following Chain of Thought (CoT) information. 
     Preserve all important information, especially the content of the CoT entries.
     You may reorganize and summarize the information, but do not remove any significant details.
     
-    Current snapshot:
-    {current_snapshot}
-    
-    CoT content:
-    {cot_content}
-    
     Provide the compressed result in Markdown format, which should include all CoT entries in a summarized form.
     
     After compressing the content, please generate a concise and informative commit message that summarizes the key updates or changes made in this compression.
@@ -162,141 +995,997 @@ def _compress_cot(project_name, context_dir=None):
     [COMMIT_MESSAGE]
     (Your commit message here)
     [/COMMIT_MESSAGE]
+    
+    Current snapshot:
+    {current_snapshot}
+    """
+    suffix = f"""
+    CoT content{"" if full else " added since the current snapshot"}:
+    {cot_content}
 
     Assistant:
     """
+    return [
+        {"type": "text", "text": prefix, "cache_control": PROMPT_CACHE_CONTROL},
+        {"type": "text", "text": suffix},
+    ]
+
+def _prepare_compression(project_name, context_dir, full, batch_tokens, parallelism, cache_dir, dedup=True,
+                         summarize=None):
+    # Returns the final compression prompt and the high-water mark it covers,
+    # or None when the snapshot is already up to date.
+    snapshot_file = os.path.join(context_dir, 'snapshot.md')
 
-    logger.info("Sending request to Anthropic API")
-    try:
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=3000,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        logger.debug(f"Received response from Anthropic API")
-    except Exception as e:
-        logger.error(f"Error calling Anthropic API: {e}")
-        logger.exception("Detailed error information:")
-        return
+    # 1. Read the current snapshot file
+    current_snapshot = ""
+    if os.path.exists(snapshot_file):
+        with open(snapshot_file, 'r') as f:
+            current_snapshot = f.read()
+        metrics.add("bytes_read", len(current_snapshot.encode('utf-8')))
+        logger.debug("Current snapshot length: %s characters", len(current_snapshot))
+    else:
+        logger.debug("No existing snapshot file found")
+
+    # 2. Read the CoT entries added since the last snapshot (or all of them)
+    since = {} if full else _load_snapshot_state(context_dir)
+    with _timed_stage("read"):
+        chunks, high_water = _read_cot_deltas(context_dir, since)
+
+    # Collapse repeated and near-identical updates before they reach a prompt
+    if dedup and chunks:
+        from .dedup import collapse_duplicates
+        with _timed_stage("dedup"):
+            before = _estimate_tokens("\n\n".join(chunks))
+            chunks, dropped = collapse_duplicates(chunks)
+            saved = before - _estimate_tokens("\n\n".join(chunks))
+            metrics.add("tokens_saved", saved)
+        if dropped:
+            logger.info("Collapsed %s duplicate CoT updates, saving about %s tokens", dropped, saved)
+
+    cot_content = "\n\n".join(chunks)
+    logger.debug("CoT content length: %s characters from %s entries since %s", len(cot_content), len(chunks), since)
+    if not cot_content and current_snapshot:
+        logger.info("No new CoT content since the last snapshot for project: %s", project_name)
+        return None
+
+    # Journals that do not fit in one request are summarized in batches first
+    if _estimate_tokens(current_snapshot) + _estimate_tokens(cot_content) > batch_tokens:
+        if _estimate_tokens(current_snapshot) > batch_tokens // 2:
+            # The snapshot alone would crowd out the new content, so it is summarized along with it
+            chunks = [f"Previous snapshot:\n\n{current_snapshot}"] + chunks
+            current_snapshot = ""
+        summaries = _map_reduce_cot(chunks, batch_tokens - _estimate_tokens(current_snapshot), parallelism, cache_dir,
+                                    summarize)
+        cot_content = "\n\n".join(summaries)
+        logger.debug("Summarized CoT content length: %s characters", len(cot_content))
+
+    return _compression_prompt(current_snapshot, cot_content, full), high_water
+
+def _finish_compression(project_name, context_dir, response_content, high_water):
+    from .schemas import CompressionResult, ResponseFormatError, parse_response
 
-    response_content = response.content[0].text
+    snapshot_file = os.path.join(context_dir, 'snapshot.md')
 
     # Extract compressed content and commit message from the response
-    compressed_content = response_content.split("[COMPRESSED_CONTENT]")[1].split("[/COMPRESSED_CONTENT]")[0].strip()
-    commit_message = response_content.split("[COMMIT_MESSAGE]")[1].split("[/COMMIT_MESSAGE]")[0].strip()
+    try:
+        result = parse_response(response_content, CompressionResult, repair=_instructor_repair,
+                                retry_budget=REPAIR_RETRY_BUDGET)
+    except ResponseFormatError as e:
+        logger.error("Could not extract the snapshot from the response: %s; re-run with --no-cache to request a new one", e)
+        return
+    compressed_content = result.compressed_content
+    commit_message = result.commit_message
 
-    logger.debug(f"Compressed content length: {len(compressed_content)} characters")
-    logger.debug(f"Commit message: {commit_message}")
+    logger.debug("Compressed content length: %s characters", len(compressed_content))
+    logger.debug("Commit message: %s", commit_message)
 
     # 4. Write the response to the new snapshot file
     try:
-        with open(snapshot_file, 'w') as f:
-            f.write(compressed_content)
-        logger.info(f"Written compressed content to {snapshot_file}")
-        logger.info(f"Compressed content: {compressed_content}")
+        with _timed_stage("write"), _cot_lock(context_dir):
+            _atomic_write(snapshot_file, compressed_content)
+            _atomic_write(os.path.join(context_dir, SNAPSHOT_STATE_FILE), json.dumps(high_water))
+            for leftover in (snapshot_file + PARTIAL_SNAPSHOT_SUFFIX, os.path.join(context_dir, PARTIAL_STATE_FILE)):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        metrics.add("bytes_written", len(compressed_content.encode('utf-8')))
+        logger.info("Written compressed content to %s (%d characters)", snapshot_file, len(compressed_content))
     except IOError as e:
-        logger.error(f"Error writing to snapshot file: {e}")
+        logger.error("Error writing to snapshot file: %s", e)
         logger.exception("Detailed error information:")
         return
 
-    # 5. Commit the changes to git
-    git_add_command = ["git", "add", os.path.basename(snapshot_file)]
-    git_commit_command = ["git", "commit", "-m", commit_message]
-    
-    logger.debug(f"Running git add command: {' '.join(git_add_command)}")
+    # 5. Commit the snapshot onto the snapshot ref, leaving the user's index alone
+    from . import gitstore
     try:
-        subprocess.run(git_add_command, cwd=context_dir, check=True)
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error running git add: {e}")
+        with _timed_stage("commit"):
+            gitstore.commit_files(context_dir, {os.path.basename(snapshot_file): compressed_content.encode('utf-8')},
+                                  commit_message)
+    except (gitstore.GitError, OSError) as e:
+        logger.error("Error committing the snapshot: %s", e)
         logger.exception("Detailed error information:")
         return
 
-    logger.debug(f"Running git commit command: {' '.join(git_commit_command)}")
+    logger.info("CoT snapshot compressed and updated for project: %s", project_name)
+    logger.info("Commit message: %s", commit_message)
+
+    return snapshot_file
+
+@metrics.timed("compress_cot")
+def _compress_cot(project_name, context_dir=None, full=False, batch_tokens=DEFAULT_BATCH_TOKENS,
+                  parallelism=DEFAULT_PARALLELISM, use_cache=True, stream=False, dedup=True):
+    logger.debug("Compressing CoT for project: %s", project_name)
+    context_dir = _get_context_dir(project_name, context_dir)
+    cache_dir = _cache_dir(context_dir, use_cache)
+    snapshot_file = os.path.join(context_dir, 'snapshot.md')
+    logger.debug("Context directory: %s", context_dir)
+    logger.debug("Snapshot file: %s", snapshot_file)
+
+    if not os.path.exists(context_dir):
+        logger.error("Context directory does not exist: %s", context_dir)
+        return
+
     try:
-        subprocess.run(git_commit_command, cwd=context_dir, check=True)
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error running git commit: {e}")
+        prepared = _prepare_compression(project_name, context_dir, full, batch_tokens, parallelism, cache_dir, dedup)
+    except Exception as e:
+        logger.error("Error calling Anthropic API: %s", e)
         logger.exception("Detailed error information:")
         return
+    if prepared is None:
+        return snapshot_file
+    prompt, high_water = prepared
 
-    logger.info(f"CoT snapshot compressed and updated for project: {project_name}")
-    logger.info(f"Commit message: {commit_message}")
+    # 3. Send data to Anthropic for compression and commit message generation
+    logger.info("Sending request to Anthropic API")
+    try:
+        with _timed_stage("final"):
+            if stream:
+                response_content = _stream_complete(prompt, snapshot_file + PARTIAL_SNAPSHOT_SUFFIX, cache_dir=cache_dir)
+            else:
+                response_content = _complete(prompt, cache_dir=cache_dir)
+        logger.debug("Received response from Anthropic API")
+    except Exception as e:
+        logger.error("Error calling Anthropic API: %s", e)
+        logger.exception("Detailed error information:")
+        return
 
-    return snapshot_file
+    return _finish_compression(project_name, context_dir, response_content, high_water)
+
+# ========================
+# Fleet Compression
+# ========================
+
+# compress_all compresses many projects' journals concurrently on one asyncio
+# event loop. Local work (reading the journal, writing the snapshot, git) runs
+# in worker threads; every request, the batch summaries of a large journal as
+# well as the final compression, goes through the async client, which backs
+# off on rate limits and overload, honouring retry-after. One semaphore bounds
+# the requests in flight across the whole fleet.
+DEFAULT_FLEET_CONCURRENCY = 8
+FLEET_MAX_ATTEMPTS = 6
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504, 529)
+
+def _make_async_client():
+    from anthropic import AsyncAnthropic
+    # Retries are handled by _acomplete so that every project shares the same backoff policy
+    return AsyncAnthropic(max_retries=0)
+
+def _is_retryable(error):
+    import anthropic
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+async def _acomplete(client, prompt, max_tokens=3000, cache_dir=None, max_attempts=FLEET_MAX_ATTEMPTS):
+    import asyncio
+    import random
+
+    params = _message_params(prompt, max_tokens)
+    key = _cache_key(params)
+    if cache_dir:
+        cached = _cache_lookup(cache_dir, key)
+        if cached is not None:
+            metrics.record_api_call("messages.create.async", 0.0, cached=True)
+            return cached, None
+
+    start = time.perf_counter()
+    backoff = 1.0
+    for attempt in range(1, max_attempts + 1):
+        try:
+            response = await client.messages.create(**params)
+            break
+        except Exception as e:
+            if attempt == max_attempts or not _is_retryable(e):
+                raise
+            wait = _retry_after(e)
+            if wait is None:
+                wait = backoff * (0.5 + random.random())
+                backoff = min(backoff * 2, 60)
+            logger.warning("Anthropic API unavailable (%s), retrying in %.1fs (attempt %s/%s)",
+                           e.__class__.__name__, wait, attempt, max_attempts)
+            await asyncio.sleep(wait)
+
+    text = response.content[0].text
+    usage = getattr(response, "usage", None)
+    metrics.record_api_call("messages.create.async", time.perf_counter() - start, usage)
+    _log_prompt_cache(usage)
+    if cache_dir:
+        _cache_store(cache_dir, key, text, usage)
+    return text, usage
+
+def _discover_context_dirs(roots, max_depth=3):
+    import glob
+
+    found = []
+    for root in roots:
+        for path in sorted(glob.glob(os.path.expanduser(root))) or [root]:
+            path = os.path.abspath(path)
+            if os.path.basename(path) == '.context' and os.path.isdir(path):
+                found.append(path)
+                continue
+            base_depth = path.rstrip(os.sep).count(os.sep)
+            for dirpath, dirnames, _ in os.walk(path):
+                if '.context' in dirnames:
+                    found.append(os.path.join(dirpath, '.context'))
+                    # A project's subdirectories are part of that project
+                    dirnames[:] = []
+                    continue
+                if dirpath.count(os.sep) - base_depth >= max_depth:
+                    dirnames[:] = []
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+    return list(dict.fromkeys(found))
+
+async def _compress_project_async(client, semaphore, context_dir, full, batch_tokens, parallelism, use_cache,
+                                  dedup=True):
+    import asyncio
+
+    project_name = os.path.basename(os.path.dirname(context_dir))
+    cache_dir = _cache_dir(context_dir, use_cache)
+    result = {"project": project_name, "context_dir": context_dir, "status": "ok",
+              "seconds": 0.0, "input_tokens": None, "output_tokens": None}
+    loop = asyncio.get_running_loop()
+    batch_slots = asyncio.Semaphore(max(1, parallelism))
+
+    def add_usage(usage):
+        if usage is not None:
+            result["input_tokens"] = (result["input_tokens"] or 0) + usage.input_tokens
+            result["output_tokens"] = (result["output_tokens"] or 0) + usage.output_tokens
+
+    async def complete(prompt):
+        async with semaphore:
+            text, usage = await _acomplete(client, prompt, cache_dir=cache_dir)
+        add_usage(usage)
+        return text
+
+    async def summarize_all(prompts):
+        async def one(prompt):
+            async with batch_slots:
+                return await complete(prompt)
+        return await asyncio.gather(*(one(prompt) for prompt in prompts))
+
+    def summarize(prompts):
+        # Runs in _prepare_compression's worker thread; the requests run on the loop
+        return asyncio.run_coroutine_threadsafe(summarize_all(prompts), loop).result()
+
+    start = time.perf_counter()
+    try:
+        prepared = await asyncio.to_thread(_prepare_compression, project_name, context_dir, full,
+                                           batch_tokens, parallelism, cache_dir, dedup, summarize)
+        if prepared is None:
+            result["status"] = "up to date"
+        else:
+            prompt, high_water = prepared
+            response_content = await complete(prompt)
+            if result["input_tokens"] is None:
+                result["status"] = "cached"
+            snapshot_file = await asyncio.to_thread(_finish_compression, project_name, context_dir,
+                                                    response_content, high_water)
+            if snapshot_file is None:
+                result["status"] = "failed"
+    except Exception as e:
+        logger.error("Error compressing CoT for project %s: %s", project_name, e)
+        result["status"] = f"error: {e.__class__.__name__}"
+    result["seconds"] = round(time.perf_counter() - start, 2)
+    return result
+
+async def _compress_all_async(context_dirs, concurrency, full, batch_tokens, parallelism, use_cache, dedup=True):
+    import asyncio
+
+    client = _make_async_client()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    try:
+        return await asyncio.gather(*(
+            _compress_project_async(client, semaphore, context_dir, full, batch_tokens, parallelism, use_cache, dedup)
+            for context_dir in context_dirs
+        ))
+    finally:
+        await client.close()
+
+def _format_summary_table(results):
+    headers = ("project", "status", "seconds", "input tokens", "output tokens")
+    rows = [(r["project"], r["status"], f"{r['seconds']:.2f}",
+             "-" if r["input_tokens"] is None else str(r["input_tokens"]),
+             "-" if r["output_tokens"] is None else str(r["output_tokens"])) for r in results]
+    totals = ("TOTAL", f"{sum(r['status'] in ('ok', 'cached', 'up to date') for r in results)}/{len(results)} ok",
+              f"{max((r['seconds'] for r in results), default=0):.2f}",
+              str(sum(r["input_tokens"] or 0 for r in results)),
+              str(sum(r["output_tokens"] or 0 for r in results)))
+    widths = [max(len(row[i]) for row in [headers, totals] + rows) for i in range(len(headers))]
+    line = lambda row: "  ".join(cell.ljust(width) for cell, width in zip(row, widths))
+    return "\n".join([line(headers), line(tuple("-" * w for w in widths))] + [line(r) for r in rows] + [line(totals)])
+
+# ========================
+# Diff Test Generation
+# ========================
+
+# Hunks are the unit of caching: each hunk's tests are stored in
+# .context/.cache/tests under the hunk's content hash. Only uncached hunks
+# are requested, in token-budgeted batches per module that run concurrently
+# on a bounded pool, and each module's tests are assembled into one file
+# under .context/generated_tests.
+TESTGEN_CACHE_DIR = 'tests'
+GENERATED_TESTS_DIR = 'generated_tests'
+TESTGEN_BATCH_TOKENS = 12000
+
+def _generate_hunk_tests(path, hunks):
+    from . import difftests
+    from .schemas import parse_keyed_sections
+
+    keys = [hunk.key(COMPRESSION_MODEL) for hunk in hunks]
+    response = _complete(difftests.tests_prompt(path, hunks, keys), max_tokens=4000)
+    return parse_keyed_sections(response, difftests.SECTION_PREFIX, keys, "Tests for one hunk",
+                                repair=_instructor_repair, retry_budget=REPAIR_RETRY_BUDGET)
+
+def _generate_tests_for_modules(modules, parallelism, cache_dir):
+    # Returns {path: {hunk key: tests}} for every hunk that has tests
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from . import difftests
+
+    tests = {path: {} for path in modules}
+    work = []
+    for path, hunks in modules.items():
+        missing = []
+        for hunk in hunks:
+            key = hunk.key(COMPRESSION_MODEL)
+            cached = _cache_get(cache_dir, key) if cache_dir else None
+            if cached is not None:
+                tests[path][key] = cached["text"]
+            else:
+                missing.append(hunk)
+        metrics.add("hunks", len(hunks))
+        metrics.add("hunks_cached", len(hunks) - len(missing))
+        work.extend((path, batch) for batch in difftests.batch_hunks(missing, TESTGEN_BATCH_TOKENS, _estimate_tokens))
+    logger.info("Generating tests for %s uncached hunks in %s requests",
+                sum(len(batch) for _, batch in work), len(work))
+
+    if work:
+        with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+            futures = {pool.submit(_generate_hunk_tests, path, batch): path for path, batch in work}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    generated = future.result()
+                except Exception as e:
+                    logger.error("Error generating tests for %s: %s", path, e)
+                    logger.exception("Detailed error information:")
+                    continue
+                tests[path].update(generated)
+                if cache_dir:
+                    for key, text in generated.items():
+                        _cache_put(cache_dir, key, {"created": time.time(), "text": text})
+    return tests
+
+# ========================
+# Incremental Review
+# ========================
+
+REVIEW_BATCH_TOKENS = 30000
+
+def _review_batch(project_name, batch):
+    from . import review
+    from .schemas import parse_keyed_sections
+
+    response = _complete(review.review_prompt(project_name, batch), max_tokens=4000)
+    findings = parse_keyed_sections(response, review.SECTION_PREFIX, [review.file_key(path) for path, _ in batch],
+                                    "Review findings for one file", repair=_instructor_repair,
+                                    retry_budget=REPAIR_RETRY_BUDGET)
+    return {path: findings[review.file_key(path)] for path, _ in batch}
+
+def _review_files(project_name, project_dir, context_dir, parallelism, batch_tokens):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from . import review
+
+    manifest_file = os.path.join(context_dir, review.MANIFEST_FILE)
+    manifest = review.load_manifest(manifest_file, COMPRESSION_MODEL)
+    paths = review.source_files(project_dir)
+    current, stale, files_read = review.scan(project_dir, paths, manifest)
+    metrics.add("files_scanned", len(paths))
+    logger.info("Reviewing %s of %s files (%s re-read, %s reused)", len(stale), len(paths), files_read,
+                len(paths) - len(stale))
+
+    def save():
+        manifest["files"] = {path: record for path, record in current.items() if "findings" in record}
+        _atomic_write(manifest_file, json.dumps(manifest, indent=1, sort_keys=True))
+
+    pending = []
+    for path in stale:
+        text = review.read_source(project_dir, path)
+        if text.strip():
+            pending.append((path, text))
+        else:
+            current[path]["findings"] = review.NO_ISSUES
+    batches = review.batch_files(pending, batch_tokens, _estimate_tokens)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+        futures = [pool.submit(_review_batch, project_name, batch) for batch in batches]
+        for future in as_completed(futures):
+            try:
+                findings = future.result()
+            except Exception as e:
+                failed += 1
+                logger.error("Error reviewing a batch of files: %s", e)
+                logger.exception("Detailed error information:")
+                continue
+            for path, text in findings.items():
+                current[path]["findings"] = text
+            # Persist as batches land, so an interrupted review resumes from here
+            save()
+    save()
+    return current, len(stale), failed
+
+# ========================
+# Performance Tests
+# ========================
+
+# generate_performance_tests runs the project's benchmarks (see perf.py),
+# asking the model to write a first benchmark module when there is none. The
+# first run's samples become the baseline in .context/perf_baseline.json,
+# committed onto the snapshot ref next to snapshot.md; later runs are gated
+# against it.
+PERF_CONTEXT_TOKENS = 40000
+
+def _benchmark_prompt(project_name, sources):
+    files = "\n\n".join(f"[FILE {path}]\n{text}\n[/FILE]" for path, text in sources)
+    return f"""Human: Write a Python benchmark module for the {project_name} project, whose source follows.
+
+Define one function per benchmark, named bench_<what_it_measures>, taking no arguments. Cover the
+hot paths: fast, frequently called functions (micro-benchmarks) as well as end-to-end operations
+such as a request handled or a batch processed (macro-benchmarks). Do any setup at module level so
+that only the measured work runs inside each function. Import the project's modules by their
+package names; do not use the network or external services, and do not time anything yourself.
+
+{files}
+
+Format your response as follows:
+[BENCHMARK_CODE]
+(the complete Python module)
+[/BENCHMARK_CODE]
+
+Assistant: """
+
+def _generate_benchmarks(project_name, project_dir, bench_file):
+    from . import review
+    from .schemas import BenchmarkModule, parse_response
+
+    sources, used = [], 0
+    for path in review.source_files(project_dir):
+        if not path.endswith('.py') or os.path.basename(path).startswith(('test_', 'bench_')):
+            continue
+        text = review.read_source(project_dir, path)
+        tokens = _estimate_tokens(text)
+        if used + tokens <= PERF_CONTEXT_TOKENS:
+            sources.append((path, text))
+            used += tokens
+
+    response = _complete(_benchmark_prompt(project_name, sources), max_tokens=4000)
+    code = parse_response(response, BenchmarkModule, repair=_instructor_repair,
+                          retry_budget=REPAIR_RETRY_BUDGET).code
+    code = _strip_fences(code)
+    compile(code, bench_file, 'exec')
+    os.makedirs(os.path.dirname(bench_file), exist_ok=True)
+    _atomic_write(bench_file, code)
+    logger.info("Wrote generated benchmarks to %s", bench_file)
+
+# ========================
+# Repo Map
+# ========================
+
+# edit_project_code and generate_new_project_code send the model the
+# signatures of the most relevant files from the repo map (see repomap.py),
+# cut to REPO_MAP_TOKENS, instead of whole files. The map in
+# .context/.repo_map.json is brought up to date before each use. The
+# project's requirements come from snapshot.md.
+REPO_MAP_TOKENS = 4000
+REQUIREMENTS_TOKENS = 8000
+CODE_MAX_TOKENS = 8000
+DEFAULT_EDIT_INSTRUCTIONS = ("Fix bugs and add missing error handling, keeping the file's behaviour and public "
+                             "interface otherwise unchanged.")
+
+def _load_repo_map(project_dir, context_dir):
+    from . import repomap
+
+    map_file = os.path.join(context_dir, repomap.MAP_FILE)
+    repo_map = repomap.load(map_file)
+    parsed, changed = repomap.update(project_dir, repo_map)
+    metrics.add("files_scanned", len(repo_map["files"]))
+    if changed or not os.path.exists(map_file):
+        os.makedirs(context_dir, exist_ok=True)
+        _atomic_write(map_file, json.dumps(repo_map, separators=(',', ':')))
+    logger.info("Repo map has %s files, %s parsed", len(repo_map["files"]), parsed)
+    return repo_map
+
+def _repo_context(repo_map, target=None):
+    from . import repomap
+
+    focus = repo_map["files"].get(target, {}).get("refs", ())
+    text = repomap.render(repo_map, repomap.related(repo_map, target), REPO_MAP_TOKENS, _estimate_tokens, focus)
+    metrics.add("tokens_saved", max(0, repomap.repo_tokens(repo_map) - _estimate_tokens(text)))
+    return text
+
+def _read_requirements(context_dir):
+    snapshot_file = os.path.join(context_dir, 'snapshot.md')
+    if not os.path.exists(snapshot_file):
+        return ""
+    with open(snapshot_file, 'r') as f:
+        return _split_to_budget(f.read(), REQUIREMENTS_TOKENS)[0]
+
+def _edit_prompt(project_name, path, text, instructions, requirements, related):
+    notes = f"Project notes:\n{requirements}\n\n" if requirements else ""
+    return f"""Human: Edit {path} in the {project_name} project.
+
+Instructions: {instructions}
+
+{notes}Signatures from related files in the project (bodies omitted; use them only as shown):
+{related or "(none)"}
+
+Current contents of {path}:
+[FILE {path}]
+{text}
+[/FILE]
+
+Format your response as follows:
+[FILE_TEXT]
+(the complete new contents of {path})
+[/FILE_TEXT]
+
+[SUMMARY]
+(one or two sentences describing the change)
+[/SUMMARY]
+
+Assistant: """
+
+def _new_code_prompt(project_name, language, requirements, existing):
+    existing = (f"The project already contains these files (signatures only); build on them and do not "
+                f"rewrite them:\n{existing}\n\n" if existing else "")
+    return f"""Human: Write the initial {language} code for the {project_name} project from its requirements.
+
+Requirements:
+{requirements}
+
+{existing}Lay the code out the way a {language} project of this kind usually is, with a minimal build or
+dependency file and tests for the core logic. Give every file with its path relative to the project root:
+[FILE path/to/file]
+(the complete file)
+[/FILE]
+
+Assistant: """
 
 # ========================
 # Entrypoint Functions
 # ========================
 
 def create_prd(project_context_file):
-    logger.info(f"[NO-OP] Executing create_prd with project_context_file: {project_context_file}")
+    logger.info("[NO-OP] Executing create_prd with project_context_file: %s", project_context_file)
     pass
 
 def edit_prd(project_name, prd_file):
-    logger.info(f"[NO-OP] Executing edit_prd with project_name: {project_name}, prd_file: {prd_file}")
+    logger.info("[NO-OP] Executing edit_prd with project_name: %s, prd_file: %s", project_name, prd_file)
     pass
 
 def start_project(project_name):
-    logger.info(f"[NO-OP] Executing start_project with project_name: {project_name}")
+    logger.info("[NO-OP] Executing start_project with project_name: %s", project_name)
     pass
 
 def git_push(project_name, commit_message):
-    logger.info(f"[NO-OP] Executing git_push with project_name: {project_name}, commit_message: {commit_message}")
+    logger.info("[NO-OP] Executing git_push with project_name: %s, commit_message: %s", project_name, commit_message)
     pass
 
-def run_tests(project_name):
-    logger.info(f"[NO-OP] Executing run_tests with project_name: {project_name}")
-    pass
+@metrics.timed("run_tests")
+def run_tests(project_name, workers=None, run_all=False, changed_only=False, pytest_args=()):
+    from . import testrunner
+
+    logger.info("Executing run_tests with project_name: %s", project_name)
+    context_dir = _get_context_dir(project_name)
+    project_dir = os.path.dirname(os.path.abspath(context_dir))
+    os.makedirs(context_dir, exist_ok=True)
+
+    result = testrunner.run(project_dir, os.path.join(context_dir, testrunner.RESULTS_FILE), _atomic_write,
+                            workers=workers, run_all=run_all, changed_only=changed_only, pytest_args=pytest_args)
+    metrics.add("files_scanned", result["files"])
+    summary = testrunner.failure_summary(result)
+    print(summary)
+
+    _record_cot_note(project_name, context_dir, summary)
+    return result
 
 def deploy(project_name):
-    logger.info(f"[NO-OP] Executing deploy with project_name: {project_name}")
+    logger.info("[NO-OP] Executing deploy with project_name: %s", project_name)
     pass
 
 
+@metrics.timed("generate_new_project_code")
 def generate_new_project_code(project_name, language):
-    logger.info(f"[NO-OP] Executing generate_new_project_code with project_name: {project_name}, language: {language}")
-    pass
+    from .schemas import extract_files
+
+    logger.info("Executing generate_new_project_code with project_name: %s, language: %s", project_name, language)
+    context_dir = _get_context_dir(project_name)
+    project_dir = os.path.dirname(os.path.abspath(context_dir))
+    requirements = _read_requirements(context_dir)
+    if not requirements:
+        logger.error("No requirements in %s; record them in the CoT journal and run compress_cot first",
+                     os.path.join(context_dir, 'snapshot.md'))
+        return
 
-def edit_project_code(project_name, file_path):
-    logger.info(f"[NO-OP] Executing edit_project_code with project_name: {project_name}, file_path: {file_path}")
-    pass
+    try:
+        existing = _repo_context(_load_repo_map(project_dir, context_dir))
+        response = _complete(_new_code_prompt(project_name, language, requirements, existing),
+                             max_tokens=CODE_MAX_TOKENS)
+    except Exception as e:
+        logger.error("Error generating project code: %s", e)
+        logger.exception("Detailed error information:")
+        return
+    files = extract_files(response)
+    if not files:
+        logger.error("The response contained no files")
+        return
 
-def generate_tests_for_diff(project_name, diff_file):
-    logger.info(f"[NO-OP] Executing generate_tests_for_diff with project_name: {project_name}, diff_file: {diff_file}")
-    pass
+    written = []
+    for path, text in files.items():
+        full_path = os.path.normpath(os.path.join(project_dir, path))
+        parts = os.path.relpath(full_path, project_dir).split(os.sep)
+        if os.path.isabs(path) or parts[0] in ('..', '.git', '.context'):
+            logger.warning("Skipping generated file outside the project: %s", path)
+            continue
+        if os.path.exists(full_path):
+            logger.warning("Not overwriting existing file: %s", path)
+            continue
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'x') as f:
+            f.write(_strip_fences(text))
+        written.append(path)
+
+    _record_cot_note(project_name, context_dir, f"Generated initial {language} code: {', '.join(written) or 'no files'}")
+    print(f"Generated {len(written)} files")
+    return written
+
+@metrics.timed("edit_project_code")
+def edit_project_code(project_name, file_path, instructions=None):
+    import stat
+    from .schemas import CodeEdit, parse_response
+
+    logger.info("Executing edit_project_code with project_name: %s, file_path: %s", project_name, file_path)
+    context_dir = _get_context_dir(project_name)
+    project_dir = os.path.dirname(os.path.abspath(context_dir))
+    full_path = os.path.abspath(file_path)
+    path = os.path.relpath(full_path, project_dir)
+    if path.startswith('..') or not os.path.isfile(full_path):
+        logger.error("Not a file in the project: %s", file_path)
+        return
+    with open(full_path, 'r') as f:
+        text = f.read()
 
-def review_and_refactor(project_name):
-    logger.info(f"[NO-OP] Executing review_and_refactor with project_name: {project_name}")
-    pass
+    try:
+        repo_map = _load_repo_map(project_dir, context_dir)
+        prompt = _edit_prompt(project_name, path, text, instructions or DEFAULT_EDIT_INSTRUCTIONS,
+                              _read_requirements(context_dir), _repo_context(repo_map, path.replace(os.sep, '/')))
+        response = _complete(prompt, max_tokens=CODE_MAX_TOKENS)
+        edit = parse_response(response, CodeEdit, repair=_instructor_repair, retry_budget=REPAIR_RETRY_BUDGET)
+    except Exception as e:
+        logger.error("Error editing %s: %s", path, e)
+        logger.exception("Detailed error information:")
+        return
 
-def generate_performance_tests(project_name):
-    logger.info(f"[NO-OP] Executing generate_performance_tests with project_name: {project_name}")
-    pass
+    mode = stat.S_IMODE(os.stat(full_path).st_mode)
+    _atomic_write(full_path, _strip_fences(edit.file_text))
+    os.chmod(full_path, mode)
+    _record_cot_note(project_name, context_dir, f"Edited {path}: {edit.summary}")
+    print(f"Edited {path}: {edit.summary}")
+    return full_path
+
+@metrics.timed("generate_tests_for_diff")
+def generate_tests_for_diff(project_name, diff_file, parallelism=DEFAULT_PARALLELISM, use_cache=True):
+    from . import difftests
+
+    logger.info("Executing generate_tests_for_diff with project_name: %s, diff_file: %s", project_name, diff_file)
+    context_dir = _get_context_dir(project_name)
+    try:
+        with open(diff_file, 'r') as f:
+            diff = f.read()
+    except IOError as e:
+        logger.error("Error reading diff file: %s", e)
+        logger.exception("Detailed error information:")
+        return
+    metrics.add("bytes_read", len(diff.encode('utf-8')))
+
+    modules = difftests.group_by_module(difftests.parse_unified_diff(diff))
+    if not modules:
+        logger.warning("No source changes found in %s", diff_file)
+        return {}
+
+    cache_dir = _cache_dir(context_dir, use_cache)
+    tests = _generate_tests_for_modules(modules, parallelism,
+                                        os.path.join(cache_dir, TESTGEN_CACHE_DIR) if cache_dir else None)
+
+    written = {}
+    for path, hunks in modules.items():
+        keys = [hunk.key(COMPRESSION_MODEL) for hunk in hunks]
+        sections = [tests[path][key] for key in keys if key in tests[path]]
+        if len(sections) < len(keys):
+            logger.warning("No tests generated for %s of %s hunks in %s", len(keys) - len(sections), len(keys), path)
+        if not sections:
+            continue
+        test_file = os.path.join(context_dir, GENERATED_TESTS_DIR, difftests.generated_test_path(path))
+        os.makedirs(os.path.dirname(test_file), exist_ok=True)
+        _atomic_write(test_file, difftests.assemble_test_file(path, sections))
+        written[path] = test_file
+        print(test_file)
+    logger.info("Wrote tests for %s of %s modules", len(written), len(modules))
+    return written
+
+@metrics.timed("review_and_refactor")
+def review_and_refactor(project_name, parallelism=DEFAULT_PARALLELISM, batch_tokens=REVIEW_BATCH_TOKENS):
+    from . import review
+
+    logger.info("Executing review_and_refactor with project_name: %s", project_name)
+    context_dir = _get_context_dir(project_name)
+    project_dir = os.path.dirname(os.path.abspath(context_dir))
+    os.makedirs(context_dir, exist_ok=True)
+
+    files, reviewed, failed = _review_files(project_name, project_dir, context_dir, parallelism, batch_tokens)
+    report_file = os.path.join(context_dir, review.REPORT_FILE)
+    _atomic_write(report_file, review.render_report(project_name, files))
+    if failed:
+        logger.warning("%s review batches failed; re-run to retry them", failed)
+    logger.info("Reviewed %s changed files, report written to %s", reviewed, report_file)
+    print(report_file)
+    return report_file
+
+@metrics.timed("generate_performance_tests")
+def generate_performance_tests(project_name, threshold=None, warmup=None, repeat=None, update_baseline=False,
+                               regenerate=False):
+    from . import gitstore, perf
+
+    logger.info("Executing generate_performance_tests with project_name: %s", project_name)
+    context_dir = _get_context_dir(project_name)
+    project_dir = os.path.dirname(os.path.abspath(context_dir))
+    os.makedirs(context_dir, exist_ok=True)
+    threshold = perf.DEFAULT_THRESHOLD if threshold is None else threshold
+
+    bench_files = perf.discover(project_dir)
+    if regenerate or not bench_files:
+        bench_file = os.path.join(project_dir, perf.BENCHMARK_DIR,
+                                  f"bench_{re.sub(r'[^0-9A-Za-z]+', '_', project_name).strip('_').lower()}.py")
+        try:
+            _generate_benchmarks(project_name, project_dir, bench_file)
+        except Exception as e:
+            logger.error("Could not generate benchmarks: %s", e)
+            logger.exception("Detailed error information:")
+            return
+        bench_files = perf.discover(project_dir)
+
+    try:
+        results = perf.run(project_dir, bench_files, warmup=warmup, repeat=repeat,
+                           log=lambda key: logger.info("Running benchmark %s", key))
+    except Exception as e:
+        logger.error("Error running benchmarks: %s", e)
+        logger.exception("Detailed error information:")
+        return
+    _atomic_write(os.path.join(context_dir, perf.RESULTS_FILE), perf.dumps(results))
+
+    baseline_file = os.path.join(context_dir, perf.BASELINE_FILE)
+    baseline = perf.load(baseline_file)
+    rows = perf.compare(baseline or {}, results, threshold)
+    regressions = [row for row in rows if row["status"] == "regressed"]
+    print(perf.format_table(rows))
+
+    # The baseline only moves when asked to (and nothing regressed); new
+    # benchmarks are added to it as they appear
+    new = [row["benchmark"] for row in rows if row["status"] == "new"]
+    if update_baseline and not regressions:
+        updated = results
+    elif new:
+        updated = {**(baseline or {}), **{key: results[key] for key in new}}
+    else:
+        updated = None
+    if updated is not None:
+        content = perf.dumps(updated)
+        _atomic_write(baseline_file, content)
+        try:
+            gitstore.commit_files(context_dir, {perf.BASELINE_FILE: content.encode('utf-8')},
+                                  f"Update performance baseline for {project_name} ({len(updated)} benchmarks)")
+        except (gitstore.GitError, OSError) as e:
+            logger.warning("Performance baseline written but not committed: %s", e)
+
+    if regressions:
+        logger.error("%s benchmarks regressed by more than %.0f%%", len(regressions), threshold * 100)
+    return {"rows": rows, "regressions": regressions}
 
 def upgrade_dependencies(project_name):
-    logger.info(f"[NO-OP] Executing upgrade_dependencies with project_name: {project_name}")
+    logger.info("[NO-OP] Executing upgrade_dependencies with project_name: %s", project_name)
     pass
 
 def bootstrap_database_migrations(project_name):
-    logger.info(f"[NO-OP] Executing bootstrap_database_migrations with project_name: {project_name}")
+    logger.info("[NO-OP] Executing bootstrap_database_migrations with project_name: %s", project_name)
     pass
 
 def generate_docs_snapshot(project_name):
-    logger.info(f"[NO-OP] Executing generate_docs_snapshot with project_name: {project_name}")
+    logger.info("[NO-OP] Executing generate_docs_snapshot with project_name: %s", project_name)
     pass
 
 def generate_or_update_local_deployment(project_name):
-    logger.info(f"[NO-OP] Executing generate_or_update_local_deployment with project_name: {project_name}")
+    logger.info("[NO-OP] Executing generate_or_update_local_deployment with project_name: %s", project_name)
     pass
 
 def generate_or_update_production_deployment(project_name):
-    logger.info(f"[NO-OP] Executing generate_or_update_production_deployment with project_name: {project_name}")
+    logger.info("[NO-OP] Executing generate_or_update_production_deployment with project_name: %s", project_name)
     pass
 
-def main():
+def create_cot(project_name, context, format='md'):
+    logger.info("Executing create_cot with project_name: %s, format: %s", project_name, format)
+    return _create_cot(project_name, context, format=format)
+
+def update_cot(project_name, context, format='md'):
+    logger.info("Executing update_cot with project_name: %s, format: %s", project_name, format)
+    return _update_cot(project_name, context, format=format)
+
+def compress_cot(project_name, full=False, batch_tokens=DEFAULT_BATCH_TOKENS, parallelism=DEFAULT_PARALLELISM,
+                 use_cache=True, stream=False, dedup=True):
+    logger.info("Executing compress_cot with project_name: %s, full: %s", project_name, full)
+    return _compress_cot(project_name, full=full, batch_tokens=batch_tokens, parallelism=parallelism,
+                         use_cache=use_cache, stream=stream, dedup=dedup)
+
+def compress_all(roots, concurrency=DEFAULT_FLEET_CONCURRENCY, full=False, batch_tokens=DEFAULT_BATCH_TOKENS,
+                 parallelism=DEFAULT_PARALLELISM, use_cache=True, max_depth=3, dedup=True):
+    import asyncio
+
+    logger.info("Executing compress_all with roots: %s, concurrency: %s", roots, concurrency)
+    context_dirs = _discover_context_dirs(roots, max_depth)
+    if not context_dirs:
+        logger.error("No .context directories found under: %s", roots)
+        return []
+    logger.info("Compressing %s projects", len(context_dirs))
+
+    results = asyncio.run(_compress_all_async(context_dirs, concurrency, full, batch_tokens, parallelism, use_cache,
+                                              dedup))
+    print(_format_summary_table(results))
+    return results
+
+def pack_cot(project_name, codec='zlib'):
+    logger.info("Executing pack_cot with project_name: %s, codec: %s", project_name, codec)
+    context_dir = _get_context_dir(project_name)
+    if not os.path.exists(context_dir):
+        logger.error("Context directory does not exist: %s", context_dir)
+        return
+    try:
+        records = _pack_cot(context_dir, codec)
+    except (OSError, ValueError) as e:
+        logger.error("Error packing CoT entries: %s", e)
+        logger.exception("Detailed error information:")
+        return
+    print(f"Packed {len(records)} CoT entries")
+    return records
+
+def rebuild_cot_index(project_name):
+    logger.info("Executing rebuild_cot_index with project_name: %s", project_name)
+    context_dir = _get_context_dir(project_name)
+    if not os.path.exists(context_dir):
+        logger.error("Context directory does not exist: %s", context_dir)
+        return
+    import sqlite3
+    with _cot_lock(context_dir):
+        index = _rebuild_cot_index(context_dir)
+        try:
+            _rebuild_search_index(context_dir)
+        except sqlite3.Error as e:
+            logger.error("Error rebuilding the CoT search index: %s", e)
+            logger.exception("Detailed error information:")
+        return index
+
+def migrate_cot_json(project_name):
+    logger.info("Executing migrate_cot_json with project_name: %s", project_name)
+    context_dir = _get_context_dir(project_name)
+    if not os.path.exists(context_dir):
+        logger.error("Context directory does not exist: %s", context_dir)
+        return
+    return _migrate_cot_json(context_dir)
+
+@metrics.timed("search_cot")
+def search_cot(query, project_name=None, limit=None, since=None, until=None):
+    import sqlite3
+    from . import search
+
+    logger.info("Executing search_cot with query: %s, project_name: %s", query, project_name)
+    context_dir = _get_context_dir(project_name)
+    if not os.path.exists(context_dir):
+        logger.error("Context directory does not exist: %s", context_dir)
+        return
+    try:
+        if not os.path.exists(search.db_path(context_dir)):
+            with _cot_lock(context_dir):
+                _rebuild_search_index(context_dir)
+        results = search.search(context_dir, query, limit=limit or search.DEFAULT_LIMIT,
+                                project=project_name, since=since, until=until)
+    except sqlite3.Error as e:
+        logger.error("Error searching the CoT journal: %s", e)
+        logger.exception("Detailed error information:")
+        return
+
+    for result in results:
+        print(f"#{result['entry']}  {result['created']}  {result['kind']}  {result['project']}  (score {result['score']})")
+        print(f"    {' '.join(result['snippet'].split())}")
+    if not results:
+        print("No matching CoT entries")
+    return results
+
+# ========================
+# Daemon
+# ========================
+
+def manage_daemon(command, detach=False):
+    from . import daemon as daemon_server
+
+    path = daemon_server.socket_path()
+    if command == "status" or (command == "start" and detach):
+        status = daemon_server.control("status", path)
+        if status is None and command == "start":
+            status = daemon_server.spawn([sys.executable, "-m", "locohost_cli.locohost", "daemon", "start"], path)
+        if status is None:
+            print(f"No locohost daemon is running on {path}")
+            return 1
+        print(f"locohost daemon {status['pid']} on {status['socket']}: up {status['uptime_s']}s, "
+              f"{status['served']} requests served")
+        return 0
+    if command == "stop":
+        if daemon_server.control("stop", path) is None:
+            print(f"No locohost daemon is running on {path}")
+            return 1
+        return 0
+
+    # Warm everything a request would otherwise pay for on first use
+    import importlib
+    for module in ("sqlite3", "locohost_cli.dedup", "locohost_cli.schemas", "locohost_cli.search"):
+        importlib.import_module(module)
+    try:
+        _get_client()
+    except Exception as e:
+        logger.warning("Could not create the Anthropic client ahead of time: %s", e)
+    # Building the parser costs more than most journal writes, so it is built once
+    parser = _build_parser()
+    return 0 if daemon_server.serve(lambda argv, log_stream: _run_in_daemon(parser, argv, log_stream), path) else 1
+
+def _positive_int(value):
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
+def _build_parser():
     parser = argparse.ArgumentParser(description="AI-assisted project management and development tool for Kubernetes-based applications")
+    parser.add_argument("--log-level", default=os.environ.get("LOCOHOST_LOG_LEVEL", "WARNING"), type=str.upper,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], help="Logging verbosity (default: $LOCOHOST_LOG_LEVEL or WARNING)")
+    parser.add_argument("--metrics-json", default=os.environ.get("LOCOHOST_METRICS_JSON"), help="Write timing, I/O and API usage metrics as JSON to this file ('-' for stdout)")
     subparsers = parser.add_subparsers(dest="action", help="Action to perform")
 
     # create_prd
@@ -320,6 +2009,10 @@ def main():
     # run_tests
     run_tests_parser = subparsers.add_parser("run_tests", help="Analyze test results for the project")
     run_tests_parser.add_argument("--project-name", required=True, help="Name of the project")
+    run_tests_parser.add_argument("--workers", type=int, help="Number of pytest processes to shard the suite across (default: CPU count)")
+    run_tests_parser.add_argument("--all", action="store_true", help="Run every test file, ignoring cached passes")
+    run_tests_parser.add_argument("--changed-only", action="store_true", help="Only run test files affected by the working-tree diff")
+    run_tests_parser.add_argument("pytest_args", nargs="*", help="Extra arguments passed to pytest (after --)")
 
     # deploy
     deploy_parser = subparsers.add_parser("deploy", help="Analyze deployment information for the project")
@@ -334,19 +2027,29 @@ def main():
     edit_project_code_parser = subparsers.add_parser("edit_project_code", help="Edit existing project code with AI assistance")
     edit_project_code_parser.add_argument("--project-name", required=True, help="Name of the project")
     edit_project_code_parser.add_argument("--file-path", required=True, help="Path to the file to edit")
+    edit_project_code_parser.add_argument("--instructions", help="What to change (default: fix bugs and add missing error handling)")
 
     # generate_tests_for_diff
     generate_tests_for_diff_parser = subparsers.add_parser("generate_tests_for_diff", help="Generate tests for a specific diff using Aider")
     generate_tests_for_diff_parser.add_argument("--project-name", required=True, help="Name of the project")
     generate_tests_for_diff_parser.add_argument("--diff-file", required=True, help="Path to the diff file")
+    generate_tests_for_diff_parser.add_argument("--parallelism", type=int, default=DEFAULT_PARALLELISM, help="Number of test generation requests in flight at once")
+    generate_tests_for_diff_parser.add_argument("--no-cache", action="store_true", help="Regenerate tests for every hunk instead of reusing cached ones")
 
     # review_and_refactor
     review_and_refactor_parser = subparsers.add_parser("review_and_refactor", help="Improve code quality while maintaining existing functionality")
     review_and_refactor_parser.add_argument("--project-name", required=True, help="Name of the project")
+    review_and_refactor_parser.add_argument("--parallelism", type=int, default=DEFAULT_PARALLELISM, help="Number of review requests in flight at once")
+    review_and_refactor_parser.add_argument("--batch-tokens", type=_positive_int, default=REVIEW_BATCH_TOKENS, help="Approximate token budget per review request")
 
     # generate_performance_tests
     generate_performance_tests_parser = subparsers.add_parser("generate_performance_tests", help="Create tests to measure and ensure application performance")
     generate_performance_tests_parser.add_argument("--project-name", required=True, help="Name of the project")
+    generate_performance_tests_parser.add_argument("--threshold", type=float, default=0.10, help="Slowdown of the median, as a fraction, that fails the run when significant (default 0.10)")
+    generate_performance_tests_parser.add_argument("--warmup", type=int, help="Warmup samples discarded per benchmark (default 2)")
+    generate_performance_tests_parser.add_argument("--repeat", type=int, help="Samples kept per benchmark (default 15)")
+    generate_performance_tests_parser.add_argument("--update-baseline", action="store_true", help="Replace the baseline with this run's results when nothing regressed")
+    generate_performance_tests_parser.add_argument("--regenerate", action="store_true", help="Ask the model for a new benchmark module even if benchmarks exist")
 
     # upgrade_dependencies
     upgrade_dependencies_parser = subparsers.add_parser("upgrade_dependencies", help="Safely update project dependencies to their latest compatible versions")
@@ -368,8 +2071,117 @@ def main():
     generate_or_update_production_deployment_parser = subparsers.add_parser("generate_or_update_production_deployment", help="Prepare or update Kubernetes configurations for production deployment")
     generate_or_update_production_deployment_parser.add_argument("--project-name", required=True, help="Name of the project")
 
-    args = parser.parse_args()
+    # create_cot
+    create_cot_parser = subparsers.add_parser("create_cot", help="Start a new CoT journal entry")
+    create_cot_parser.add_argument("--project-name", required=True, help="Name of the project")
+    create_cot_parser.add_argument("--context", required=True, help="Text of the entry")
+    create_cot_parser.add_argument("--format", choices=["md", "json", "jsonl"], default="md", help="Journal format of the entry")
+
+    # update_cot
+    update_cot_parser = subparsers.add_parser("update_cot", help="Append an update to the latest CoT journal entry")
+    update_cot_parser.add_argument("--project-name", required=True, help="Name of the project")
+    update_cot_parser.add_argument("--context", required=True, help="Text of the update")
+    update_cot_parser.add_argument("--format", choices=["md", "json", "jsonl"], default="md", help="Journal format of the entry to update")
+
+    # compress_cot
+    compress_cot_parser = subparsers.add_parser("compress_cot", help="Compress new CoT entries into snapshot.md and commit it")
+    compress_cot_parser.add_argument("--project-name", required=True, help="Name of the project")
+    compress_cot_parser.add_argument("--full", action="store_true", help="Re-compress the whole journal instead of only the entries added since the last snapshot")
+    compress_cot_parser.add_argument("--batch-tokens", type=_positive_int, default=DEFAULT_BATCH_TOKENS, help="Approximate token budget per request when the journal is compressed in batches")
+    compress_cot_parser.add_argument("--parallelism", type=int, default=DEFAULT_PARALLELISM, help="Number of batches summarized concurrently")
+    compress_cot_parser.add_argument("--no-cache", action="store_true", help="Always call the API instead of reusing cached responses from .context/.cache")
+    compress_cot_parser.add_argument("--no-dedup", action="store_true", help="Send repeated and near-identical updates verbatim instead of collapsing them")
+    compress_cot_parser.add_argument("--stream", action="store_true", help="Stream the snapshot into snapshot.md.partial as it is generated; an interrupted run resumes from it")
+
+    # compress_all
+    compress_all_parser = subparsers.add_parser("compress_all", help="Compress the CoT journals of many projects concurrently")
+    compress_all_parser.add_argument("--roots", nargs="+", required=True, help="Directories or glob patterns to search for .context directories")
+    compress_all_parser.add_argument("--concurrency", type=int, default=DEFAULT_FLEET_CONCURRENCY, help="Number of API requests in flight at once across all projects")
+    compress_all_parser.add_argument("--max-depth", type=int, default=3, help="How many directory levels below each root to search")
+    compress_all_parser.add_argument("--full", action="store_true", help="Re-compress each whole journal")
+    compress_all_parser.add_argument("--batch-tokens", type=_positive_int, default=DEFAULT_BATCH_TOKENS, help="Approximate token budget per request")
+    compress_all_parser.add_argument("--parallelism", type=int, default=DEFAULT_PARALLELISM, help="Batches summarized concurrently within one large journal")
+    compress_all_parser.add_argument("--no-cache", action="store_true", help="Always call the API instead of reusing cached responses")
+    compress_all_parser.add_argument("--no-dedup", action="store_true", help="Send repeated and near-identical updates verbatim")
+
+    # rebuild_cot_index
+    rebuild_cot_index_parser = subparsers.add_parser("rebuild_cot_index", help="Rebuild the CoT journal index from the files in .context")
+    rebuild_cot_index_parser.add_argument("--project-name", required=True, help="Name of the project")
+
+    # pack_cot
+    pack_cot_parser = subparsers.add_parser("pack_cot", help="Move CoT entries already in snapshot.md into compressed segments")
+    pack_cot_parser.add_argument("--project-name", required=True, help="Name of the project")
+    pack_cot_parser.add_argument("--codec", choices=["zlib", "lzma"], default="zlib", help="Compression for new blocks: zlib is faster, lzma smaller")
+
+    # migrate_cot_json
+    migrate_cot_json_parser = subparsers.add_parser("migrate_cot_json", help="Convert cot_*.json entries to the append-only jsonl format")
+    migrate_cot_json_parser.add_argument("--project-name", required=True, help="Name of the project")
+
+    # search_cot
+    search_cot_parser = subparsers.add_parser("search_cot", help="Full-text search over the CoT journal")
+    search_cot_parser.add_argument("--query", required=True, help="Search terms; FTS5 syntax (AND, OR, NOT, \"phrases\", prefix*) is supported")
+    search_cot_parser.add_argument("--project-name", help="Only return entries recorded for this project")
+    search_cot_parser.add_argument("--limit", type=int, default=20, help="Maximum number of results")
+    search_cot_parser.add_argument("--since", help="Only return blocks written at or after this time (YYYY-MM-DD[ HH:MM:SS])")
+    search_cot_parser.add_argument("--until", help="Only return blocks written at or before this time (YYYY-MM-DD[ HH:MM:SS])")
+
+    # daemon
+    daemon_parser = subparsers.add_parser("daemon", help="Start, stop or query the warm locohost daemon")
+    daemon_parser.add_argument("command", choices=["start", "stop", "status"], help="What to do with the daemon")
+    daemon_parser.add_argument("--detach", action="store_true", help="With start: run the daemon in the background")
+
+    return parser
+
+# Only the short journal actions are forwarded to a running daemon. Anything
+# long-running would hold up every other client's journal writes, anything
+# that streams output would only show it at the end, and anything that
+# imports or runs the project's code (run_tests, generate_performance_tests)
+# would see stale modules and the daemon's environment, so it runs in-process.
+DAEMON_ACTIONS = ("create_cot", "update_cot", "search_cot")
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = _build_parser().parse_args(argv)
+    if args.action in DAEMON_ACTIONS:
+        # Hand the command to a running daemon, with the options this
+        # process resolved from its own environment
+        from . import daemon
+        forwarded = ["--log-level", args.log_level] + (["--metrics-json", args.metrics_json] if args.metrics_json else [])
+        code = daemon.forward(forwarded + argv)
+        if code is not None:
+            return code
+    logging.basicConfig(level=args.log_level, format=LOG_FORMAT)
+    return _run(args)
+
+def _run(args):
+    try:
+        return _dispatch(args)
+    finally:
+        if args.metrics_json:
+            metrics.write_json(args.metrics_json)
+
+def _run_in_daemon(parser, argv, log_stream):
+    # One forwarded command: logs go back to the client at its log level and
+    # metrics cover this command only
+    args = parser.parse_args(argv)
+    if args.action not in DAEMON_ACTIONS:
+        print(f"{args.action} is not run by the daemon; run it without one", file=sys.stderr)
+        return 2
+    root = logging.getLogger()
+    handler = logging.StreamHandler(log_stream)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.setLevel(args.log_level)
+    level = root.level
+    root.addHandler(handler)
+    root.setLevel(min(level, handler.level))
+    metrics.reset()
+    try:
+        return _run(args)
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(level)
 
+def _dispatch(args):
     if args.action == "create_prd":
         create_prd(args.project_context_file)
     elif args.action == "edit_prd":
@@ -379,19 +2191,25 @@ def main():
     elif args.action == "git_push":
         git_push(args.project_name, args.commit_message)
     elif args.action == "run_tests":
-        run_tests(args.project_name)
+        result = run_tests(args.project_name, workers=args.workers, run_all=args.all,
+                           changed_only=args.changed_only, pytest_args=args.pytest_args)
+        return 1 if result["failed"] else 0
     elif args.action == "deploy":
         deploy(args.project_name)
     elif args.action == "generate_new_project_code":
         generate_new_project_code(args.project_name, args.language)
     elif args.action == "edit_project_code":
-        edit_project_code(args.project_name, args.file_path)
+        edit_project_code(args.project_name, args.file_path, instructions=args.instructions)
     elif args.action == "generate_tests_for_diff":
-        generate_tests_for_diff(args.project_name, args.diff_file)
+        generate_tests_for_diff(args.project_name, args.diff_file, parallelism=args.parallelism,
+                                use_cache=not args.no_cache)
     elif args.action == "review_and_refactor":
-        review_and_refactor(args.project_name)
+        review_and_refactor(args.project_name, parallelism=args.parallelism, batch_tokens=args.batch_tokens)
     elif args.action == "generate_performance_tests":
-        generate_performance_tests(args.project_name)
+        result = generate_performance_tests(args.project_name, threshold=args.threshold, warmup=args.warmup,
+                                            repeat=args.repeat, update_baseline=args.update_baseline,
+                                            regenerate=args.regenerate)
+        return 1 if result is None or result["regressions"] else 0
     elif args.action == "upgrade_dependencies":
         upgrade_dependencies(args.project_name)
     elif args.action == "bootstrap_database_migrations":
@@ -402,8 +2220,29 @@ def main():
         generate_or_update_local_deployment(args.project_name)
     elif args.action == "generate_or_update_production_deployment":
         generate_or_update_production_deployment(args.project_name)
-
-def get_snapshot_data(context: str) -> dict:
+    elif args.action == "create_cot":
+        create_cot(args.project_name, args.context, format=args.format)
+    elif args.action == "update_cot":
+        update_cot(args.project_name, args.context, format=args.format)
+    elif args.action == "compress_cot":
+        compress_cot(args.project_name, full=args.full, batch_tokens=args.batch_tokens, parallelism=args.parallelism,
+                     use_cache=not args.no_cache, stream=args.stream, dedup=not args.no_dedup)
+    elif args.action == "compress_all":
+        compress_all(args.roots, concurrency=args.concurrency, full=args.full, batch_tokens=args.batch_tokens,
+                     parallelism=args.parallelism, use_cache=not args.no_cache, max_depth=args.max_depth,
+                     dedup=not args.no_dedup)
+    elif args.action == "rebuild_cot_index":
+        rebuild_cot_index(args.project_name)
+    elif args.action == "pack_cot":
+        pack_cot(args.project_name, codec=args.codec)
+    elif args.action == "migrate_cot_json":
+        migrate_cot_json(args.project_name)
+    elif args.action == "search_cot":
+        search_cot(args.query, project_name=args.project_name, limit=args.limit, since=args.since, until=args.until)
+    elif args.action == "daemon":
+        return manage_daemon(args.command, detach=args.detach)
+
+def get_snapshot_data(context: str, context_dir=None, use_cache=None) -> dict:
     prompt = f"""Human: Generate snapshot data based on this context: {context}
     
     Format your response as follows:
@@ -422,24 +2261,16 @@ def get_snapshot_data(context: str) -> dict:
     Assistant: 
     """
 
-    response = client.completions.create(
-        model="claude-3-5-sonnet-20240620",
-        max_tokens_to_sample=1000,
-        prompt=prompt
-    )
-
-    response_content = response.completion
+    # Cached only in a context directory the caller names, unless asked to
+    if use_cache is None:
+        use_cache = context_dir is not None
+    cache_dir = _cache_dir(_get_context_dir(None, context_dir), use_cache)
+    response_content = _complete(prompt, max_tokens=1000, cache_dir=cache_dir)
 
     # Extract data from the response
-    file_text = response_content.split("[FILE_TEXT]")[1].split("[/FILE_TEXT]")[0].strip()
-    commit_message = response_content.split("[COMMIT_MESSAGE]")[1].split("[/COMMIT_MESSAGE]")[0].strip()
-    changelog = response_content.split("[CHANGELOG]")[1].split("[/CHANGELOG]")[0].strip()
-
-    return {
-        "file_text": file_text,
-        "commit_message": commit_message,
-        "changelog": changelog
-    }
+    from .schemas import SnapshotData, parse_response
+    return parse_response(response_content, SnapshotData, repair=_instructor_repair,
+                          retry_budget=REPAIR_RETRY_BUDGET).model_dump()
 
 def _get_context_dir(project_name, context_dir=None):
     if context_dir is None:
@@ -448,4 +2279,4 @@ def _get_context_dir(project_name, context_dir=None):
     return context_dir
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,101 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# ========================
+# Metrics
+# ========================
+
+# Cheap in-process counters for the hot paths: wall time per operation, bytes
+# read and written, files scanned, and API latency and token usage. Counters
+# are always collected; the CLI writes them out as JSON when asked to, so
+# regressions can be tracked between versions.
+
+_lock = threading.Lock()
+_state = threading.local()
+_operations = {}
+_api = {}
+
+API_USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+
+def _operation(name):
+    op = _operations.get(name)
+    if op is None:
+        op = _operations[name] = {"calls": 0, "wall_s": 0.0, "bytes_read": 0, "bytes_written": 0,
+                                  "files_scanned": 0}
+    return op
+
+
+def current_operation():
+    stack = getattr(_state, "stack", None)
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def timed(name):
+    # Counters added inside the block are attributed to the innermost operation
+    stack = getattr(_state, "stack", None)
+    if stack is None:
+        stack = _state.stack = []
+    stack.append(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        with _lock:
+            op = _operation(name)
+            op["calls"] += 1
+            op["wall_s"] += elapsed
+
+
+def add(counter, amount=1, operation=None):
+    name = operation or current_operation() or "other"
+    with _lock:
+        op = _operation(name)
+        op[counter] = op.get(counter, 0) + amount
+
+
+def record_api_call(endpoint, latency, usage=None, cached=False):
+    with _lock:
+        api = _api.get(endpoint)
+        if api is None:
+            api = _api[endpoint] = {"calls": 0, "cache_hits": 0, "latency_s": 0.0, "max_latency_s": 0.0}
+            api.update({field: 0 for field in API_USAGE_FIELDS})
+        if cached:
+            api["cache_hits"] += 1
+            return
+        api["calls"] += 1
+        api["latency_s"] += latency
+        api["max_latency_s"] = max(api["max_latency_s"], latency)
+        for field in API_USAGE_FIELDS:
+            value = getattr(usage, field, None) if not isinstance(usage, dict) else usage.get(field)
+            if isinstance(value, int):
+                api[field] += value
+
+
+def report():
+    with _lock:
+        return {
+            "operations": {name: dict(op, wall_s=round(op["wall_s"], 6)) for name, op in _operations.items()},
+            "api": {name: dict(api, latency_s=round(api["latency_s"], 6), max_latency_s=round(api["max_latency_s"], 6))
+                    for name, api in _api.items()},
+        }
+
+
+def reset():
+    with _lock:
+        _operations.clear()
+        _api.clear()
+
+
+def write_json(path):
+    data = json.dumps(report(), indent=2, sort_keys=True)
+    if path == "-":
+        print(data)
+        return
+    with open(path, "w") as f:
+        f.write(data + "\n")
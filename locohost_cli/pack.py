@@ -0,0 +1,181 @@
+import json
+import lzma
+import mmap
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+# ========================
+# Packed CoT Segments
+# ========================
+
+# pack_cot moves CoT entries that are already folded into snapshot.md out of
+# their cot_* files and into append-only segment files under .context/packs.
+# Entries are grouped into blocks of about BLOCK_BYTES and each block is
+# compressed on its own, so reading one entry means decompressing one block,
+# not the segment. Every segment has a JSON sidecar (.idx) listing its blocks
+# and where each entry sits in them; the manifest records the same location,
+# so a read needs no index lookup at all. Segments are read through mmap and
+# recently used blocks are kept decompressed.
+#
+# Segments are only ever appended to. An append writes and syncs the blocks
+# before it replaces the sidecar, so a crash leaves at most an unindexed tail,
+# which the next append truncates.
+PACK_DIR = 'packs'
+BLOCK_BYTES = 64 * 1024
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+BLOCK_CACHE_SIZE = 32
+CODECS = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+    'lzma': (lambda data: lzma.compress(data, preset=6), lzma.decompress),
+}
+DEFAULT_CODEC = 'zlib'
+_SEGMENT_RE = re.compile(r'^seg_(\d+)\.pack$')
+
+_lock = threading.Lock()
+_maps = {}
+_blocks = OrderedDict()
+
+
+def pack_dir(context_dir):
+    return os.path.join(context_dir, PACK_DIR)
+
+
+def segments(context_dir):
+    directory = pack_dir(context_dir)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted((name for name in names if _SEGMENT_RE.match(name)),
+                  key=lambda name: int(_SEGMENT_RE.match(name).group(1)))
+
+
+def _index_path(segment_path):
+    return segment_path[:-len('.pack')] + '.idx'
+
+
+def load_index(segment_path):
+    try:
+        with open(_index_path(segment_path), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _segment_end(index):
+    if not index["blocks"]:
+        return 0
+    last = index["blocks"][-1]
+    return last["offset"] + last["length"]
+
+
+def _target_segment(context_dir, codec):
+    # The newest segment if it uses this codec and has room, else a new one
+    names = segments(context_dir)
+    if names:
+        path = os.path.join(pack_dir(context_dir), names[-1])
+        index = load_index(path)
+        if index and index["codec"] == codec and _segment_end(index) < SEGMENT_MAX_BYTES:
+            return path, index
+        number = int(_SEGMENT_RE.match(names[-1]).group(1)) + 1
+    else:
+        number = 1
+    path = os.path.join(pack_dir(context_dir), f'seg_{number:06d}.pack')
+    return path, {"codec": codec, "blocks": [], "entries": []}
+
+
+def _group(entries):
+    block, used = [], 0
+    for entry in entries:
+        if block and used + len(entry[3]) > BLOCK_BYTES:
+            yield block
+            block, used = [], 0
+        block.append(entry)
+        used += len(entry[3])
+    if block:
+        yield block
+
+
+def append(context_dir, entries, write, codec=DEFAULT_CODEC):
+    # entries: [(number, file, format, data)]. Returns the manifest record
+    # for each entry, pointing at its packed location. write(path, text)
+    # replaces the sidecar atomically.
+    compress = CODECS[codec][0]
+    os.makedirs(pack_dir(context_dir), exist_ok=True)
+    path, index = _target_segment(context_dir, codec)
+    name = os.path.basename(path)
+    records = []
+    with open(path, 'ab') as f:
+        f.truncate(_segment_end(index))
+        offset = _segment_end(index)
+        for block in _group(entries):
+            data = compress(b"".join(entry[3] for entry in block))
+            f.write(data)
+            start = 0
+            for number, file, format, raw in block:
+                location = {"entry": number, "file": file, "format": format, "size": len(raw),
+                            "block": len(index["blocks"]), "start": start}
+                index["entries"].append(location)
+                records.append({"entry": number, "file": file, "format": format, "size": len(raw), "pack": name,
+                                "codec": codec, "offset": offset, "length": len(data), "start": start})
+                start += len(raw)
+            index["blocks"].append({"offset": offset, "length": len(data)})
+            offset += len(data)
+        f.flush()
+        os.fsync(f.fileno())
+    write(_index_path(path), json.dumps(index))
+    return records
+
+
+def records(context_dir):
+    # Manifest records for every packed entry, rebuilt from the sidecars
+    found = []
+    for name in segments(context_dir):
+        index = load_index(os.path.join(pack_dir(context_dir), name))
+        if not index:
+            continue
+        for location in index["entries"]:
+            block = index["blocks"][location["block"]]
+            found.append({"entry": location["entry"], "file": location["file"], "format": location["format"],
+                          "size": location["size"], "pack": name, "codec": index["codec"],
+                          "offset": block["offset"], "length": block["length"], "start": location["start"]})
+    return found
+
+
+def _mapping(path, end):
+    # Maps the segment once and re-maps it when it has grown past `end` or
+    # been replaced
+    st = os.stat(path)
+    with _lock:
+        cached = _maps.get(path)
+        if cached and cached[0] == st.st_ino and len(cached[1]) >= end:
+            return cached
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        cached = _maps[path] = (st.st_ino, mapped)
+        return cached
+
+
+def _block(path, codec, offset, length):
+    inode, mapped = _mapping(path, offset + length)
+    key = (path, inode, offset)
+    with _lock:
+        data = _blocks.get(key)
+        if data is not None:
+            _blocks.move_to_end(key)
+            return data
+    data = CODECS[codec][1](mapped[offset:offset + length])
+    with _lock:
+        _blocks[key] = data
+        while len(_blocks) > BLOCK_CACHE_SIZE:
+            _blocks.popitem(last=False)
+    return data
+
+
+def read(context_dir, record):
+    path = os.path.join(pack_dir(context_dir), record["pack"])
+    data = _block(path, record["codec"], record["offset"], record["length"])
+    return data[record["start"]:record["start"] + record["size"]]
@@ -0,0 +1,179 @@
+import importlib.util
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+# ========================
+# Benchmark Harness
+# ========================
+
+# Benchmarks are plain functions named bench_* in bench_*.py files under the
+# project's benchmarks/ directory. Each one is auto-ranged like timeit: a
+# function that runs faster than MIN_SAMPLE_SECONDS is called in a loop, so
+# every sample is long enough to time reliably (a micro-benchmark), while a
+# slower one is timed call by call (a macro-benchmark). WARMUP samples are
+# discarded before REPEAT samples are kept. A module can override either by
+# defining WARMUP or REPEAT.
+#
+# Runs are compared with a baseline of per-call samples. A benchmark
+# regresses when its median slows down by more than the threshold and a
+# two-sided Mann-Whitney U test says the difference is significant.
+BENCHMARK_DIR = 'benchmarks'
+BASELINE_FILE = 'perf_baseline.json'
+RESULTS_FILE = 'perf_results.json'
+DEFAULT_WARMUP = 2
+DEFAULT_REPEAT = 15
+DEFAULT_THRESHOLD = 0.10
+SIGNIFICANCE = 0.05
+MIN_SAMPLE_SECONDS = 0.01
+
+
+def discover(root):
+    found = []
+    directory = os.path.join(root, BENCHMARK_DIR)
+    for current, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        found.extend(os.path.join(current, name) for name in sorted(files)
+                     if name.startswith('bench_') and name.endswith('.py'))
+    return found
+
+
+def _load(path, root):
+    name = "locohost_bench_" + os.path.relpath(path, root)[:-3].replace(os.sep, "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _autorange(func):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_SECONDS:
+            return number
+        number *= 10 if elapsed * 10 < MIN_SAMPLE_SECONDS else 2
+
+
+def measure(func, warmup=DEFAULT_WARMUP, repeat=DEFAULT_REPEAT):
+    number = _autorange(func)
+    samples = []
+    for i in range(warmup + repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - start) / number
+        if i >= warmup:
+            samples.append(elapsed)
+    return {"kind": "micro" if number > 1 else "macro", "number": number, "samples": samples, **summarize(samples)}
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "min": ordered[0],
+        "p95": ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)],
+    }
+
+
+def run(root, paths, warmup=None, repeat=None, log=None):
+    results = {}
+    for path in paths:
+        module = _load(path, root)
+        module_warmup = getattr(module, "WARMUP", DEFAULT_WARMUP) if warmup is None else warmup
+        module_repeat = getattr(module, "REPEAT", DEFAULT_REPEAT) if repeat is None else repeat
+        for name in sorted(dir(module)):
+            func = getattr(module, name)
+            if name.startswith('bench_') and callable(func):
+                key = f"{os.path.relpath(path, root)}::{name}"
+                if log:
+                    log(key)
+                results[key] = measure(func, module_warmup, module_repeat)
+    return results
+
+
+def mann_whitney_p(a, b):
+    # Two-sided p-value of the Mann-Whitney U test (normal approximation with
+    # average ranks for ties)
+    n1, n2 = len(a), len(b)
+    if n1 < 2 or n2 < 2:
+        return 1.0
+    values = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+    rank_sum, i = 0.0, 0
+    while i < len(values):
+        j = i
+        while j + 1 < len(values) and values[j + 1][0] == values[i][0]:
+            j += 1
+        rank = (i + j) / 2 + 1
+        rank_sum += rank * sum(1 for k in range(i, j + 1) if values[k][1] == 0)
+        i = j + 1
+    u = rank_sum - n1 * (n1 + 1) / 2
+    sigma = math.sqrt(n1 * n2 * (n1 + n2 + 1) / 12)
+    if sigma == 0:
+        return 1.0
+    z = (u - n1 * n2 / 2) / sigma
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    rows = []
+    for key, result in sorted(current.items()):
+        base = baseline.get(key)
+        if base is None:
+            rows.append({"benchmark": key, "status": "new", "median": result["median"], "baseline": None,
+                         "change": None, "p": None})
+            continue
+        change = result["median"] / base["median"] - 1 if base["median"] else 0.0
+        p = mann_whitney_p(base["samples"], result["samples"])
+        if change > threshold and p < SIGNIFICANCE:
+            status = "regressed"
+        elif change < -threshold and p < SIGNIFICANCE:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append({"benchmark": key, "status": status, "median": result["median"], "baseline": base["median"],
+                     "change": round(change, 4), "p": round(p, 4)})
+    return rows
+
+
+def format_table(rows):
+    def seconds(value):
+        if value is None:
+            return "-"
+        for unit, scale in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+            if value * scale >= 1:
+                return f"{value * scale:.3g}{unit}"
+        return f"{value * 1e9:.3g}ns"
+
+    table = [("benchmark", "median", "baseline", "change", "p", "status")]
+    for row in rows:
+        table.append((row["benchmark"], seconds(row["median"]), seconds(row["baseline"]),
+                      "-" if row["change"] is None else f"{row['change']:+.1%}",
+                      "-" if row["p"] is None else f"{row['p']:.3f}", row["status"]))
+    widths = [max(len(str(line[i])) for line in table) for i in range(len(table[0]))]
+    return "\n".join("  ".join(str(cell).ljust(width) for cell, width in zip(line, widths)).rstrip()
+                     for line in table)
+
+
+def dumps(results):
+    return json.dumps({"python": sys.version.split()[0], "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "benchmarks": results}, indent=1, sort_keys=True)
+
+
+def load(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f).get("benchmarks", {})
+    except (FileNotFoundError, ValueError, AttributeError):
+        return None
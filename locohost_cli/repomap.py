@@ -0,0 +1,301 @@
+import ast
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+from .review import source_files
+
+# ========================
+# Repo Map
+# ========================
+
+# A symbol index of the project kept in .context/.repo_map.json: for every
+# source file, the symbols it defines (with one-line signatures), the names
+# it references and the modules it imports. Python is parsed with ast; Go,
+# TypeScript and JavaScript with a few line-oriented patterns, which is
+# enough to find top-level definitions and imports. Like the review manifest,
+# a file whose size and mtime are unchanged is not re-read and one whose
+# content hash is unchanged is not re-parsed.
+#
+# Code-writing prompts carry a slice of the map instead of whole files: the
+# signatures of the files most closely related to the one being edited (its
+# imports, its importers, and the files defining what it references), cut to
+# a token budget.
+MAP_FILE = '.repo_map.json'
+VERSION = 1
+LANGUAGES = {'.py': 'python', '.go': 'go', '.ts': 'typescript', '.tsx': 'typescript', '.js': 'javascript',
+             '.jsx': 'javascript'}
+TS_EXTENSIONS = ('.ts', '.tsx', '.js', '.jsx')
+
+_GO_PATTERNS = [
+    (re.compile(r'^func\s+\(\s*(?:\w+\s+)?\*?(\w+)(?:\[[^\]]*\])?\s*\)\s*(\w+)\s*[(\[]'), 'method'),
+    (re.compile(r'^func\s+(\w+)\s*[(\[]'), 'function'),
+    (re.compile(r'^type\s+(\w+)\s+(?:struct|interface)\b'), 'type'),
+    (re.compile(r'^type\s+(\w+)\b'), 'type'),
+    (re.compile(r'^(?:var|const)\s+(\w+)\b'), 'variable'),
+]
+_TS_PATTERNS = [
+    (re.compile(r'^(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*(\w+)'), 'function'),
+    (re.compile(r'^(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+(\w+)'), 'class'),
+    (re.compile(r'^(?:export\s+)?interface\s+(\w+)'), 'interface'),
+    (re.compile(r'^(?:export\s+)?type\s+(\w+)\s*[=<]'), 'type'),
+    (re.compile(r'^(?:export\s+)?(?:const|let|var)\s+(\w+)'), 'variable'),
+]
+_TS_IMPORT_RE = re.compile(r'''(?:\bfrom\s*|\bimport\s*|\brequire\(\s*)['"]([^'"]+)['"]''')
+_GO_IMPORT_RE = re.compile(r'^\s*(?:import\s+)?(?:[\w.]+\s+)?"([^"]+)"\s*$')
+_STRIP_RE = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`[^`]*`', re.DOTALL)
+_IDENTIFIER_RE = re.compile(r'\b[A-Za-z_]\w+\b')
+
+
+def load(path):
+    try:
+        with open(path, 'r') as f:
+            repo_map = json.load(f)
+        if repo_map.get("version") == VERSION:
+            return repo_map
+    except (FileNotFoundError, ValueError, AttributeError):
+        pass
+    return {"version": VERSION, "files": {}}
+
+
+def _python_symbols(text, path):
+    tree = ast.parse(text, filename=path)
+    defs, imports = [], set()
+
+    def signature(node, prefix=""):
+        returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+        keyword = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+        return f"{keyword} {prefix}{node.name}({ast.unparse(node.args)}){returns}"
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            defs.append([node.name, "function", node.lineno, signature(node)])
+        elif isinstance(node, ast.ClassDef):
+            bases = ", ".join(ast.unparse(base) for base in node.bases)
+            defs.append([node.name, "class", node.lineno, f"class {node.name}({bases})" if bases else
+                         f"class {node.name}"])
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    defs.append([f"{node.name}.{item.name}", "method", item.lineno,
+                                 signature(item, f"{node.name}.")])
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                if isinstance(target, ast.Name):
+                    defs.append([target.id, "variable", node.lineno, ast.unparse(node).split("\n")[0][:120]])
+
+    refs = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            refs.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            refs.add(node.attr)
+        elif isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            # Relative imports are kept as ".name" / "..name" and resolved later
+            base = "." * node.level + (node.module or "")
+            imports.add(base)
+            imports.update(f"{base}.{alias.name}" if node.module else f"{base}{alias.name}" for alias in node.names)
+            refs.update(alias.name for alias in node.names)
+    return defs, refs, imports
+
+
+def _pattern_symbols(text, patterns, language):
+    defs, imports = [], set()
+    in_import_block = False
+    for number, line in enumerate(text.split("\n"), 1):
+        if language == 'go':
+            stripped = line.strip()
+            if stripped.startswith("import ("):
+                in_import_block = True
+                continue
+            if in_import_block:
+                if stripped.startswith(")"):
+                    in_import_block = False
+                else:
+                    match = _GO_IMPORT_RE.match(stripped)
+                    if match:
+                        imports.add(match.group(1))
+                continue
+            if stripped.startswith("import "):
+                match = _GO_IMPORT_RE.match(stripped)
+                if match:
+                    imports.add(match.group(1))
+                continue
+        else:
+            imports.update(_TS_IMPORT_RE.findall(line))
+        for pattern, kind in patterns:
+            match = pattern.match(line)
+            if match:
+                name = ".".join(group for group in match.groups() if group)
+                defs.append([name, kind, number, line.strip().rstrip("{").strip()[:120]])
+                break
+    refs = set(_IDENTIFIER_RE.findall(_STRIP_RE.sub(" ", text)))
+    return defs, refs, imports
+
+
+def parse(path, text):
+    language = LANGUAGES[os.path.splitext(path)[1]]
+    if language == 'python':
+        try:
+            defs, refs, imports = _python_symbols(text, path)
+        except (SyntaxError, ValueError):
+            defs, refs, imports = [], set(), set()
+    elif language == 'go':
+        defs, refs, imports = _pattern_symbols(text, _GO_PATTERNS, language)
+    else:
+        defs, refs, imports = _pattern_symbols(text, _TS_PATTERNS, language)
+    return {"language": language, "defs": defs, "refs": sorted(refs), "imports": sorted(imports)}
+
+
+def update(root, repo_map):
+    # Brings the map up to date with the files under root. Returns the number
+    # of files parsed and whether the map changed at all.
+    previous = repo_map["files"]
+    current, parsed, changed = {}, 0, False
+    for path in source_files(root):
+        if os.path.splitext(path)[1] not in LANGUAGES:
+            continue
+        st = os.stat(os.path.join(root, path))
+        record = previous.get(path)
+        if record and record["size"] == st.st_size and record["mtime_ns"] == st.st_mtime_ns:
+            current[path] = record
+            continue
+        with open(os.path.join(root, path), 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        changed = True
+        if record and record["hash"] == digest:
+            current[path] = dict(record, size=st.st_size, mtime_ns=st.st_mtime_ns)
+            continue
+        current[path] = dict(parse(path, data.decode('utf-8', errors='replace')), hash=digest, size=st.st_size,
+                             mtime_ns=st.st_mtime_ns)
+        parsed += 1
+    repo_map["files"] = current
+    return parsed, changed or previous.keys() != current.keys()
+
+
+def _python_modules(files):
+    # Dotted names each Python file can be imported as: from the root, and
+    # from its top-most package
+    modules = {}
+    for path in files:
+        if not path.endswith('.py'):
+            continue
+        parts = path[:-3].split('/')
+        if parts[-1] == '__init__':
+            parts = parts[:-1]
+        modules.setdefault('.'.join(parts), path)
+        base = len(path.split('/')) - 1
+        while base > 0 and '/'.join(path.split('/')[:base]) + '/__init__.py' in files:
+            base -= 1
+        if parts[base:]:
+            modules.setdefault('.'.join(parts[base:]), path)
+    return modules
+
+
+def _resolve(path, name, files, modules):
+    language = files[path]["language"]
+    if language == 'python':
+        if name.startswith('.'):
+            level = len(name) - len(name.lstrip('.'))
+            package = path.split('/')[:-1]
+            anchor = package[:len(package) - level + 1]
+            name = '.'.join(anchor + ([name.lstrip('.')] if name.lstrip('.') else []))
+        parts = name.split('.')
+        found = set()
+        for i in range(len(parts), 0, -1):
+            local = modules.get('.'.join(parts[:i]))
+            if local:
+                found.add(local)
+                break
+        return found
+    if language == 'go':
+        # A Go import is a package directory; match it by its trailing path
+        return {other for other in files if other.endswith('.go') and
+                ('/' + posixpath.dirname(other)).endswith('/' + name.strip('/'))}
+    if name.startswith('.'):
+        base = posixpath.normpath(posixpath.join(posixpath.dirname(path), name))
+        candidates = [base] + [base + ext for ext in TS_EXTENSIONS] + [f"{base}/index{ext}" for ext in TS_EXTENSIONS]
+        return {candidate for candidate in candidates if candidate in files}
+    return set()
+
+
+def import_graph(repo_map):
+    # {file: set of local files it imports}
+    files = repo_map["files"]
+    modules = _python_modules(files)
+    return {path: set().union(*(_resolve(path, name, files, modules) for name in record["imports"])) - {path}
+            for path, record in files.items()}
+
+
+def related(repo_map, target=None):
+    # [(score, path)] best first. Without a target, every file is ranked by
+    # how much of the rest of the project depends on it.
+    files = repo_map["files"]
+    graph = import_graph(repo_map)
+    definers = {}
+    for path, record in files.items():
+        for name, kind, line, signature in record["defs"]:
+            definers.setdefault(name.split('.')[-1], set()).add(path)
+
+    if target is None:
+        scores = dict.fromkeys(files, 0)
+        for path, deps in graph.items():
+            for dep in deps:
+                scores[dep] = scores.get(dep, 0) + 2
+        for path, record in files.items():
+            for name in record["refs"]:
+                for other in definers.get(name, ()):
+                    if other != path:
+                        scores[other] = scores.get(other, 0) + 1 / len(definers[name])
+    else:
+        scores = {}
+        for dep in graph.get(target, ()):
+            scores[dep] = scores.get(dep, 0) + 4
+        for path, deps in graph.items():
+            if target in deps:
+                scores[path] = scores.get(path, 0) + 2
+        for name in files.get(target, {}).get("refs", ()):
+            for other in definers.get(name, ()):
+                if other != target:
+                    scores[other] = scores.get(other, 0) + 1 / len(definers[name])
+        own = {name.split('.')[-1] for name, *_ in files.get(target, {}).get("defs", ())}
+        for path, record in files.items():
+            if path != target and own.intersection(record["refs"]):
+                scores[path] = scores.get(path, 0) + 0.5
+        scores.pop(target, None)
+    return sorted(((score, path) for path, score in scores.items() if path in files), key=lambda x: (-x[0], x[1]))
+
+
+def render(repo_map, ranked, budget, estimate, focus=()):
+    # Signatures of the ranked files until the token budget is used up. Within
+    # a file, the symbols named in `focus` come first.
+    focus = set(focus)
+    sections, used = [], 0
+    for score, path in ranked:
+        defs = repo_map["files"][path]["defs"]
+        if not defs:
+            continue
+        defs = sorted(defs, key=lambda d: (d[0].split('.')[-1] not in focus, d[2]))
+        lines = [f"{path}:"] + [f"  {signature}" for name, kind, line, signature in defs]
+        section = "\n".join(lines)
+        tokens = estimate(section)
+        if used + tokens > budget:
+            # Fit what we can of the most relevant symbols, then stop
+            while len(lines) > 1 and used + estimate("\n".join(lines)) > budget:
+                lines.pop()
+            if len(lines) > 1:
+                sections.append("\n".join(lines))
+            break
+        sections.append(section)
+        used += tokens
+    return "\n\n".join(sections)
+
+
+def repo_tokens(repo_map):
+    # What the whole project would cost to send, from the recorded sizes
+    return sum(record["size"] for record in repo_map["files"].values()) // 4
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import subprocess
+
+from .schemas import section_marker
+
+# ========================
+# Incremental Review
+# ========================
+
+# review_and_refactor keeps a manifest in .context/.review_manifest.json with
+# each reviewed file's content hash, size, mtime and findings. A file whose
+# size and mtime are unchanged is not even re-read; one whose content hash is
+# unchanged keeps its findings. Only the remaining files are sent, in
+# token-budgeted batches, and the manifest is updated as each batch returns,
+# so an interrupted review resumes where it stopped.
+MANIFEST_FILE = '.review_manifest.json'
+REPORT_FILE = 'review.md'
+PROMPT_VERSION = 1
+SECTION_PREFIX = "REVIEW"
+NO_ISSUES = "No issues"
+MAX_FILE_BYTES = 200 * 1024
+SOURCE_EXTENSIONS = {'.py', '.go', '.ts', '.tsx', '.js', '.jsx', '.sql', '.sh', '.yaml', '.yml', '.tf'}
+SKIP_DIRS = {'.git', '.context', 'node_modules', 'vendor', '__pycache__', '.venv', 'venv', 'build', 'dist'}
+
+
+def source_files(root):
+    # Tracked and untracked-but-not-ignored files when root is a git work
+    # tree, otherwise a directory walk
+    try:
+        output = subprocess.run(["git", "ls-files", "--cached", "--others", "--exclude-standard", "-z"], cwd=root,
+                                capture_output=True, check=True).stdout.decode('utf-8', errors='replace')
+        paths = [path for path in output.split("\0") if path]
+    except (OSError, subprocess.CalledProcessError):
+        paths = []
+        for directory, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+            paths.extend(os.path.relpath(os.path.join(directory, name), root) for name in files)
+    return sorted({path for path in paths
+                   if os.path.splitext(path)[1] in SOURCE_EXTENSIONS
+                   and not set(path.split('/')) & SKIP_DIRS
+                   and os.path.isfile(os.path.join(root, path))})
+
+
+def load_manifest(path, model):
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get("model") == model and manifest.get("prompt_version") == PROMPT_VERSION:
+            return manifest
+    except (FileNotFoundError, ValueError, AttributeError):
+        pass
+    return {"model": model, "prompt_version": PROMPT_VERSION, "files": {}}
+
+
+def scan(root, paths, manifest):
+    # Returns (current, stale, files_read): current maps every path to its
+    # manifest record as of now; stale lists the paths needing a review
+    current, stale, files_read = {}, [], 0
+    previous = manifest["files"]
+    for path in paths:
+        st = os.stat(os.path.join(root, path))
+        record = previous.get(path)
+        if record and "findings" in record and record.get("size") == st.st_size \
+                and record.get("mtime_ns") == st.st_mtime_ns:
+            current[path] = record
+            continue
+        with open(os.path.join(root, path), 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        files_read += 1
+        if record and record.get("hash") == digest and "findings" in record:
+            current[path] = dict(record, size=st.st_size, mtime_ns=st.st_mtime_ns)
+        else:
+            current[path] = {"hash": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            stale.append(path)
+    return current, stale, files_read
+
+
+def file_key(path):
+    return hashlib.sha256(path.encode('utf-8')).hexdigest()
+
+
+def read_source(root, path):
+    with open(os.path.join(root, path), 'rb') as f:
+        data = f.read(MAX_FILE_BYTES + 1)
+    text = data[:MAX_FILE_BYTES].decode('utf-8', errors='replace')
+    if len(data) > MAX_FILE_BYTES:
+        text += "\n... (truncated)"
+    return text
+
+
+def batch_files(files, budget, estimate):
+    # files: [(path, text)]; greedy token-budgeted batches, one file never split
+    batches, current, used = [], [], 0
+    for path, text in files:
+        tokens = estimate(text)
+        if current and used + tokens > budget:
+            batches.append(current)
+            current, used = [], 0
+        current.append((path, text))
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def review_prompt(project_name, batch):
+    sections = "\n\n".join(f"[FILE {section_marker(SECTION_PREFIX, file_key(path))} {path}]\n{text}\n[/FILE]"
+                           for path, text in batch)
+    example = section_marker(SECTION_PREFIX, file_key(batch[0][0]))
+    return f"""Human: Review the following files from the {project_name} project. For each file, list concrete
+problems: bugs, missing error handling, security issues, performance problems, and refactorings that
+would improve the code without changing its behaviour. Name the function or class each finding is
+about and keep every finding to one or two lines. If a file has nothing worth changing, write
+"{NO_ISSUES}".
+
+Put each file's findings between the markers given for it, for example [{example}]...[/{example}].
+
+{sections}
+
+Assistant: """
+
+
+def render_report(project_name, files):
+    flagged = {path: record["findings"] for path, record in sorted(files.items())
+               if record.get("findings") and record["findings"].strip() != NO_ISSUES}
+    lines = [f"# Code Review: {project_name}", "",
+             f"{len(flagged)} of {len(files)} files have findings.", ""]
+    for path, findings in flagged.items():
+        lines += [f"## {path}", "", findings.strip(), ""]
+    return "\n".join(lines)
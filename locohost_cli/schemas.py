@@ -0,0 +1,134 @@
+import logging
+import re
+
+from pydantic import BaseModel, Field, ValidationError, create_model, field_validator
+
+logger = logging.getLogger(__name__)
+
+# ========================
+# Response Schemas
+# ========================
+
+# Model responses delimit their parts with [NAME]...[/NAME] markers. Each
+# schema field names its marker, so one pass over the text extracts and
+# validates every section, and a malformed response can be repaired by asking
+# only for the sections that are missing.
+
+class ResponseFormatError(ValueError):
+    def __init__(self, schema, missing, text):
+        super().__init__(f"{schema.__name__} response is missing sections: {', '.join(missing)}")
+        self.schema = schema
+        self.missing = missing
+        self.text = text
+
+
+class MarkedResponse(BaseModel):
+    @field_validator('*')
+    @classmethod
+    def _not_blank(cls, value):
+        value = value.strip()
+        if not value:
+            raise ValueError("section is empty")
+        return value
+
+    @classmethod
+    def markers(cls):
+        return {name: field.json_schema_extra["marker"] for name, field in cls.model_fields.items()}
+
+
+class CompressionResult(MarkedResponse):
+    compressed_content: str = Field(description="The compressed CoT snapshot in Markdown",
+                                    json_schema_extra={"marker": "COMPRESSED_CONTENT"})
+    commit_message: str = Field(description="A concise commit message summarizing the compression",
+                                json_schema_extra={"marker": "COMMIT_MESSAGE"})
+
+
+class SnapshotData(MarkedResponse):
+    file_text: str = Field(description="The snapshot file text",
+                           json_schema_extra={"marker": "FILE_TEXT"})
+    commit_message: str = Field(description="A concise commit message",
+                                json_schema_extra={"marker": "COMMIT_MESSAGE"})
+    changelog: str = Field(description="A changelog entry for the snapshot",
+                           json_schema_extra={"marker": "CHANGELOG"})
+
+
+class BenchmarkModule(MarkedResponse):
+    code: str = Field(description="A Python module of bench_* benchmark functions",
+                      json_schema_extra={"marker": "BENCHMARK_CODE"})
+
+
+class CodeEdit(MarkedResponse):
+    file_text: str = Field(description="The complete new text of the edited file",
+                           json_schema_extra={"marker": "FILE_TEXT"})
+    summary: str = Field(description="A short summary of the change",
+                         json_schema_extra={"marker": "SUMMARY"})
+
+
+def extract_sections(text, schema):
+    # Returns the sections that are present and non-blank. A section whose
+    # closing marker is missing runs up to the next opening marker or the end
+    # of the text, which is how truncated responses usually look.
+    markers = schema.markers()
+    openings = "|".join(re.escape(f"[{marker}]") for marker in markers.values())
+    found = {}
+    for name, marker in markers.items():
+        match = re.search(rf"\[{marker}\](.*?)(?:\[/{marker}\]|(?={openings})|\Z)", text, re.DOTALL)
+        if match and match.group(1).strip():
+            found[name] = match.group(1).strip()
+    return found
+
+
+def parse_response(text, schema, repair=None, retry_budget=2):
+    found = extract_sections(text, schema)
+    missing = [name for name in schema.model_fields if name not in found]
+    if missing and repair is not None and retry_budget > 0:
+        logger.warning("%s response is missing %s, requesting a repair", schema.__name__, missing)
+        repair_schema = create_model(f"{schema.__name__}Repair", __base__=MarkedResponse,
+                                     **{name: (str, schema.model_fields[name]) for name in missing})
+        try:
+            repaired = repair(repair_schema, _repair_prompt(text, schema, missing), retry_budget)
+            found.update(repaired.model_dump())
+        except Exception as e:
+            logger.error("Repairing %s response failed: %s", schema.__name__, e)
+        missing = [name for name in schema.model_fields if name not in found]
+
+    if missing:
+        raise ResponseFormatError(schema, missing, text)
+    try:
+        return schema(**found)
+    except ValidationError as e:
+        raise ResponseFormatError(schema, [err["loc"][0] for err in e.errors()], text) from e
+
+
+def section_marker(prefix, key):
+    return f"{prefix}_{key[:10]}"
+
+
+def parse_keyed_sections(text, prefix, keys, description, repair=None, retry_budget=2):
+    # For responses with one section per item (a hunk, a file), each marked
+    # [<prefix>_<key>]. Returns {key: section text}.
+    fields = {f"s_{key[:10]}": (str, Field(description=description,
+                                           json_schema_extra={"marker": section_marker(prefix, key)}))
+              for key in keys}
+    schema = create_model(f"{prefix.title()}Sections", __base__=MarkedResponse, **fields)
+    sections = parse_response(text, schema, repair=repair, retry_budget=retry_budget).model_dump()
+    return {key: sections[f"s_{key[:10]}"] for key in keys}
+
+
+def extract_files(text):
+    # Responses that create an open-ended set of files mark each one as
+    # [FILE path]...[/FILE]. Returns {path: text}.
+    return {match.group(1): match.group(2).strip("\n") + "\n"
+            for match in re.finditer(r"\[FILE ([^\]\s]+)\]\n?(.*?)\[/FILE\]", text, re.DOTALL)}
+
+
+def _repair_prompt(text, schema, missing):
+    fields = "\n".join(f"- {name}: {schema.model_fields[name].description}" for name in missing)
+    return f"""The response below was supposed to contain these sections, but they are missing or empty:
+{fields}
+
+Using only the information in the response, provide the missing sections.
+
+Response:
+{text}
+"""
@@ -0,0 +1,105 @@
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ========================
+# Journal Search
+# ========================
+
+# Every CoT create and update is also written as one row of an SQLite FTS5
+# table in .context/.cot_search.db, so searching the journal is an index
+# lookup instead of a read of every cot_* file. Rows are ranked with bm25 and
+# carry the entry number, kind (create/update), timestamp and project for
+# filtering. The database is derived data: rebuild_cot_index recreates it
+# from the journal files.
+SEARCH_DB_FILE = '.cot_search.db'
+DEFAULT_LIMIT = 20
+
+_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS blocks USING fts5(
+    content, entry UNINDEXED, kind UNINDEXED, created UNINDEXED, project UNINDEXED,
+    tokenize = 'porter unicode61'
+)
+"""
+
+_connections = threading.local()
+
+
+def db_path(context_dir):
+    return os.path.join(context_dir, SEARCH_DB_FILE)
+
+
+def connect(context_dir):
+    # One connection per process, thread and database; forked workers open
+    # their own instead of sharing the parent's
+    path = os.path.realpath(db_path(context_dir))
+    cache = getattr(_connections, "cache", None)
+    if cache is None:
+        cache = _connections.cache = {}
+    key = (os.getpid(), path)
+    conn = cache.get(key)
+    if conn is None or not os.path.exists(path):
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(_SCHEMA)
+        cache[key] = conn
+    return conn
+
+
+def add_blocks(context_dir, blocks):
+    # blocks: iterable of (entry, kind, created, project, content)
+    conn = connect(context_dir)
+    with conn:
+        conn.executemany("INSERT INTO blocks (entry, kind, created, project, content) VALUES (?, ?, ?, ?, ?)",
+                         blocks)
+
+
+def rebuild(context_dir, blocks):
+    conn = connect(context_dir)
+    with conn:
+        conn.execute("DELETE FROM blocks")
+        conn.executemany("INSERT INTO blocks (entry, kind, created, project, content) VALUES (?, ?, ?, ?, ?)",
+                         blocks)
+        count = conn.execute("SELECT count(*) FROM blocks").fetchone()[0]
+    conn.execute("INSERT INTO blocks (blocks) VALUES ('optimize')")
+    conn.commit()
+    return count
+
+
+def _quote_terms(query):
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def search(context_dir, query, limit=DEFAULT_LIMIT, project=None, since=None, until=None):
+    # since/until compare against the timestamp prefix, so "2024-05-01" as
+    # until includes the whole day
+    sql = ["SELECT entry, kind, created, project, snippet(blocks, 0, '[', ']', '...', 16), bm25(blocks)",
+           "FROM blocks WHERE blocks MATCH ?"]
+    params = []
+    if project is not None:
+        sql.append("AND project = ?")
+        params.append(project)
+    if since is not None:
+        sql.append("AND created >= ?")
+        params.append(since)
+    if until is not None:
+        sql.append("AND substr(created, 1, length(?)) <= ?")
+        params.extend([until, until])
+    sql.append("ORDER BY rank, created DESC LIMIT ?")
+    params.append(limit)
+    sql = " ".join(sql)
+
+    conn = connect(context_dir)
+    try:
+        rows = conn.execute(sql, [query] + params).fetchall()
+    except sqlite3.OperationalError as e:
+        # Not valid FTS5 query syntax (e.g. "foo-bar"); search for the terms literally
+        logger.debug("Query %r is not valid FTS5 syntax (%s), quoting its terms", query, e)
+        rows = conn.execute(sql, [_quote_terms(query)] + params).fetchall()
+    return [{"entry": int(entry), "kind": kind, "created": created, "project": project,
+             "snippet": snippet, "score": round(-score, 4)}
+            for entry, kind, created, project, snippet, score in rows]
@@ -1,9 +1,17 @@
 import pytest
 import os
+import json
 import logging
 import sys
+import time
 import subprocess
-from locohost_cli.locohost import _create_cot, _update_cot, _compress_cot
+from locohost_cli.fakes import prompt_text
+from locohost_cli.locohost import (
+    _create_cot, _update_cot, _compress_cot, _read_cot_manifest, _rebuild_cot_index,
+    _read_cot_entry, _migrate_cot_json, _complete, _cache_get, _cache_put, _cache_evict,
+    _SectionStreamParser, _pack_cot, _record_cot_note, _split_to_budget, _build_parser, compress_all, search_cot, rebuild_cot_index,
+    get_snapshot_data,
+)
 
 # Configure logging to display messages during test execution
 logger = logging.getLogger()
@@ -74,3 +82,465 @@ def test_compress_cot(project_setup):
         content = f.read()
     assert "Initial CoT entry" in content
     assert "Updated CoT entry" in content
+
+def test_import_does_not_load_anthropic():
+    # The SDK is only imported once a subcommand needs the network
+    code = "import sys, locohost_cli.locohost; sys.exit('anthropic' in sys.modules)"
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], cwd=repo_root)
+    assert result.returncode == 0
+
+def test_create_cot_numbers_after_deleted_entry(project_setup):
+    project_name, _, context_dir = project_setup
+    _create_cot(project_name, "First", context_dir=context_dir)
+    _create_cot(project_name, "Second", context_dir=context_dir)
+    os.remove(os.path.join(context_dir, "cot_0001.md"))
+    _create_cot(project_name, "Third", context_dir=context_dir)
+
+    # The deleted entry must not cause the newest entry to overwrite cot_0002.md
+    assert sorted(f for f in os.listdir(context_dir) if f.startswith('cot_')) == ["cot_0002.md", "cot_0003.md"]
+    with open(os.path.join(context_dir, "cot_0002.md")) as f:
+        assert "Second" in f.read()
+
+def test_mixed_formats_share_sequence(project_setup):
+    project_name, _, context_dir = project_setup
+    _create_cot(project_name, "Markdown entry", context_dir=context_dir)
+    _create_cot(project_name, "JSON entry", format='json', context_dir=context_dir)
+    _update_cot(project_name, "Markdown update", context_dir=context_dir)
+
+    assert os.path.exists(os.path.join(context_dir, "cot_0002.json"))
+    with open(os.path.join(context_dir, "cot_0001.md")) as f:
+        assert "Markdown update" in f.read()
+
+    manifest = _read_cot_manifest(context_dir)
+    assert list(manifest) == [1, 2]
+    assert manifest[1]["file"] == "cot_0001.md" and manifest[2]["format"] == "json"
+
+    # Updates do not grow the manifest
+    for i in range(5):
+        _update_cot(project_name, f"Markdown update {i}", context_dir=context_dir)
+    with open(os.path.join(context_dir, ".cot_manifest.jsonl")) as f:
+        assert len(f.readlines()) == 2
+
+def test_rebuild_cot_index_after_drift(project_setup):
+    project_name, _, context_dir = project_setup
+    _create_cot(project_name, "First", context_dir=context_dir)
+    # A file added behind the index's back
+    with open(os.path.join(context_dir, "cot_0007.md"), "w") as f:
+        f.write("# Chain of Thought Entry 7\n")
+
+    index = _rebuild_cot_index(context_dir)
+    assert index["next"] == 8
+    assert index["latest"]["md"] == 7
+    assert list(_read_cot_manifest(context_dir)) == [1, 7]
+
+def test_jsonl_update_appends_one_line(project_setup):
+    project_name, _, context_dir = project_setup
+    _create_cot(project_name, "Initial CoT entry", format='jsonl', context_dir=context_dir)
+    _update_cot(project_name, "First update", format='jsonl', context_dir=context_dir)
+    _update_cot(project_name, "Second update", format='jsonl', context_dir=context_dir)
+
+    cot_file = os.path.join(context_dir, "cot_0001.jsonl")
+    with open(cot_file) as f:
+        assert len(f.readlines()) == 3
+
+    entry = _read_cot_entry(cot_file)
+    assert entry["content"] == "Initial CoT entry"
+    assert entry["project"] == project_name
+    assert [u["content"] for u in entry["updates"]] == ["First update", "Second update"]
+
+def test_migrate_cot_json(project_setup):
+    project_name, _, context_dir = project_setup
+    _create_cot(project_name, "Initial CoT entry", format='json', context_dir=context_dir)
+    _update_cot(project_name, "Updated CoT entry", format='json', context_dir=context_dir)
+    before = _read_cot_entry(os.path.join(context_dir, "cot_0001.json"))
+
+    assert _migrate_cot_json(context_dir) == [1]
+    assert not os.path.exists(os.path.join(context_dir, "cot_0001.json"))
+    assert _read_cot_entry(os.path.join(context_dir, "cot_0001.jsonl")) == before
+
+    # Further updates go to the migrated entry
+    _update_cot(project_name, "After migration", format='jsonl', context_dir=context_dir)
+    entry = _read_cot_entry(os.path.join(context_dir, "cot_0001.jsonl"))
+    assert entry["updates"][-1]["content"] == "After migration"
+
+def test_search_cot_ranks_filters_and_rebuilds(project_setup, monkeypatch, capsys):
+    project_name, project_dir, context_dir = project_setup
+    monkeypatch.chdir(project_dir)
+    _create_cot(project_name, "Chose PostgreSQL over MySQL for the orders service", context_dir=context_dir)
+    _update_cot(project_name, "Benchmarked PostgreSQL connection pooling", context_dir=context_dir)
+    _create_cot("other_project", "Kubernetes ingress notes", format='jsonl', context_dir=context_dir)
+    _update_cot("other_project", "PostgreSQL operator evaluated", format='jsonl', context_dir=context_dir)
+
+    results = search_cot("postgresql")
+    assert sorted((r["entry"], r["kind"]) for r in results) == [(1, "create"), (1, "update"), (2, "update")]
+    assert results == sorted(results, key=lambda r: -r["score"])
+    assert "[PostgreSQL]" in results[0]["snippet"]
+    assert "#1" in capsys.readouterr().out
+
+    assert [r["entry"] for r in search_cot("postgresql", project_name="other_project")] == [2]
+    assert search_cot("ingress", since="2999-01-01") == []
+    assert len(search_cot("ingress", until=results[0]["created"][:10])) == 1
+    assert len(search_cot("orders-service")) == 1  # not FTS5 syntax, searched literally
+
+    # The index is derived data: rebuilt from the journal when missing
+    os.remove(os.path.join(context_dir, ".cot_search.db"))
+    _update_cot(project_name, "Pooling settled on pgbouncer", context_dir=context_dir)
+    assert [r["kind"] for r in search_cot("pgbouncer")] == ["update"]
+    assert len(search_cot("postgresql")) == 3
+
+    rebuild_cot_index(project_name)
+    assert len(search_cot("postgresql OR pgbouncer")) == 4
+
+def _stress_worker(project_name, context_dir, format, rounds):
+    logging.getLogger().setLevel(logging.WARNING)
+    for i in range(rounds):
+        _create_cot(project_name, f"entry {os.getpid()}-{i}", format=format, context_dir=context_dir)
+        _update_cot(project_name, f"update {os.getpid()}-{i}", format=format, context_dir=context_dir)
+
+@pytest.mark.parametrize("format", ["json", "jsonl"])
+def test_parallel_writers_lose_nothing(project_setup, format):
+    import multiprocessing
+    project_name, _, context_dir = project_setup
+    workers, rounds = 8, 15
+
+    processes = [multiprocessing.Process(target=_stress_worker, args=(project_name, context_dir, format, rounds))
+                 for _ in range(workers)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+
+    cot_files = sorted(f for f in os.listdir(context_dir) if f.startswith('cot_'))
+    assert len(cot_files) == workers * rounds
+    assert cot_files == [f"cot_{n:04d}.{format}" for n in range(1, workers * rounds + 1)]
+
+    entries = [_read_cot_entry(os.path.join(context_dir, f)) for f in cot_files]
+    assert len({e["content"] for e in entries}) == workers * rounds
+    updates = [u["content"] for e in entries for u in e.get("updates", [])]
+    assert len(updates) == len(set(updates)) == workers * rounds
+
+def _note_worker(project_name, context_dir, start):
+    logging.getLogger().setLevel(logging.WARNING)
+    start.wait()
+    _record_cot_note(project_name, str(context_dir), f"note {os.getpid()}")
+
+def test_parallel_notes_create_one_entry(project_setup):
+    import multiprocessing
+    project_name, _, context_dir = project_setup
+    start = multiprocessing.Event()
+
+    processes = [multiprocessing.Process(target=_note_worker, args=(project_name, context_dir, start))
+                 for _ in range(8)]
+    for p in processes:
+        p.start()
+    start.set()
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+
+    assert [f for f in os.listdir(context_dir) if f.startswith('cot_')] == ["cot_0001.md"]
+    with open(os.path.join(context_dir, "cot_0001.md")) as f:
+        content = f.read()
+    assert all(f"note {p.pid}" in content for p in processes)
+
+def test_compress_cot_sends_only_new_entries(project_setup, fake_client):
+    project_name, _, context_dir = project_setup
+    _create_cot(project_name, "Initial CoT entry", context_dir=context_dir)
+    _compress_cot(project_name, context_dir=context_dir)
+    _update_cot(project_name, "Updated CoT entry", context_dir=context_dir)
+    _compress_cot(project_name, context_dir=context_dir)
+
+    first, second = fake_client.messages.prompts
+    assert "Initial CoT entry" in first
+    assert "Updated CoT entry" in second
+    assert "Initial CoT entry" not in second
+    assert "Snapshot so far" in second
+
+    # Nothing new: no API call at all
+    assert _compress_cot(project_name, context_dir=context_dir).endswith("snapshot.md")
+    assert len(fake_client.messages.prompts) == 2
+
+    # --full sends the whole journal again
+    _compress_cot(project_name, context_dir=context_dir, full=True)
+    assert "Initial CoT entry" in fake_client.messages.prompts[-1]
+    assert "Updated CoT entry" in fake_client.messages.prompts[-1]
+
+def test_compress_cot_sends_updates_to_an_older_format(project_setup, fake_client):
+    project_name, _, context_dir = project_setup
+    _create_cot(project_name, "Markdown entry", context_dir=context_dir)
+    _create_cot(project_name, "JSONL entry", format='jsonl', context_dir=context_dir)
+    _compress_cot(project_name, context_dir=context_dir)
+    _update_cot(project_name, "IMPORTANT md update", context_dir=context_dir)
+    _compress_cot(project_name, context_dir=context_dir)
+
+    assert len(fake_client.messages.prompts) == 2
+    assert "IMPORTANT md update" in fake_client.messages.prompts[-1]
+    assert "JSONL entry" not in fake_client.messages.prompts[-1]
+
+    # The md entry is still the latest md entry, so packing leaves it loose
+    assert _pack_cot(context_dir) == []
+
+def test_compress_cot_map_reduce(project_setup, fake_client):
+    project_name, _, context_dir = project_setup
+    for i in range(12):
+        _create_cot(project_name, f"Entry {i}: " + "lorem ipsum " * 40, context_dir=context_dir)
+
+    _compress_cot(project_name, context_dir=context_dir, batch_tokens=400, parallelism=3)
+
+    prompts = fake_client.messages.prompts
+    map_prompts = [p for p in prompts if "The following is part" in p]
+    assert len(map_prompts) > 1
+    final = prompts[-1]
+    assert "[COMPRESSED_CONTENT]" in final
+    assert "Summary #" in final
+    assert "lorem ipsum" not in final
+
+@pytest.mark.parametrize("action", ["compress_cot", "compress_all", "review_and_refactor"])
+def test_batch_tokens_must_be_positive(action, capsys):
+    with pytest.raises(SystemExit):
+        _build_parser().parse_args([action, "--project-name", "p", "--batch-tokens", "0"])
+    assert "must be a positive integer" in capsys.readouterr().err
+    with pytest.raises(ValueError):
+        _split_to_budget("some text", -1)
+
+def test_response_cache_reuses_identical_requests(project_setup, fake_client):
+    _, _, context_dir = project_setup
+    cache_dir = os.path.join(context_dir, ".cache")
+    assert _complete("Summarize this", cache_dir=cache_dir) == "Summary #1"
+    assert _complete("Summarize this", cache_dir=cache_dir) == "Summary #1"
+    assert len(fake_client.messages.prompts) == 1
+
+    # Bypassing the cache always reaches the API
+    assert _complete("Summarize this") == "Summary #2"
+
+    with open(os.path.join(cache_dir, "stats.json")) as f:
+        assert json.load(f) == {"hits": 1, "misses": 1}
+
+def test_get_snapshot_data_caches_only_when_given_a_context_dir(tmp_path, monkeypatch, fake_client):
+    monkeypatch.chdir(tmp_path)
+    fake_client.messages.respond = lambda prompt: ("[FILE_TEXT]\nText\n[/FILE_TEXT]\n[COMMIT_MESSAGE]\nMessage\n"
+                                                   "[/COMMIT_MESSAGE]\n[CHANGELOG]\nChanges\n[/CHANGELOG]")
+    assert get_snapshot_data("context")["file_text"] == "Text"
+    assert not os.path.exists(tmp_path / ".context")
+
+    context_dir = str(tmp_path / "ctx")
+    get_snapshot_data("context", context_dir=context_dir)
+    get_snapshot_data("context", context_dir=context_dir)
+    assert len(fake_client.messages.prompts) == 2
+    assert os.path.exists(os.path.join(context_dir, ".cache"))
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    cache_dir = str(tmp_path)
+    now = time.time()
+    for i, key in enumerate(["old", "used", "new"]):
+        _cache_put(cache_dir, key, {"created": now, "text": "x" * 100})
+        os.utime(os.path.join(cache_dir, f"{key}.json"), (now - 300 + i, now - 300 + i))
+    assert _cache_get(cache_dir, "old") is not None  # refreshes "old"
+
+    entry_size = os.path.getsize(os.path.join(cache_dir, "new.json"))
+    assert _cache_evict(cache_dir, max_bytes=2 * entry_size) == 1
+    assert sorted(os.listdir(cache_dir)) == ["new.json", "old.json"]
+
+def test_compress_cot_stream_resumes_after_interruption(project_setup, fake_client, monkeypatch):
+    project_name, _, context_dir = project_setup
+    _create_cot(project_name, "Initial CoT entry", context_dir=context_dir)
+    partial_file = os.path.join(context_dir, "snapshot.md.partial")
+
+    fake_client.messages.fail_after = 6
+    assert _compress_cot(project_name, context_dir=context_dir, stream=True, use_cache=False) is None
+    with open(partial_file) as f:
+        partial = f.read()
+    assert partial and "Snapshot so far".startswith(partial.strip())
+    assert not os.path.exists(os.path.join(context_dir, "snapshot.md"))
+
+    fake_client.messages.fail_after = None
+    _compress_cot(project_name, context_dir=context_dir, stream=True, use_cache=False)
+    with open(os.path.join(context_dir, "snapshot.md")) as f:
+        assert f.read() == "Snapshot so far"
+    assert not os.path.exists(partial_file)
+
+def test_compress_cot_commits_snapshot_without_touching_index(project_setup, fake_client):
+    project_name, project_dir, context_dir = project_setup
+    git = lambda *args: subprocess.run(["git", *args], cwd=project_dir, capture_output=True, text=True)
+    with open(os.path.join(project_dir, "staged.txt"), "w") as f:
+        f.write("work in progress")
+    git("add", "staged.txt")
+
+    _create_cot(project_name, "Initial CoT entry", context_dir=context_dir)
+    assert _compress_cot(project_name, context_dir=context_dir).endswith("snapshot.md")
+
+    assert git("show", "refs/locohost/snapshots:.context/snapshot.md").stdout == "Snapshot so far"
+    assert git("log", "-1", "--format=%s", "refs/locohost/snapshots").stdout.strip() == "Compress CoT"
+    assert git("ls-tree", "-r", "--name-only", "refs/locohost/snapshots").stdout.split() == [".context/snapshot.md"]
+    # The user's staged work is still staged and their branch has no commits
+    assert git("diff", "--cached", "--name-only").stdout.split() == ["staged.txt"]
+    assert git("rev-parse", "--verify", "-q", "HEAD").returncode != 0
+
+    # Recompressing to the same snapshot adds no commit
+    _compress_cot(project_name, context_dir=context_dir, full=True)
+    assert git("rev-list", "--count", "refs/locohost/snapshots").stdout.strip() == "1"
+
+def test_section_stream_parser_handles_split_markers():
+    sections = {}
+    parser = _SectionStreamParser(("A", "B"), lambda name, text: sections.setdefault(name, []).append(text))
+    text = "noise [A]first section[/A] more [B]second[/B] tail"
+    for ch in text:
+        parser.feed(ch)
+    parser.close()
+    assert "".join(sections["A"]) == "first section"
+    assert "".join(sections["B"]) == "second"
+
+class _RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self):
+        from types import SimpleNamespace
+        super().__init__("rate limited")
+        self.response = SimpleNamespace(headers={"retry-after": "0.01"})
+
+class _FakeAsyncClient:
+    def __init__(self, text):
+        from types import SimpleNamespace
+        self.text = text
+        self.calls = 0
+        self.in_flight = self.max_in_flight = 0
+        self.messages = SimpleNamespace(create=self._create)
+
+    async def _create(self, **kwargs):
+        import asyncio
+        from types import SimpleNamespace
+        self.calls += 1
+        if self.calls == 1:
+            raise _RateLimited()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return SimpleNamespace(content=[SimpleNamespace(text=self.text)],
+                               usage=SimpleNamespace(input_tokens=100, output_tokens=10))
+
+    async def close(self):
+        pass
+
+def test_compress_all_discovers_projects_and_retries(tmp_path, monkeypatch, capsys):
+    from locohost_cli import locohost
+    fake = _FakeAsyncClient("[COMPRESSED_CONTENT]\nFleet snapshot\n[/COMPRESSED_CONTENT]\n"
+                            "[COMMIT_MESSAGE]\nCompress CoT\n[/COMMIT_MESSAGE]")
+    monkeypatch.setattr(locohost, "_make_async_client", lambda: fake)
+
+    for name in ("alpha", "beta", "gamma"):
+        _create_cot(name, f"Entry for {name}", context_dir=str(tmp_path / "repos" / name / ".context"))
+        subprocess.run(["git", "init", "-q"], cwd=str(tmp_path / "repos" / name), check=True)
+    (tmp_path / "repos" / "not-a-project").mkdir()
+
+    results = compress_all([str(tmp_path / "repos" / "*")], concurrency=2, use_cache=False)
+
+    assert sorted(r["project"] for r in results) == ["alpha", "beta", "gamma"]
+    assert [r["status"] for r in results] == ["ok"] * 3
+    assert fake.calls == 4  # one rate-limited attempt, then one call per project
+    for name in ("alpha", "beta", "gamma"):
+        with open(tmp_path / "repos" / name / ".context" / "snapshot.md") as f:
+            assert f.read() == "Fleet snapshot"
+    assert "TOTAL" in capsys.readouterr().out
+
+def test_compress_all_sends_batch_summaries_through_the_fleet_client(tmp_path, monkeypatch, fake_client):
+    from locohost_cli import locohost
+    fake = _FakeAsyncClient("[COMPRESSED_CONTENT]\nFleet snapshot\n[/COMPRESSED_CONTENT]\n"
+                            "[COMMIT_MESSAGE]\nCompress CoT\n[/COMMIT_MESSAGE]")
+    monkeypatch.setattr(locohost, "_make_async_client", lambda: fake)
+    for name in ("alpha", "beta"):
+        project = tmp_path / "repos" / name
+        for i in range(12):
+            _create_cot(name, f"Entry {i}: " + "lorem ipsum " * 40, context_dir=str(project / ".context"))
+        subprocess.run(["git", "init", "-q"], cwd=str(project), check=True)
+
+    results = compress_all([str(tmp_path / "repos" / "*")], concurrency=3, batch_tokens=400, parallelism=4,
+                           use_cache=False, dedup=False)
+
+    assert [r["status"] for r in results] == ["ok", "ok"]
+    assert not fake_client.messages.prompts  # nothing went through the synchronous client
+    assert fake.calls > 5 and fake.max_in_flight <= 3
+    # Every successful request's usage is in the table, batches included
+    assert sum(r["input_tokens"] for r in results) == 100 * (fake.calls - 1)
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    from locohost_cli import locohost
+    from locohost_cli.benchmarks.fake_anthropic import serve
+    with serve(response_bytes=300) as server:
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", server.url)
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+        monkeypatch.setattr(locohost, "_client", None)
+        yield server
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_compress_cot_against_fake_server(project_setup, fake_server, stream):
+    project_name, _, context_dir = project_setup
+    _create_cot(project_name, "Initial CoT entry", context_dir=context_dir)
+    assert _compress_cot(project_name, context_dir=context_dir, stream=stream, use_cache=False).endswith("snapshot.md")
+
+    request, = fake_server.requests
+    assert "Initial CoT entry" in prompt_text(request["messages"][0]["content"])
+    assert bool(request.get("stream")) == stream
+    with open(os.path.join(context_dir, "snapshot.md")) as f:
+        assert f.read().startswith("Synthetic response text.")
+
+def test_compression_prefix_is_marked_for_prompt_caching(project_setup, fake_server):
+    from locohost_cli import metrics
+    project_name, _, context_dir = project_setup
+    _create_cot(project_name, "Initial CoT entry", context_dir=context_dir)
+    _compress_cot(project_name, context_dir=context_dir, use_cache=False)
+    _update_cot(project_name, "Updated CoT entry", context_dir=context_dir)
+    metrics.reset()
+    _compress_cot(project_name, context_dir=context_dir, use_cache=False)
+    _compress_cot(project_name, context_dir=context_dir, full=True, use_cache=False)
+
+    # The instructions and snapshot are one cached block, the new content another
+    for request in fake_server.requests:
+        prefix, suffix = request["messages"][0]["content"]
+        assert prefix["cache_control"] == {"type": "ephemeral"} and "cache_control" not in suffix
+        assert "[COMPRESSED_CONTENT]" in prefix["text"] and "CoT entry" not in prefix["text"]
+    assert "Synthetic response text." in fake_server.requests[1]["messages"][0]["content"][0]["text"]
+    assert "Updated CoT entry" in fake_server.requests[1]["messages"][0]["content"][1]["text"]
+
+    # The snapshot did not change, so the second request read the prefix from the cache
+    usage = metrics.report()["api"]["messages.create"]
+    assert usage["calls"] == 2
+    assert usage["cache_creation_input_tokens"] > 0 and usage["cache_read_input_tokens"] > 0
+
+def test_pack_cot_reads_across_packed_and_loose_entries(project_setup, fake_client, monkeypatch, capsys):
+    project_name, project_dir, context_dir = project_setup
+    for i in range(1, 13):
+        _create_cot(project_name, f"Entry {i} about ledger {i}", context_dir=context_dir)
+        _update_cot(project_name, f"Follow-up {i}", context_dir=context_dir)
+    _create_cot(project_name, "A json entry", format='json', context_dir=context_dir)
+    _compress_cot(project_name, context_dir=context_dir)
+    _create_cot(project_name, "Written after the snapshot", context_dir=context_dir)
+
+    records = _pack_cot(context_dir)
+    assert [r["entry"] for r in records] == list(range(1, 12))
+    names = set(os.listdir(context_dir))
+    assert "cot_0001.md" not in names and {"cot_0012.md", "cot_0013.json", "cot_0014.md"} <= names
+
+    # Numbering, search, incremental and full compression all see packed entries
+    assert _rebuild_cot_index(context_dir)["next"] == 15
+    _create_cot(project_name, "After the pack", context_dir=context_dir)
+    assert os.path.exists(os.path.join(context_dir, "cot_0015.md"))
+    os.remove(os.path.join(context_dir, ".cot_search.db"))
+    monkeypatch.chdir(project_dir)
+    assert {r["entry"] for r in search_cot("ledger", limit=20)} == set(range(1, 13))
+    _compress_cot(project_name, context_dir=context_dir)
+    assert "Entry 3 about" not in fake_client.messages.prompts[-1]
+    _compress_cot(project_name, context_dir=context_dir, full=True, use_cache=False, dedup=False)
+    assert "Entry 3 about ledger 3" in fake_client.messages.prompts[-1]
+    assert "Follow-up 11" in fake_client.messages.prompts[-1]
+
+    # The snapshot moved on: the next pack appends to the same segment, and
+    # the newest entry of each format stays loose
+    assert [(r["entry"], r["pack"]) for r in _pack_cot(context_dir)] == [(12, records[0]["pack"]),
+                                                                         (14, records[0]["pack"])]
+    assert _pack_cot(context_dir) == []
+    rebuild_cot_index(project_name)
+    assert [r["entry"] for r in search_cot('"written after"')] == [14]
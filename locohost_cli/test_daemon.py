@@ -0,0 +1,96 @@
+import os
+import threading
+
+import pytest
+
+from locohost_cli import daemon
+from locohost_cli.locohost import _build_parser, _run_in_daemon, main
+
+
+@pytest.fixture
+def socket_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "locohost.sock")
+    monkeypatch.setenv(daemon.SOCKET_ENV, path)
+    monkeypatch.delenv(daemon.DISABLE_ENV, raising=False)
+    return path
+
+
+@pytest.fixture
+def running_daemon(socket_file):
+    parser = _build_parser()
+    thread = threading.Thread(target=daemon.serve,
+                              args=(lambda argv, log: _run_in_daemon(parser, argv, log), socket_file), daemon=True)
+    thread.start()
+    for _ in range(200):
+        if daemon.control("status", socket_file):
+            break
+        threading.Event().wait(0.01)
+    yield socket_file
+    daemon.control("stop", socket_file)
+    thread.join(5)
+
+
+def test_commands_are_forwarded_to_the_daemon(tmp_path, monkeypatch, capsys, running_daemon):
+    project = tmp_path / "project"
+    project.mkdir()
+    monkeypatch.chdir(project)
+
+    assert main(["create_cot", "--project-name", "p", "--context", "first thought"]) == 0
+    assert main(["update_cot", "--project-name", "p", "--context", "second thought"]) == 0
+    assert main(["search_cot", "--query", "second"]) == 0
+    assert daemon.control("status", running_daemon)["served"] == 3
+
+    # The daemon ran in the client's directory, not its own
+    with open(project / ".context" / "cot_0001.md") as f:
+        text = f.read()
+    assert "first thought" in text and "second thought" in text
+
+    # Output and errors come back to the client
+    assert main(["search_cot", "--query", "thought"]) == 0
+    assert "[thought]" in capsys.readouterr().out
+    assert daemon.call(["search_cot"])["exit"] == 2
+
+
+def test_only_journal_actions_are_forwarded(tmp_path, monkeypatch, running_daemon):
+    monkeypatch.chdir(tmp_path)
+    assert not main(["create_cot", "--project-name", "p", "--context", "journal"])
+    served = daemon.control("status", running_daemon)["served"]
+
+    # Everything else runs in this process, and the daemon refuses it if asked directly
+    assert main(["rebuild_cot_index", "--project-name", "p"]) is None
+    assert daemon.control("status", running_daemon)["served"] == served
+    reply = daemon.call(["rebuild_cot_index", "--project-name", "p"])
+    assert reply["exit"] == 2 and "not run by the daemon" in reply["stderr"]
+
+
+def test_requests_run_with_the_clients_environment(tmp_path, monkeypatch, socket_file):
+    def run(argv, log):
+        print(os.environ.get("LOCOHOST_PROBE"), os.environ.get("LOCOHOST_DAEMON_ONLY"))
+        return 0
+
+    monkeypatch.setenv("LOCOHOST_DAEMON_ONLY", "daemon")
+    thread = threading.Thread(target=daemon.serve, args=(run, socket_file), daemon=True)
+    thread.start()
+    for _ in range(200):
+        if daemon.control("status", socket_file):
+            break
+        threading.Event().wait(0.01)
+    try:
+        request = {"argv": ["anything"], "cwd": str(tmp_path), "env": {"LOCOHOST_PROBE": "client"}}
+        assert daemon._exchange(daemon._connect(socket_file), request)["stdout"] == "client None\n"
+        # The daemon's own variables are back once the request is done
+        assert os.environ.get("LOCOHOST_DAEMON_ONLY") == "daemon" and "LOCOHOST_PROBE" not in os.environ
+    finally:
+        daemon.control("stop", socket_file)
+        thread.join(5)
+
+
+def test_falls_back_to_in_process_without_a_daemon(tmp_path, monkeypatch, socket_file):
+    monkeypatch.chdir(tmp_path)
+    assert daemon.call(["create_cot"]) is None
+    assert not main(["create_cot", "--project-name", "p", "--context", "offline"])
+    assert os.path.exists(tmp_path / ".context" / "cot_0001.md")
+
+    # A socket left behind by a daemon that died is not mistaken for one
+    open(socket_file, "w").close()
+    assert not main(["update_cot", "--project-name", "p", "--context", "still offline"])
@@ -0,0 +1,82 @@
+import json
+
+from locohost_cli.dedup import collapse_duplicates
+from locohost_cli.locohost import _create_cot, _update_cot, _read_cot_deltas
+
+
+def _md_update(timestamp, text):
+    return f"\n\n## Update: {timestamp}\n\n{text}"
+
+
+def test_exact_and_normalized_duplicates_collapse_into_latest():
+    chunk = ("# Chain of Thought Entry 1\n\nCreated: 2024-05-01 10:00:00\n\nProject: p\n\n## Entry\n\nStart"
+             + _md_update("2024-05-01 10:01:00", "Build status: 41 tests passing")
+             + _md_update("2024-05-01 10:02:00", "Build status: 42 tests passing")
+             + _md_update("2024-05-01 10:03:00", "Switched the queue to Redis streams")
+             + _md_update("2024-05-01 10:04:00", "Build status: 42 tests passing"))
+
+    (collapsed,), dropped = collapse_duplicates([chunk])
+
+    assert dropped == 2
+    assert collapsed.count("Build status") == 1
+    assert "(Recorded 2 earlier times with minor differences, first at 2024-05-01 10:01:00)" in collapsed
+    # The latest occurrence is kept, in its place after the unrelated update
+    assert collapsed.index("Switched the queue") < collapsed.index("## Update: 2024-05-01 10:04:00")
+    assert "10:01:00" not in collapsed.replace("first at 2024-05-01 10:01:00", "")
+    assert collapsed.startswith("# Chain of Thought Entry 1")
+
+
+def test_latest_values_survive_a_collapse():
+    chunk = ("# Chain of Thought Entry 1\n\nStart"
+             + _md_update("2024-05-01 10:01:00", "Tests: 3 passed, 5 failed")
+             + _md_update("2024-05-01 10:09:00", "Tests: 8 passed, 0 failed"))
+
+    (collapsed,), dropped = collapse_duplicates([chunk])
+
+    assert dropped == 1
+    assert "Tests: 8 passed, 0 failed" in collapsed and "5 failed" not in collapsed
+
+    # Differing timestamps and ids make an exact duplicate; differing numbers do not
+    (collapsed,), _ = collapse_duplicates([_md_update("1", "Retry 3 of job 4f3a9c21e at 10:00:01")
+                                           + _md_update("2", "Retry 3 of job 7b1d0e44a at 10:00:09")])
+    assert collapsed.endswith("job 7b1d0e44a at 10:00:09\n\n(Recorded 1 earlier time, first at 1)")
+    (collapsed,), _ = collapse_duplicates([_md_update("1", "Retry 3 of job 4f3a9c21e at 10:00:01")
+                                           + _md_update("2", "Retry 4 of job 4f3a9c21e at 10:00:01")])
+    assert collapsed.endswith("Retry 4 of job 4f3a9c21e at 10:00:01\n\n"
+                              "(Recorded 1 earlier time with minor differences, first at 1)")
+
+
+def test_near_duplicate_stack_traces_collapse_across_chunks():
+    trace = "\n".join(f'  File "app/worker.py", line {100 + i}, in step_{i}\n    result = handler(payload)'
+                      for i in range(12))
+    first = _md_update("2024-05-01 10:00:00", f"Traceback (most recent call last):\n{trace}\nKeyError: 'user'")
+    second = json.dumps({"type": "update", "timestamp": "2024-05-02 09:00:00",
+                         "content": f"Traceback (most recent call last):\n{trace}\n  extra frame\nKeyError: 'org'"}) + "\n"
+    unrelated = json.dumps({"type": "update", "timestamp": "2024-05-02 09:05:00",
+                            "content": "Decided to retry failed jobs with exponential backoff"}) + "\n"
+
+    collapsed, dropped = collapse_duplicates([first, second + unrelated])
+
+    # The first chunk held only the earlier trace, so it is gone
+    assert dropped == 1
+    assert "KeyError: 'user'" not in "".join(collapsed)
+    latest, decision = (json.loads(line) for line in collapsed[0].splitlines())
+    assert latest["content"].endswith("KeyError: 'org'")
+    assert latest["repeated"] == "Recorded 1 earlier time with minor differences, first at 2024-05-01 10:00:00"
+    assert decision["content"].startswith("Decided to retry")
+
+
+def test_compression_input_shrinks_for_looping_agent(tmp_path):
+    context_dir = str(tmp_path)
+    _create_cot("p", "Polling the deploy", context_dir=context_dir)
+    for i in range(200):
+        _update_cot("p", f"Deploy still pending, attempt {i}, pod web-{i:04x} not ready", context_dir=context_dir)
+    _update_cot("p", "Deploy finished", context_dir=context_dir)
+
+    chunks, _ = _read_cot_deltas(context_dir, {})
+    collapsed, dropped = collapse_duplicates(chunks)
+
+    assert dropped == 199
+    assert len("".join(collapsed)) < len("".join(chunks)) / 20
+    assert "attempt 199," in collapsed[0] and "attempt 0," not in collapsed[0]
+    assert "Deploy finished" in collapsed[0]
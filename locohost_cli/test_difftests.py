@@ -0,0 +1,133 @@
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from locohost_cli.difftests import assemble_test_file, group_by_module, parse_unified_diff, generated_test_path
+from locohost_cli.locohost import generate_tests_for_diff
+
+DIFF = """diff --git a/app/orders.py b/app/orders.py
+index 1111111..2222222 100644
+--- a/app/orders.py
++++ b/app/orders.py
+@@ -10,4 +10,6 @@ def total(order):
+     subtotal = sum(item.price for item in order.items)
+-    return subtotal
++    if order.coupon:
++        subtotal -= order.coupon.amount
++    return max(subtotal, 0)
+
+
+@@ -40,3 +42,4 @@ class Order:
+     def cancel(self):
+         self.status = "cancelled"
++        self.cancelled_at = now()
+diff --git a/app/users.py b/app/users.py
+--- a/app/users.py
++++ b/app/users.py
+@@ -1,2 +1,3 @@
+ import re
++EMAIL_RE = re.compile(r"^[^@]+@[^@]+$")
+
+diff --git a/tests/test_orders.py b/tests/test_orders.py
+--- a/tests/test_orders.py
++++ b/tests/test_orders.py
+@@ -1 +1,2 @@
+ import pytest
++import app
+diff --git a/app/legacy.py b/app/legacy.py
+deleted file mode 100644
+--- a/app/legacy.py
++++ /dev/null
+@@ -1,2 +0,0 @@
+-def old():
+-    pass
+"""
+
+
+def test_parse_unified_diff_groups_source_hunks_by_module():
+    files = parse_unified_diff(DIFF)
+    assert sorted(files) == ["app/orders.py", "app/users.py", "tests/test_orders.py"]
+    first, second = files["app/orders.py"]
+    assert first.heading == "def total(order):"
+    assert first.lines[1] == "-    return subtotal"
+    assert len(first.lines) == 7
+    assert second.new_start == 42
+
+    modules = group_by_module(files)
+    assert list(modules) == ["app/orders.py", "app/users.py"]
+    assert generated_test_path("app/orders.py") == "app/test_orders.py"
+    assert generated_test_path("svc/handler.go") == "svc/handler_test.go"
+
+
+def test_hunk_key_ignores_line_numbers():
+    shifted = DIFF.replace("@@ -40,3 +42,4 @@", "@@ -90,3 +97,4 @@")
+    before = [hunk.key("m") for hunk in parse_unified_diff(DIFF)["app/orders.py"]]
+    after = [hunk.key("m") for hunk in parse_unified_diff(shifted)["app/orders.py"]]
+    assert before == after
+
+
+def test_assemble_test_file_hoists_imports():
+    content = assemble_test_file("app/orders.py", ["import pytest\nfrom app.orders import total\n\ndef test_a():\n    pass",
+                                                   "import pytest\n\ndef test_b():\n    pass"])
+    assert content.count("import pytest") == 1
+    assert content.index("from app.orders import total") < content.index("def test_a")
+    compile(content, "generated", "exec")
+
+
+def test_assemble_test_file_merges_python_import_blocks():
+    content = assemble_test_file("app/orders.py", [
+        "from app.orders import (\n    total,\n    tax,\n)\nimport pytest\n\ndef test_a():\n    assert total and tax",
+        "from __future__ import annotations\nimport pytest\nfrom app.orders import (total,\n                        tax)\n\n"
+        "def test_b():\n    pass",
+    ])
+    assert content.count("from app.orders import total, tax") == 1 and content.count("import pytest") == 1
+    assert content.index("from __future__") < content.index("import pytest") < content.index("def test_a")
+    assert "    tax,\n)" not in content
+    compile(content, "generated", "exec")
+
+
+GO_SECTIONS = [
+    'package orders\n\nimport (\n\t"testing"\n\t"time"\n)\n\nfunc TestA(t *testing.T) {\n\t_ = time.Now()\n}',
+    'package orders\n\nimport (\n\t"strings"\n\t"testing"\n)\n\nfunc TestB(t *testing.T) {\n\t_ = strings.ToUpper("x")\n}',
+]
+
+
+def test_assemble_test_file_merges_go_import_blocks(tmp_path):
+    content = assemble_test_file("svc/orders.go", GO_SECTIONS)
+    assert content.count("package orders") == 1 and content.count("import (") == 1
+    assert content.count('"testing"') == 1 and '"strings"' in content and '"time"' in content
+    assert content.index(")") < content.index("func TestA")
+    if shutil.which("gofmt") is None:
+        pytest.skip("gofmt is not installed")
+    (tmp_path / "orders_test.go").write_text(content)
+    result = subprocess.run(["gofmt", "-e", str(tmp_path / "orders_test.go")], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def _tests_reply(prompt):
+    markers = re.findall(r"\[HUNK (TESTS_\w+)\]", prompt)
+    return "\n".join(f"[{m}]\nimport pytest\n\ndef test_{m.lower()}():\n    assert True\n[/{m}]" for m in markers)
+
+
+def test_generate_tests_for_diff_caches_per_hunk(tmp_path, monkeypatch, fake_client):
+    fake_client.messages.respond = _tests_reply
+    monkeypatch.chdir(tmp_path)
+    diff_file = tmp_path / "change.diff"
+    diff_file.write_text(DIFF)
+
+    written = generate_tests_for_diff("p", str(diff_file), parallelism=2)
+    assert sorted(written) == ["app/orders.py", "app/users.py"]
+    with open(written["app/orders.py"]) as f:
+        content = f.read()
+    assert content.count("def test_tests_") == 2
+    assert len(fake_client.messages.prompts) == 2  # one request per module
+
+    # Only the edited hunk is requested again; line shifts alone cost nothing
+    diff_file.write_text(DIFF.replace("@@ -40,3 +42,4 @@", "@@ -41,3 +44,4 @@")
+                         .replace("now()", "utcnow()"))
+    generate_tests_for_diff("p", str(diff_file))
+    assert len(fake_client.messages.prompts) == 3
+    assert "utcnow()" in fake_client.messages.prompts[-1]
+    assert "max(subtotal, 0)" not in fake_client.messages.prompts[-1]
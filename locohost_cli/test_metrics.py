@@ -0,0 +1,59 @@
+import json
+import logging
+import os
+
+import pytest
+
+from locohost_cli import metrics
+from locohost_cli.locohost import _create_cot, _update_cot, main
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_cot_writes_are_measured(tmp_path):
+    context_dir = str(tmp_path / ".context")
+    _create_cot("test_project", "Initial CoT entry", format='jsonl', context_dir=context_dir)
+    _update_cot("test_project", "Updated CoT entry", format='jsonl', context_dir=context_dir)
+
+    ops = metrics.report()["operations"]
+    assert ops["create_cot"]["calls"] == 1
+    assert ops["update_cot"]["calls"] == 1
+    assert ops["update_cot"]["bytes_written"] == len(
+        open(os.path.join(context_dir, "cot_0001.jsonl")).readlines()[1].encode())
+    assert ops["rebuild_cot_index"]["files_scanned"] >= 0
+
+
+def test_api_usage_is_aggregated():
+    usage = {"input_tokens": 100, "output_tokens": 20, "cache_read_input_tokens": 80}
+    metrics.record_api_call("messages.create", 1.5, usage)
+    metrics.record_api_call("messages.create", 0.5, usage)
+    metrics.record_api_call("messages.create", 0.0, cached=True)
+
+    api = metrics.report()["api"]["messages.create"]
+    assert api["calls"] == 2
+    assert api["cache_hits"] == 1
+    assert api["latency_s"] == 2.0
+    assert api["max_latency_s"] == 1.5
+    assert api["input_tokens"] == 200
+    assert api["cache_read_input_tokens"] == 160
+
+
+def test_cli_writes_metrics_json_and_keeps_content_out_of_logs(tmp_path, monkeypatch, caplog):
+    monkeypatch.chdir(tmp_path)
+    _create_cot("test_project", "secret journal text", context_dir=str(tmp_path / ".context"))
+    metrics_file = tmp_path / "metrics.json"
+
+    with caplog.at_level(logging.DEBUG):
+        _update_cot("test_project", "more secret journal text", context_dir=str(tmp_path / ".context"))
+        metrics.reset()
+        main(["--log-level", "debug", "--metrics-json", str(metrics_file),
+              "rebuild_cot_index", "--project-name", "test_project"])
+
+    assert "secret journal text" not in caplog.text
+    report = json.loads(metrics_file.read_text())
+    assert report["operations"]["rebuild_cot_index"]["calls"] == 1
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from locohost_cli import pack
+from locohost_cli.locohost import _atomic_write
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_entries_are_read_back_from_their_blocks(tmp_path, monkeypatch, codec):
+    monkeypatch.setattr(pack, "BLOCK_BYTES", 1000)
+    context_dir = str(tmp_path)
+    entries = [(n, f"cot_{n:04d}.md", "md", f"entry {n} ".encode() * (n * 10)) for n in range(1, 40)]
+
+    records = pack.append(context_dir, entries, _atomic_write, codec)
+    index = pack.load_index(os.path.join(pack.pack_dir(context_dir), records[0]["pack"]))
+    assert 1 < len(index["blocks"]) < len(entries)
+    for record, (number, _, _, data) in zip(reversed(records), reversed(entries)):
+        assert pack.read(context_dir, record) == data
+    assert pack.records(context_dir) == records
+
+
+def test_interrupted_append_is_truncated(tmp_path):
+    context_dir = str(tmp_path)
+    first = pack.append(context_dir, [(1, "cot_0001.md", "md", b"first entry")], _atomic_write)
+    segment = os.path.join(pack.pack_dir(context_dir), first[0]["pack"])
+    with open(segment, "ab") as f:
+        f.write(b"garbage from a crashed append")
+
+    second = pack.append(context_dir, [(2, "cot_0002.md", "md", b"second entry")], _atomic_write)
+    assert second[0]["pack"] == first[0]["pack"]
+    assert second[0]["offset"] == first[0]["offset"] + first[0]["length"]
+    assert [pack.read(context_dir, r) for r in pack.records(context_dir)] == [b"first entry", b"second entry"]
+
+    # A different codec starts a new segment
+    third = pack.append(context_dir, [(3, "cot_0003.md", "md", b"third entry")], _atomic_write, codec="lzma")
+    assert third[0]["pack"] != first[0]["pack"]
+    assert pack.segments(context_dir) == [first[0]["pack"], third[0]["pack"]]
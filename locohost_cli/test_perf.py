@@ -0,0 +1,68 @@
+import os
+import subprocess
+
+from locohost_cli import perf
+from locohost_cli.locohost import main
+
+BENCH = """import time
+
+DELAY = {delay}
+
+
+def bench_sleep():
+    time.sleep(DELAY)
+
+
+def bench_sum():
+    sum(range(100))
+"""
+
+
+def test_mann_whitney_separates_shifted_samples():
+    base = [1.0 + i * 0.01 for i in range(10)]
+    assert perf.mann_whitney_p(base, [x + 1 for x in base]) < 0.001
+    assert perf.mann_whitney_p(base, list(reversed(base))) > 0.9
+
+    rows = perf.compare({"b": {"median": 1.0, "samples": base}},
+                        {"b": {"median": 1.5, "samples": [x + 0.5 for x in base]}}, threshold=0.1)
+    assert rows[0]["status"] == "regressed"
+
+
+def test_measure_autoranges_micro_benchmarks():
+    result = perf.measure(lambda: None, warmup=1, repeat=3)
+    assert result["kind"] == "micro" and result["number"] > 1
+    assert len(result["samples"]) == 3
+
+
+def test_generate_performance_tests_gates_on_baseline(tmp_path, monkeypatch, capsys):
+    root = str(tmp_path)
+    subprocess.run(["git", "init"], cwd=root, check=True, capture_output=True)
+    os.makedirs(os.path.join(root, "benchmarks"))
+    bench_file = os.path.join(root, "benchmarks", "bench_app.py")
+    with open(bench_file, "w") as f:
+        f.write(BENCH.format(delay=0.002))
+    monkeypatch.chdir(root)
+
+    # First run records and commits the baseline
+    assert main(["generate_performance_tests", "--project-name", "p", "--repeat", "6", "--warmup", "1"]) == 0
+    baseline = subprocess.run(["git", "show", "refs/locohost/snapshots:.context/perf_baseline.json"], cwd=root,
+                              capture_output=True, text=True).stdout
+    assert "benchmarks/bench_app.py::bench_sleep" in baseline
+
+    with open(bench_file, "w") as f:
+        f.write(BENCH.format(delay=0.01))
+    assert main(["generate_performance_tests", "--project-name", "p", "--repeat", "6", "--warmup", "1"]) == 1
+    out = capsys.readouterr().out
+    assert "bench_sleep" in out and "regressed" in out
+
+
+def test_generate_performance_tests_exits_cleanly_when_the_api_fails(tmp_path, monkeypatch, fake_client, caplog):
+    subprocess.run(["git", "init"], cwd=tmp_path, check=True, capture_output=True)
+    monkeypatch.chdir(tmp_path)
+
+    def unreachable(prompt):
+        raise ConnectionError("connection refused")
+    fake_client.messages.respond = unreachable
+
+    assert main(["generate_performance_tests", "--project-name", "p"]) == 1
+    assert "Could not generate benchmarks: connection refused" in caplog.text
@@ -0,0 +1,137 @@
+import os
+
+from locohost_cli import repomap
+from locohost_cli.locohost import edit_project_code, generate_new_project_code
+
+GO = """package store
+
+import (
+    "context"
+    db "example.com/app/internal/db"
+)
+
+type Store struct {
+    conn *db.Conn
+}
+
+func New(conn *db.Conn) *Store {
+    return &Store{conn: conn}
+}
+
+func (s *Store) Get(ctx context.Context, id string) (string, error) {
+    return s.conn.Query(ctx, "select 1")
+}
+"""
+
+TS = """import { Client } from './client';
+const helpers = require("../util/helpers");
+
+export interface Options { retries: number }
+export async function fetchAll(client: Client, opts: Options) {
+  return client.get('/all');
+}
+export default class Poller {}
+"""
+
+
+def test_parse_finds_definitions_and_imports():
+    go = repomap.parse("internal/store/store.go", GO)
+    assert [d[0] for d in go["defs"]] == ["Store", "New", "Store.Get"]
+    assert go["imports"] == ["context", "example.com/app/internal/db"]
+    assert "Query" in go["refs"] and "select" not in go["refs"]
+
+    ts = repomap.parse("web/api.ts", TS)
+    assert [(d[0], d[1]) for d in ts["defs"]] == [("helpers", "variable"), ("Options", "interface"),
+                                                  ("fetchAll", "function"), ("Poller", "class")]
+    assert ts["imports"] == ["../util/helpers", "./client"]
+
+    py = repomap.parse("pkg/mod.py", "from . import base\nclass A(base.B):\n    def run(self, x: int) -> str:\n"
+                                     "        return helper(x)\n")
+    assert [d[3] for d in py["defs"]] == ["class A(base.B)", "def A.run(self, x: int) -> str"]
+    assert {".", ".base"} <= set(py["imports"]) and "helper" in py["refs"]
+
+
+def _write(root, path, text):
+    os.makedirs(os.path.dirname(os.path.join(root, path)) or root, exist_ok=True)
+    with open(os.path.join(root, path), "w") as f:
+        f.write(text)
+
+
+def _project(root):
+    _write(root, "app/__init__.py", "")
+    _write(root, "app/models.py", "class Invoice:\n    def total(self):\n        return 1\n")
+    _write(root, "app/billing.py", "from .models import Invoice\n\ndef charge(invoice: Invoice):\n"
+                                   "    return invoice.total()\n")
+    _write(root, "app/api.py", "from app.billing import charge\n\ndef handle(request):\n    return charge(request)\n")
+    for i in range(30):
+        _write(root, f"app/unrelated_{i}.py", f"def helper_{i}(x):\n" + "    x += 1\n" * 200 + "    return x\n")
+
+
+def test_update_is_incremental_and_related_follows_imports(tmp_path):
+    root = str(tmp_path)
+    _project(root)
+    repo_map = repomap.load(str(tmp_path / "missing.json"))
+    assert repomap.update(root, repo_map)[0] == 34
+    assert repomap.update(root, repo_map) == (0, False)
+    os.utime(tmp_path / "app" / "api.py", (1, 1))
+    assert repomap.update(root, repo_map) == (0, True)
+    _write(root, "app/api.py", "from app.billing import charge\n")
+    assert repomap.update(root, repo_map)[0] == 1
+
+    ranked = [path for score, path in repomap.related(repo_map, "app/billing.py")]
+    assert ranked[:2] == ["app/models.py", "app/api.py"]
+    text = repomap.render(repo_map, repomap.related(repo_map, "app/billing.py"), 30, lambda t: len(t) // 4)
+    assert "def Invoice.total(self)" in text and "helper_" not in text
+
+
+def test_edit_project_code_sends_a_slice_of_the_repo(tmp_path, monkeypatch, fake_client):
+    root = str(tmp_path)
+    _project(root)
+    os.chmod(tmp_path / "app" / "billing.py", 0o755)
+    monkeypatch.chdir(root)
+    fake_client.messages.respond = lambda prompt: (
+        "[FILE_TEXT]\n```python\ndef charge(invoice):\n    return invoice.total() * 2\n```\n"
+        "[/FILE_TEXT]\n[SUMMARY]\nDouble the charge\n[/SUMMARY]")
+
+    edit_project_code("p", "app/billing.py", instructions="Double the charge")
+    prompt = fake_client.messages.prompts[-1]
+    assert "def Invoice.total(self)" in prompt and "Double the charge" in prompt
+    assert "x += 1" not in prompt
+    whole_repo = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(tmp_path / "app")
+                     for f in files)
+    assert len(prompt) * 10 < whole_repo
+
+    with open(tmp_path / "app" / "billing.py") as f:
+        assert f.read() == "def charge(invoice):\n    return invoice.total() * 2\n"
+    assert os.stat(tmp_path / "app" / "billing.py").st_mode & 0o777 == 0o755
+    with open(tmp_path / ".context" / "cot_0001.md") as f:
+        assert "Edited app/billing.py: Double the charge" in f.read()
+
+
+def test_edit_project_code_keeps_fences_inside_a_file(tmp_path, monkeypatch, fake_client):
+    monkeypatch.chdir(tmp_path)
+    readme = "Usage:\n\n```bash\nlocohost --help\n```\n"
+    _write(str(tmp_path), "README.md", readme)
+    fake_client.messages.respond = lambda prompt: (
+        f"[FILE_TEXT]\n# Tool\n\n{readme}```\nlocohost search_cot\n```\n[/FILE_TEXT]\n[SUMMARY]\nTitle\n[/SUMMARY]")
+
+    edit_project_code("p", "README.md", instructions="Add a title")
+    with open(tmp_path / "README.md") as f:
+        assert f.read() == f"# Tool\n\n{readme}```\nlocohost search_cot\n```\n"
+
+
+def test_generate_new_project_code_writes_files_inside_the_project(tmp_path, monkeypatch, fake_client):
+    root = str(tmp_path)
+    monkeypatch.chdir(root)
+    _write(root, ".context/snapshot.md", "A CLI that prints invoices.")
+    _write(root, "keep.py", "KEEP = 1\n")
+    fake_client.messages.respond = lambda prompt: (
+        "[FILE cli/main.py]\nprint('invoices')\n[/FILE]\n[FILE keep.py]\nKEEP = 2\n[/FILE]\n"
+        "[FILE ../escape.py]\nx = 1\n[/FILE]")
+
+    assert generate_new_project_code("p", "Python") == ["cli/main.py"]
+    assert "A CLI that prints invoices." in fake_client.messages.prompts[-1]
+    assert "KEEP = 1" in fake_client.messages.prompts[-1]
+    with open(tmp_path / "keep.py") as f:
+        assert f.read() == "KEEP = 1\n"
+    assert not os.path.exists(tmp_path.parent / "escape.py")
@@ -0,0 +1,51 @@
+import os
+import re
+
+from locohost_cli.locohost import review_and_refactor
+
+
+def _review_reply(prompt):
+    files = re.findall(r"\[FILE (REVIEW_\w+) (\S+)\]", prompt)
+    return "\n".join(f"[{marker}]\n" + ("No issues" if "clean" in path else f"- {path}: rename x") + f"\n[/{marker}]"
+                     for marker, path in files)
+
+
+def _write(root, path, text):
+    os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+    with open(os.path.join(root, path), "w") as f:
+        f.write(text)
+
+
+def test_review_only_sends_changed_files(tmp_path, monkeypatch, fake_client):
+    fake_client.messages.respond = _review_reply
+    root = str(tmp_path)
+    monkeypatch.chdir(root)
+    for i in range(6):
+        _write(root, f"svc/module_{i}.py", f"def f{i}(x):\n    return x * {i}\n" * 20)
+    _write(root, "svc/clean.py", "VALUE = 1\n")
+
+    report_file = review_and_refactor("p", parallelism=3, batch_tokens=300)
+    requests = len(fake_client.messages.prompts)
+    assert requests > 1
+    with open(report_file) as f:
+        report = f.read()
+    assert "6 of 7 files have findings" in report
+    assert "svc/clean.py" not in report
+
+    # Nothing changed: no requests at all
+    review_and_refactor("p")
+    assert len(fake_client.messages.prompts) == requests
+
+    # Touching a file without changing it costs a re-hash, not a request
+    os.utime(os.path.join(root, "svc/module_0.py"), (1, 1))
+    review_and_refactor("p")
+    assert len(fake_client.messages.prompts) == requests
+
+    # Only the edited file is sent again; other findings are reused
+    _write(root, "svc/module_3.py", "def f3(x):\n    return x\n")
+    review_and_refactor("p")
+    assert len(fake_client.messages.prompts) == requests + 1
+    last = fake_client.messages.prompts[-1]
+    assert "svc/module_3.py" in last and "svc/module_2.py" not in last
+    with open(report_file) as f:
+        assert "## svc/module_2.py" in f.read()
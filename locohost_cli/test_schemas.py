@@ -0,0 +1,40 @@
+import pytest
+from locohost_cli.schemas import (
+    CompressionResult, SnapshotData, ResponseFormatError, extract_sections, parse_response,
+)
+
+def test_parse_response_extracts_all_sections():
+    text = ("Sure!\n[FILE_TEXT]\nHello\n[/FILE_TEXT]\n[COMMIT_MESSAGE]\nAdd hello\n[/COMMIT_MESSAGE]\n"
+            "[CHANGELOG]\n- hello\n[/CHANGELOG]")
+    data = parse_response(text, SnapshotData)
+    assert data.model_dump() == {"file_text": "Hello", "commit_message": "Add hello", "changelog": "- hello"}
+
+def test_unterminated_section_runs_to_next_marker():
+    text = "[COMPRESSED_CONTENT]\nSnapshot\n[COMMIT_MESSAGE]\nMessage"
+    assert extract_sections(text, CompressionResult) == {"compressed_content": "Snapshot", "commit_message": "Message"}
+
+def test_missing_section_is_repaired_without_redoing_the_rest():
+    calls = []
+
+    def repair(schema, prompt, retry_budget):
+        calls.append((sorted(schema.model_fields), retry_budget))
+        assert "Snapshot" in prompt
+        return schema(commit_message="Compress CoT")
+
+    result = parse_response("[COMPRESSED_CONTENT]\nSnapshot\n[/COMPRESSED_CONTENT]", CompressionResult,
+                            repair=repair, retry_budget=3)
+    assert result.compressed_content == "Snapshot"
+    assert result.commit_message == "Compress CoT"
+    assert calls == [(["commit_message"], 3)]
+
+def test_missing_section_without_repair_raises():
+    with pytest.raises(ResponseFormatError) as excinfo:
+        parse_response("[COMPRESSED_CONTENT]\n   \n[/COMPRESSED_CONTENT]", CompressionResult)
+    assert excinfo.value.missing == ["compressed_content", "commit_message"]
+
+def test_failed_repair_raises():
+    def repair(schema, prompt, retry_budget):
+        raise RuntimeError("still malformed")
+
+    with pytest.raises(ResponseFormatError):
+        parse_response("no markers at all", CompressionResult, repair=repair)
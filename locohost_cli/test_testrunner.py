@@ -0,0 +1,84 @@
+import os
+import textwrap
+
+from locohost_cli import testrunner
+from locohost_cli.locohost import run_tests
+
+
+def _write(root, path, text):
+    full = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    with open(full, "w") as f:
+        f.write(textwrap.dedent(text))
+
+
+def _project(root):
+    _write(root, "app/__init__.py", "")
+    _write(root, "app/pricing.py", """
+        from .rounding import cents
+
+        def total(prices):
+            return cents(sum(prices))
+    """)
+    _write(root, "app/rounding.py", """
+        def cents(value):
+            return round(value, 2)
+    """)
+    _write(root, "app/users.py", """
+        def greet(name):
+            return f"hello {name}"
+    """)
+    _write(root, "tests/test_pricing.py", """
+        from app.pricing import total
+
+        def test_total():
+            assert total([1.005, 2]) == 3.0
+    """)
+    _write(root, "tests/test_users.py", """
+        from app import users
+
+        def test_greet():
+            assert users.greet("ada") == "hello ada"
+    """)
+
+
+def test_dependency_graph_follows_relative_and_package_imports(tmp_path):
+    root = str(tmp_path)
+    _project(root)
+    graph = testrunner.dependency_graph(root, testrunner.python_files(root))
+
+    pricing = os.path.join("tests", "test_pricing.py")
+    assert os.path.join("app", "rounding.py") in testrunner.closure(pricing, graph)
+    assert os.path.join("app", "users.py") not in testrunner.closure(pricing, graph)
+    assert os.path.join("app", "users.py") in graph[os.path.join("tests", "test_users.py")]
+
+
+def test_shard_balances_by_duration():
+    shards = testrunner.shard(["a", "b", "c", "d"], {"a": 10, "b": 6, "c": 5, "d": 1}, 2)
+    assert sorted(map(sorted, shards)) == [["a", "d"], ["b", "c"]]
+
+
+def test_run_tests_skips_unchanged_passes_and_journals_failures(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    _project(root)
+    monkeypatch.chdir(root)
+
+    first = run_tests("p", workers=2)
+    assert (first["ran"], first["cached"], first["passed"], first["failed"]) == (2, 0, 2, [])
+
+    second = run_tests("p", workers=2)
+    assert (second["ran"], second["cached"]) == (0, 2)
+
+    # A change to a transitive import reruns only the tests that depend on it
+    _write(root, "app/rounding.py", """
+        def cents(value):
+            return value * 100
+    """)
+    third = run_tests("p", workers=2)
+    assert (third["ran"], third["cached"]) == (1, 1)
+    assert [nodeid for nodeid, _ in third["failed"]] == [os.path.join("tests", "test_pricing.py") + "::test_total"]
+
+    with open(os.path.join(root, ".context", "cot_0001.md")) as f:
+        journal = f.read()
+    assert "run_tests FAILED: 0 tests passed, 1 failed" in journal
+    assert "test_pricing.py::test_total" in journal
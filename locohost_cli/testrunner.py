@@ -0,0 +1,319 @@
+import ast
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# ========================
+# Test Runner
+# ========================
+
+# run_tests maps every Python file in the project to the local modules it
+# imports, and hashes each test file together with its transitive local
+# imports, the conftest.py files above it and the installed dependencies.
+# A test file whose hash matches its last passing run is skipped. The rest
+# are split into shards balanced by their previous durations, and each shard
+# runs in its own pytest process, so the suite uses every core without
+# requiring pytest-xdist. Tests affected by the working-tree diff are
+# scheduled first.
+RESULTS_FILE = '.test_results.json'
+SKIP_DIRS = {'.git', '.context', '.hg', '.tox', '.nox', '.venv', 'venv', 'env', 'node_modules', '__pycache__',
+             '.pytest_cache', '.mypy_cache', 'build', 'dist'}
+DEPENDENCY_FILES = ('requirements.txt', 'requirements-dev.txt', 'setup.py', 'setup.cfg', 'pyproject.toml',
+                    'poetry.lock', 'Pipfile.lock', 'uv.lock')
+MAX_REPORTED_FAILURES = 20
+
+
+def python_files(root):
+    found = []
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.endswith('.egg-info'))
+        for name in sorted(files):
+            if name.endswith('.py'):
+                found.append(os.path.relpath(os.path.join(directory, name), root))
+    return found
+
+
+def is_test_file(path):
+    name = os.path.basename(path)
+    return (name.startswith('test_') or name.endswith('_test.py')) and name.endswith('.py')
+
+
+def _module_names(root, path):
+    # The names a file can be imported as: from the project root, and from the
+    # nearest directory without __init__.py (where pytest's rootdir-based
+    # import puts it on sys.path)
+    parts = path[:-3].split(os.sep)
+    if parts[-1] == '__init__':
+        parts = parts[:-1]
+    names = {'.'.join(parts)} if parts else set()
+    base = len(path.split(os.sep)) - 1
+    while base > 0 and os.path.exists(os.path.join(root, *path.split(os.sep)[:base], '__init__.py')):
+        base -= 1
+    if parts[base:]:
+        names.add('.'.join(parts[base:]))
+    return names
+
+
+def _imports(root, path, package):
+    try:
+        with open(os.path.join(root, path), 'rb') as f:
+            tree = ast.parse(f.read(), filename=path)
+    except (SyntaxError, ValueError):
+        return set()
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ''
+            if node.level:
+                anchor = package.split('.')[:len(package.split('.')) - node.level + 1] if package else []
+                base = '.'.join(anchor + ([base] if base else []))
+            if base:
+                names.add(base)
+            names.update(f"{base}.{alias.name}" if base else alias.name for alias in node.names)
+    return names
+
+
+def dependency_graph(root, files):
+    # {file: set of local files it imports directly}
+    index = {}
+    for path in files:
+        for name in _module_names(root, path):
+            index.setdefault(name, path)
+    graph = {}
+    for path in files:
+        package = '.'.join(path[:-3].split(os.sep)[:-1])
+        if path.endswith('__init__.py'):
+            package = '.'.join(path.split(os.sep)[:-1])
+        deps = set()
+        for name in _imports(root, path, package):
+            # "import a.b.c" also imports a and a.b
+            parts = name.split('.')
+            for i in range(1, len(parts) + 1):
+                local = index.get('.'.join(parts[:i]))
+                if local and local != path:
+                    deps.add(local)
+        graph[path] = deps
+    return graph
+
+
+def closure(path, graph):
+    seen, stack = {path}, [path]
+    while stack:
+        for dep in graph.get(stack.pop(), ()):
+            if dep not in seen:
+                seen.add(dep)
+                stack.append(dep)
+    return seen
+
+
+def _conftests(root, path):
+    found = []
+    parts = path.split(os.sep)[:-1]
+    for i in range(len(parts) + 1):
+        candidate = os.path.join(*parts[:i], 'conftest.py') if i else 'conftest.py'
+        if os.path.exists(os.path.join(root, candidate)):
+            found.append(candidate)
+    return found
+
+
+def _file_hash(root, path, cache):
+    if path not in cache:
+        h = hashlib.sha256()
+        try:
+            with open(os.path.join(root, path), 'rb') as f:
+                h.update(f.read())
+        except FileNotFoundError:
+            h.update(b'missing')
+        cache[path] = h.hexdigest()
+    return cache[path]
+
+
+def environment_hash(root):
+    from importlib import metadata
+
+    h = hashlib.sha256(sys.version.encode())
+    for name in DEPENDENCY_FILES:
+        path = os.path.join(root, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                h.update(name.encode() + f.read())
+    installed = sorted(f"{dist.metadata['Name']}=={dist.version}" for dist in metadata.distributions())
+    h.update("\n".join(installed).encode())
+    return h.hexdigest()
+
+
+def input_hashes(root, tests, graph):
+    # {test file: hash of everything that can change its outcome}
+    file_hashes = {}
+    env = environment_hash(root)
+    hashes = {}
+    for test in tests:
+        inputs = sorted(closure(test, graph) | set(_conftests(root, test)))
+        h = hashlib.sha256(env.encode())
+        for path in inputs:
+            h.update(f"{path}\0{_file_hash(root, path, file_hashes)}\0".encode())
+        hashes[test] = h.hexdigest()
+    return hashes
+
+
+def changed_files(root):
+    # Files changed in the working tree relative to HEAD, including untracked
+    # ones; None when that cannot be determined (no git, no commits yet)
+    try:
+        diff = subprocess.run(["git", "diff", "--name-only", "--relative", "HEAD", "--"], cwd=root,
+                              capture_output=True, text=True, check=True).stdout
+        untracked = subprocess.run(["git", "ls-files", "--others", "--exclude-standard"], cwd=root,
+                                   capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return {os.path.normpath(line) for line in (diff + untracked).splitlines() if line}
+
+
+def affected_tests(tests, graph, changed):
+    if changed is None:
+        return set(tests)
+    return {test for test in tests if closure(test, graph) & changed}
+
+
+def shard(tests, durations, count):
+    # Each file goes to the least loaded shard, in the order given; callers
+    # sort slowest first so the shards come out balanced
+    shards = [[] for _ in range(max(1, min(count, len(tests))))]
+    loads = [0.0] * len(shards)
+    for test in tests:
+        i = loads.index(min(loads))
+        shards[i].append(test)
+        loads[i] += durations.get(test, 1.0)
+    return [s for s in shards if s]
+
+
+def _parse_junit(path, root):
+    results = {}
+    try:
+        tree = ET.parse(path)
+    except (ET.ParseError, FileNotFoundError):
+        return results
+    for case in tree.iter('testcase'):
+        file = case.get('file')
+        if not file:
+            continue
+        file = os.path.normpath(os.path.relpath(os.path.join(root, file), root))
+        result = results.setdefault(file, {"passed": 0, "failed": [], "duration": 0.0})
+        result["duration"] += float(case.get('time') or 0)
+        problem = case.find('failure')
+        if problem is None:
+            problem = case.find('error')
+        if problem is not None:
+            message = (problem.get('message') or problem.text or '').strip().splitlines()
+            result["failed"].append((f"{file}::{case.get('name')}", message[0][:200] if message else ''))
+        elif case.find('skipped') is None:
+            result["passed"] += 1
+    return results
+
+
+def run_shard(root, tests, pytest_args=()):
+    fd, junit = tempfile.mkstemp(prefix='locohost-junit-', suffix='.xml')
+    os.close(fd)
+    try:
+        command = [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", "-o", "junit_family=xunit1",
+                   "--rootdir", root, f"--junitxml={junit}", *pytest_args, *tests]
+        start = time.perf_counter()
+        process = subprocess.run(command, cwd=root, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        results = _parse_junit(junit, root)
+    finally:
+        os.remove(junit)
+
+    for test in tests:
+        if test not in results:
+            # No test cases recorded: an empty file (exit code 5) passes,
+            # anything else is a collection or interpreter error
+            failed = [] if process.returncode in (0, 5) else \
+                [(test, f"no results, pytest exited with {process.returncode}")]
+            results[test] = {"passed": 0, "failed": failed, "duration": elapsed / len(tests)}
+    if process.returncode not in (0, 1, 5):
+        logger.debug("pytest output for shard %s:\n%s%s", tests, process.stdout, process.stderr)
+    return results
+
+
+def load_results(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f).get("tests", {})
+    except (FileNotFoundError, ValueError, AttributeError):
+        return {}
+
+
+def run(root, results_file, write, workers=None, run_all=False, changed_only=False, pytest_args=()):
+    files = python_files(root)
+    tests = [path for path in files if is_test_file(path)]
+    graph = dependency_graph(root, files)
+    hashes = input_hashes(root, tests, graph)
+    previous = load_results(results_file)
+    affected = affected_tests(tests, graph, changed_files(root))
+
+    selected, cached = [], []
+    for test in tests:
+        record = previous.get(test, {})
+        if not run_all and record.get("passed") and record.get("hash") == hashes[test]:
+            cached.append(test)
+        elif run_all or not changed_only or test in affected:
+            selected.append(test)
+    # Affected tests first, so failures in the change are reported early, then slowest first
+    durations = {test: record.get("duration", 1.0) for test, record in previous.items()}
+    selected.sort(key=lambda test: (test not in affected, -durations.get(test, 1.0)))
+    shards = shard(selected, durations, workers or os.cpu_count() or 1)
+    logger.info("Running %s of %s test files in %s shards (%s cached, %s affected by the diff)",
+                len(selected), len(tests), len(shards), len(cached), len(affected))
+
+    start = time.perf_counter()
+    outcomes = {}
+    if shards:
+        with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+            for results in pool.map(lambda tests: run_shard(root, tests, pytest_args), shards):
+                outcomes.update(results)
+
+    records = dict(previous)
+    for test, outcome in outcomes.items():
+        if test in hashes:
+            records[test] = {"hash": hashes[test], "passed": not outcome["failed"],
+                             "duration": round(outcome["duration"], 3)}
+    for test in list(records):
+        if test not in hashes:
+            del records[test]
+    os.makedirs(os.path.dirname(results_file) or '.', exist_ok=True)
+    write(results_file, json.dumps({"tests": records}, indent=1, sort_keys=True))
+
+    failures = [failure for outcome in outcomes.values() for failure in outcome["failed"]]
+    return {
+        "files": len(tests),
+        "ran": len(outcomes),
+        "cached": len(cached),
+        "affected": len(affected),
+        "passed": sum(outcome["passed"] for outcome in outcomes.values()),
+        "failed": failures,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def failure_summary(result):
+    status = "FAILED" if result["failed"] else "passed"
+    lines = [f"run_tests {status}: {result['passed']} tests passed, {len(result['failed'])} failed "
+             f"in {result['ran']} files; {result['cached']} files skipped as unchanged since passing "
+             f"({result['seconds']}s)"]
+    for nodeid, message in result["failed"][:MAX_REPORTED_FAILURES]:
+        lines.append(f"- {nodeid}: {message}" if message else f"- {nodeid}")
+    if len(result["failed"]) > MAX_REPORTED_FAILURES:
+        lines.append(f"- ... and {len(result['failed']) - MAX_REPORTED_FAILURES} more")
+    return "\n".join(lines)